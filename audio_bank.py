@@ -0,0 +1,118 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import pygame
+
+
+class AudioBank:
+    """
+    Loads question sounds lazily, per condition, instead of decoding every MP3 at startup.
+
+    Sound files are registered per condition and only decoded when that
+    condition is entered (or a sound is first requested). Decoded sounds are
+    kept in a least-recently-used cache bounded by their size in bytes.
+    The decoded PCM is also written to a cache directory on disk, keyed by the
+    hash of the MP3 and the mixer format, so later launches skip MP3 decoding
+    entirely.
+    """
+    def __init__(self, cache_dir='.sound_cache', max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir    # Directory for decoded PCM files
+        self.max_bytes = max_bytes    # Upper bound for decoded sounds kept in memory
+        self.conditions = {}          # condition -> {key: sound file path}
+        self._sounds = OrderedDict()  # sound file path -> (pygame.mixer.Sound, size in bytes), LRU order
+        self._bytes = 0               # Total size of the cached sounds
+        self.active_condition = None  # Condition whose sounds were loaded last
+
+        # Statistics
+        self.memory_hits = 0  # Sounds served from memory
+        self.disk_hits = 0    # Sounds loaded from decoded PCM on disk
+        self.decodes = 0      # MP3 files decoded
+
+    def register(self, condition, files):
+        """
+        Register the sound files of a condition without loading them.
+
+        Args:
+            condition: Condition identifier (e.g. 1 or 2)
+            files: Dictionary mapping keys to sound file paths
+        """
+        self.conditions[condition] = dict(files)
+
+    def keys(self, condition):
+        """Return the keys that have a sound in the given condition"""
+        return self.conditions.get(condition, {}).keys()
+
+    def activate(self, condition):
+        """Load all sounds of a condition so playback does not have to decode on demand"""
+        if condition == self.active_condition:
+            return
+        self.active_condition = condition
+        for path in self.conditions.get(condition, {}).values():
+            self._load(path)
+
+    def get(self, condition, key):
+        """
+        Return the pygame.mixer.Sound for a key in a condition,
+        or None if the key has no sound in that condition.
+        """
+        path = self.conditions.get(condition, {}).get(key)
+        if path is None:
+            return None
+        return self._load(path)
+
+    def _load(self, path):
+        """Return the sound for a file, from memory, the disk cache or by decoding it"""
+        if path in self._sounds:
+            self._sounds.move_to_end(path)
+            self.memory_hits += 1
+            return self._sounds[path][0]
+
+        cache_path = self._cache_path(path)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                raw = f.read()
+            sound = pygame.mixer.Sound(buffer=raw)
+            self.disk_hits += 1
+        else:
+            sound = pygame.mixer.Sound(path)
+            raw = sound.get_raw()
+            self._write_cache(cache_path, raw)
+            self.decodes += 1
+
+        self._sounds[path] = (sound, len(raw))
+        self._bytes += len(raw)
+        self._evict()
+        return sound
+
+    def _evict(self):
+        """Drop least recently used sounds until the memory bound is met (always keep the newest)"""
+        while self._bytes > self.max_bytes and len(self._sounds) > 1:
+            _, (_, size) = self._sounds.popitem(last=False)
+            self._bytes -= size
+
+    def _cache_path(self, path):
+        """Cache file name: hash of the sound file plus the mixer format the PCM was decoded for"""
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        name = f"{digest.hexdigest()}_{frequency}_{sample_format}_{channels}.pcm"
+        return os.path.join(self.cache_dir, name)
+
+    def _write_cache(self, cache_path, raw):
+        """Write decoded PCM atomically so an interrupted write never leaves a corrupt cache file"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            # The cache is only an optimisation - keep going without it
+            print(f"Could not write sound cache {cache_path}: {e}")
+
+    def stats(self):
+        """Return a one-line summary of cache usage"""
+        return (f"Audio: {len(self._sounds)} sounds in memory ({self._bytes / 1e6:.1f} MB), "
+                f"{self.decodes} decoded, {self.disk_hits} from disk cache, {self.memory_hits} from memory")
@@ -0,0 +1,142 @@
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pygame
+
+# One scheduled sound: the key and condition it belongs to, when it was
+# requested, when it was due, and when Sound.play() actually returned
+# (time.monotonic() seconds; onset is None until the sound has played)
+SoundTrigger = namedtuple('SoundTrigger', ['key', 'condition', 'requested', 'scheduled', 'onset'])
+
+# Mixer settings for low playback latency: 512 samples are about 12 ms at 44.1 kHz
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER = 512
+
+
+def init_mixer(frequency=MIXER_FREQUENCY, buffer=MIXER_BUFFER):
+    """
+    Ask for a small mixer buffer so a sound starts soon after Sound.play().
+    Must be called before pygame.init() / pygame.mixer.init().
+    """
+    pygame.mixer.pre_init(frequency, -16, 2, buffer)
+
+
+class AudioScheduler:
+    """
+    Plays sounds at a scheduled time.monotonic() time on a dedicated thread.
+
+    The render loop only calls schedule(); the scheduler thread sleeps until
+    `spin` seconds before the sound is due, busy-waits for the rest, plays it
+    and records the actual onset. Onsets therefore do not depend on the frame
+    time, and wall clock changes do not move them. For the last `lead`
+    seconds the interpreter's thread switch interval is shortened, so the
+    render loop hands over the GIL in time instead of after up to 5 ms.
+    The switch interval is process-wide; the value found at construction is
+    put back after every sound and by close().
+
+    Only one sound is pending at a time: scheduling another one replaces it,
+    as a new question replaces one that has not started yet. `on_onset` is
+    called with the SoundTrigger from the scheduler thread right after each
+    sound started.
+    """
+    def __init__(self, spin=0.0005, lead=0.02, switch_interval=0.0002, on_onset=None):
+        self.spin = spin          # Seconds before the due time to stop sleeping and busy-wait
+        self.lead = lead          # Seconds before the due time to shorten the switch interval
+        self.switch_interval = switch_interval
+        self.on_onset = on_onset
+        self.triggers = []        # SoundTriggers of the sounds played, in order
+        self._default_interval = sys.getswitchinterval()  # Restored whenever no sound is due
+
+        self._lock = threading.Condition()
+        self._pending = None      # (sound, SoundTrigger) waiting to be played
+        self._running = True
+        self._thread = threading.Thread(target=self._play_loop, name='AudioScheduler', daemon=True)
+        self._thread.start()
+
+        # Statistics
+        self.replaced = 0  # Pending sounds replaced before they were due
+
+    def schedule(self, sound, at, key=None, condition=None):
+        """
+        Play `sound` at time.monotonic() time `at`, replacing any sound still pending.
+
+        Returns:
+            The SoundTrigger (without onset) of the scheduled sound
+        """
+        trigger = SoundTrigger(key, condition, time.monotonic(), at, None)
+        with self._lock:
+            if self._pending is not None:
+                self.replaced += 1
+            self._pending = (sound, trigger)
+            self._lock.notify()
+        return trigger
+
+    def cancel(self):
+        """Drop the pending sound, if any"""
+        with self._lock:
+            self._pending = None
+            self._lock.notify()
+
+    @property
+    def pending(self):
+        """True while a sound is waiting to be played"""
+        return self._pending is not None
+
+    def _play_loop(self):
+        default_interval = self._default_interval
+        while True:
+            with self._lock:
+                while self._running:
+                    if self._pending is None:
+                        sys.setswitchinterval(default_interval)
+                        self._lock.wait()
+                        continue
+                    remaining = self._pending[1].scheduled - time.monotonic()
+                    if remaining <= self.spin:
+                        break
+                    if remaining > self.lead:
+                        self._lock.wait(remaining - self.lead)  # Woken early if the sound is replaced
+                    else:
+                        sys.setswitchinterval(self.switch_interval)
+                        self._lock.wait(remaining - self.spin)
+                if not self._running:
+                    sys.setswitchinterval(default_interval)
+                    return
+                sound, trigger = self._pending
+                self._pending = None
+
+            # Busy-wait the last moments; sleeping is only accurate to a millisecond or more
+            while time.monotonic() < trigger.scheduled:
+                pass
+            sound.play()
+            trigger = trigger._replace(onset=time.monotonic())
+            sys.setswitchinterval(default_interval)
+            self.triggers.append(trigger)
+            if self.on_onset is not None:
+                self.on_onset(trigger)
+
+    def close(self):
+        """Stop the scheduler thread and restore the switch interval; a pending sound is not played"""
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        self._thread.join(timeout=1.0)
+        sys.setswitchinterval(self._default_interval)
+
+    def onset_errors(self):
+        """Seconds from each sound's scheduled time to its onset"""
+        return np.array([trigger.onset - trigger.scheduled for trigger in self.triggers])
+
+    def stats(self):
+        """Return a one-line summary of the onset timing"""
+        errors_ms = self.onset_errors() * 1000.0
+        init = pygame.mixer.get_init()
+        buffer_ms = 1000.0 * MIXER_BUFFER / init[0] if init else 0.0
+        if len(errors_ms) == 0:
+            return f"Audio scheduler: no sounds played, {self.replaced} replaced"
+        return (f"Audio scheduler: {len(errors_ms)} sounds played, {self.replaced} replaced, onset error "
+                f"mean {errors_ms.mean():.2f} ms, max {errors_ms.max():.2f} ms "
+                f"(plus up to {buffer_ms:.0f} ms mixer buffer)")
@@ -0,0 +1,162 @@
+"""
+Detector backends for launcher.py.
+
+Every backend turns a BGR camera frame into a normalized look target: the
+(x, y) point in the camera image (0-1) the eyes should look at, or None if
+nothing was found. The modules a backend needs (OpenCV cascades, MediaPipe)
+are imported in its constructor, so choosing the Haar backend never loads
+MediaPipe.
+"""
+
+# Threshold gaze_imitation.EyeDisplay uses to turn a gaze direction into a discrete direction
+GAZE_THRESHOLD = 0.1
+
+
+class DetectorBackend:
+    """
+    Interface of a detector backend.
+
+    Subclasses implement locate(); stats() is optional.
+    """
+    name = None
+
+    def locate(self, frame):
+        """
+        Find the look target in a frame.
+
+        Args:
+            frame: BGR camera frame
+        Returns:
+            (x, y) in normalized image coordinates (0-1), or None if nothing was found
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Return a list of one-line statistics to print on exit"""
+        return []
+
+
+def box_center(box, frame_shape):
+    """Return the centre of an (x, y, w, h) box in normalized image coordinates"""
+    x, y, w, h = box
+    frame_height, frame_width = frame_shape[:2]
+    return ((x + w / 2) / frame_width, (y + h / 2) / frame_height)
+
+
+class CascadeFaceBackend(DetectorBackend):
+    """Face centre from an OpenCV cascade (haarcascade_face_tracker.EyeTracker)"""
+    name = 'haar'
+
+    def __init__(self, cascade='haar'):
+        import cv2
+        from haarcascade_face_tracker import EyeTracker
+        self.cv2 = cv2
+        self.tracker = EyeTracker(cascade=cascade)
+
+    def locate(self, frame):
+        gray = self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2GRAY)
+        face = self.tracker.track_face(gray)
+        return box_center(face, frame.shape) if face is not None else None
+
+    def stats(self):
+        return [self.tracker.face_detector.stats(), self.tracker.scheduler.stats()]
+
+
+class LbpFaceBackend(CascadeFaceBackend):
+    """Face centre from OpenCV's LBP frontal face cascade (see bench_cascades.py for how it compares to Haar)"""
+    name = 'lbp'
+
+    def __init__(self):
+        super().__init__('lbp')
+
+
+class MediaPipeNoseBackend(DetectorBackend):
+    """Nose tip from MediaPipe FaceMesh, followed with optical flow (face_tracker.EyeTracker)"""
+    name = 'nose'
+
+    def __init__(self):
+        from face_tracker import EyeTracker
+        self.tracker = EyeTracker()
+
+    def locate(self, frame):
+        nose_box = self.tracker.track_nose(frame)
+        return box_center(nose_box, frame.shape) if nose_box is not None else None
+
+    def stats(self):
+        return [self.tracker.scheduler.stats()]
+
+
+class MediaPipeIrisBackend(DetectorBackend):
+    """Mean iris position from MediaPipe FaceMesh (gaze__not_face_tracker.EyeTracker)"""
+    name = 'iris'
+
+    def __init__(self):
+        import cv2
+        from gaze__not_face_tracker import EyeTracker
+        self.cv2 = cv2
+        self.tracker = EyeTracker()
+
+    def locate(self, frame):
+        rgb = self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2RGB)
+        rgb.flags.writeable = False
+        results = self.tracker.face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        return self.tracker.get_gaze_position(results.multi_face_landmarks[0], frame.shape)
+
+
+class MediaPipeGazeBackend(DetectorBackend):
+    """
+    3D gaze from MediaPipe FaceMesh and the head pose (gaze_imitation.EyeTracker).
+
+    The eyes mirror the participant's gaze in discrete steps, as in
+    gaze_imitation: each direction whose averaged gaze exceeds GAZE_THRESHOLD
+    becomes a look target at the edge of the image.
+    """
+    name = 'gaze'
+
+    def __init__(self):
+        import cv2
+        from gaze_imitation import EyeTracker
+        self.cv2 = cv2
+        self.tracker = EyeTracker()
+
+    def locate(self, frame):
+        rgb = self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2RGB)
+        rgb.flags.writeable = False
+        results = self.tracker.face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            self.tracker.pose_solver.reset()
+            return None
+        left_gaze, right_gaze = self.tracker.get_gaze_direction(frame, results.multi_face_landmarks[0])
+        if left_gaze is None:
+            return None
+
+        # Mirror horizontally, keep vertical (see gaze_imitation.EyeDisplay.interpret_gaze)
+        gaze_x = -(left_gaze[0] + right_gaze[0]) / 2
+        gaze_y = (left_gaze[1] + right_gaze[1]) / 2
+        x_direction = (gaze_x > GAZE_THRESHOLD) - (gaze_x < -GAZE_THRESHOLD)
+        y_direction = (gaze_y > GAZE_THRESHOLD) - (gaze_y < -GAZE_THRESHOLD)
+
+        # A look target whose direction (as computed by EyeDisplay) is exactly (x_direction, y_direction)
+        return (0.5 - x_direction / 2, 0.5 + y_direction / 2)
+
+    def stats(self):
+        return [self.tracker.pose_solver.stats()]
+
+
+# Backend name -> class, in the order shown by the launcher
+BACKENDS = {backend.name: backend for backend in (
+    CascadeFaceBackend,
+    LbpFaceBackend,
+    MediaPipeNoseBackend,
+    MediaPipeIrisBackend,
+    MediaPipeGazeBackend,
+)}
+
+
+def create_backend(name):
+    """Create the backend with the given name, importing only the modules it needs"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{name}', choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,94 @@
+"""
+Compare the face cascades (speed and hit rate) on the same recorded clips.
+
+Every frame of every clip is converted to grayscale and scanned with
+detectMultiScale using the parameters of the trackers (scaleFactor 1.3,
+minNeighbors 5). With --roi the frames go through RoiFaceDetector instead,
+as in the trackers, which shows how much of the difference survives once
+the search window is narrowed.
+
+Usage:
+    python bench_cascades.py recordings/session1.mp4 recordings/frames/ [--cascades haar lbp] [--roi]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from capture import open_capture
+from tracking import CASCADES, RoiFaceDetector, load_cascade
+
+
+def load_gray_frames(source):
+    """Read all frames of a video file or image directory as grayscale"""
+    cap = open_capture(source)
+    frames = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    return frames
+
+
+def run_cascade(cascade, frames, roi=False):
+    """
+    Run a cascade over a list of grayscale frames.
+
+    Returns:
+        (per-frame durations in seconds, number of frames with at least one face)
+    """
+    detector = RoiFaceDetector(cascade, scale_factor=1.3, min_neighbors=5) if roi else None
+    durations = np.zeros(len(frames))
+    hits = 0
+    for i, gray in enumerate(frames):
+        start = time.perf_counter()
+        if detector is not None:
+            faces = detector.detect(gray)
+        else:
+            faces = cascade.detectMultiScale(gray, 1.3, 5)
+        durations[i] = time.perf_counter() - start
+        hits += len(faces) > 0
+    return durations, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare face cascades on recorded clips")
+    parser.add_argument('clips', nargs='+', help="Video files or directories of images")
+    parser.add_argument('--cascades', nargs='+', default=list(CASCADES),
+                        help="Cascade names from tracking.CASCADES or paths to XML files")
+    parser.add_argument('--roi', action='store_true', help="Search around the last face like the trackers do")
+    args = parser.parse_args()
+
+    clips = [(clip, load_gray_frames(clip)) for clip in args.clips]
+
+    print(f"{'cascade':<10}{'clip':<32}{'frames':>8}{'ms/frame':>10}{'p95 ms':>10}{'hit rate':>10}")
+    for name in args.cascades:
+        try:
+            cascade = load_cascade(name)
+        except FileNotFoundError as error:
+            print(f"{name:<10}skipped: {error}")
+            continue
+
+        all_durations = []
+        all_hits = 0
+        for clip, frames in clips:
+            if not frames:
+                print(f"{name[-9:]:<10}{clip[-31:]:<32}  no frames")
+                continue
+            durations, hits = run_cascade(cascade, frames, roi=args.roi)
+            all_durations.append(durations)
+            all_hits += hits
+            print(f"{name[-9:]:<10}{clip[-31:]:<32}{len(frames):>8}{durations.mean() * 1000:>10.2f}"
+                  f"{np.percentile(durations, 95) * 1000:>10.2f}{100.0 * hits / len(frames):>9.1f}%")
+
+        if len(all_durations) > 1:
+            durations = np.concatenate(all_durations)
+            print(f"{name[-9:]:<10}{'(all clips)':<32}{len(durations):>8}{durations.mean() * 1000:>10.2f}"
+                  f"{np.percentile(durations, 95) * 1000:>10.2f}{100.0 * all_hits / len(durations):>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Measure the round-trip latency of the local control channel against a running
+experiment, without camera, window or sound card.
+
+experiment_2 runs in real time on a synthetic moving face with a
+ControlServer on a Unix socket (or TCP with --address); a client thread sends
+a mix of commands while the render loop runs and records the time from
+sending each command to the reply that the main loop has run it. Pings are
+answered by the server thread alone, so they show the transport's share.
+
+Usage:
+    python bench_control.py [--commands 100] [--interval 0.05] [--address 127.0.0.1:8765] [--max-p95 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+# Run pygame without a window or sound card (replay sets this up on import)
+import replay  # noqa: F401
+from capture import FrameGrabber, SYNTHETIC_SOURCE
+from control_client import ControlClient
+from control_server import ControlServer
+
+# Commands sent in turn; the question keys schedule sounds, so this exercises the real actions
+COMMANDS = [
+    ('ping',),
+    ('question', 1),
+    ('gaze', 'left'),
+    ('question', 2),
+    ('gaze', 'face'),
+    ('condition', 1),
+    ('question', 3),
+    ('condition', 2),
+    ('record', 'stop'),
+    ('record', 'start'),
+]
+
+
+def send_commands(address, count, interval, results):
+    """Send `count` commands from COMMANDS, one every `interval` seconds"""
+    client = ControlClient(address)
+    stop = threading.Event()
+    try:
+        for i in range(count):
+            command = COMMANDS[i % len(COMMANDS)]
+            client.send(*command)
+            stop.wait(interval)
+    finally:
+        client.close()
+    results.append(client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure control channel round trips against experiment_2")
+    parser.add_argument('--commands', type=int, default=100, help="Number of commands to send")
+    parser.add_argument('--interval', type=float, default=0.05, help="Seconds between commands")
+    parser.add_argument('--address', help="Server address (default: a Unix socket in a temporary directory)")
+    parser.add_argument('--csv', help="Write the round-trip time of every command to this CSV file")
+    parser.add_argument('--max-p95', type=float, help="Exit with status 1 if the p95 round trip exceeds this (ms)")
+    args = parser.parse_args()
+
+    import cv2
+    import experiment_2
+
+    address = args.address or 'unix:' + os.path.join(tempfile.mkdtemp(), 'control.sock')
+    cap = FrameGrabber(SYNTHETIC_SOURCE, lossless=False)
+    cap.pace_fps = cap.cap.get(cv2.CAP_PROP_FPS) or 30.0
+    server = ControlServer(address)
+    system = experiment_2.EyeSystem(cap=cap, control_server=server)
+
+    results = []
+    sender = threading.Thread(target=send_commands, args=(address, args.commands, args.interval, results))
+    sender.start()
+    system.run()
+    sender.join()
+    if not results:
+        print("FAIL: the client did not finish")
+        sys.exit(1)
+
+    client = results[0]
+    rtt_ms = np.array(client.round_trips) * 1000.0
+    pings = np.array([command == 'ping' for command, _ in client.commands])
+    print(client.stats())
+    if pings.any() and not pings.all():
+        print(f"Ping (server thread only): mean {rtt_ms[pings].mean():.2f} ms; "
+              f"commands run by the main loop: mean {rtt_ms[~pings].mean():.2f} ms, "
+              f"p95 {np.percentile(rtt_ms[~pings], 95):.2f} ms")
+    if args.csv:
+        client.save(args.csv)
+        print(f"Round-trip times written to {args.csv}")
+
+    failed = [reply for reply in client.replies if not reply.get('ok')]
+    if failed:
+        print(f"FAIL: {len(failed)} commands failed, first: {failed[0].get('error')}")
+        sys.exit(1)
+    if args.max_p95 is not None and np.percentile(rtt_ms, 95) > args.max_p95:
+        print(f"FAIL: p95 round trip {np.percentile(rtt_ms, 95):.1f} ms exceeds {args.max_p95:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
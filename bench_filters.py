@@ -0,0 +1,174 @@
+"""
+Compare the lag and jitter of the old fixed-rate lerp (smooth_move) with the
+time-based PupilFilter, at several render loop rates.
+
+The pupil target track comes from a recorded clip (the face cascade is run
+over every frame, as in haarcascade_face_tracker.py) or, without a clip, from
+a synthetic face that holds still, sweeps back and forth and jumps, measured
+with detector noise. Either way the track is replayed offline: each camera
+frame becomes visible to the render loop `--latency` seconds after it was
+captured, and both filters are stepped once per loop iteration.
+
+Metrics (pixels on the display, one pupil, x axis):
+    lag ms     Delay that best aligns the pupil with the reference track
+    error px   RMS distance to the reference track at the same time
+    jitter px  RMS of the pupil's wobble around its own 150 ms moving average
+
+The reference is the true target for the synthetic face and the measured
+target (at its capture time) for a clip.
+
+Usage:
+    python bench_filters.py [recordings/session1.mp4] [--fps 30] [--latency 0.06] [--rates 30 60 144]
+"""
+import argparse
+
+import cv2
+import numpy as np
+
+from capture import open_capture
+from pupil_filter import PupilFilter
+from tracking import load_cascade
+
+MAX_PUPIL_OFFSET = 75   # Pixels, as in the trackers
+MOVEMENT_SPEED = 0.3    # The old smooth_move factor
+
+
+def synthetic_track(fps=30.0, noise=1.5, seed=0):
+    """
+    A face that holds still, sweeps left and right, holds, and jumps.
+
+    Returns:
+        (capture times, measured targets, true target as a function of time)
+    """
+    def truth(t):
+        t = np.asarray(t, dtype=float)
+        sweep = MAX_PUPIL_OFFSET * 0.8 * np.sin(2 * np.pi * 0.5 * (t - 2.0))
+        x = np.where(t < 2.0, 0.0, sweep)
+        x = np.where(t >= 6.0, 0.0, x)
+        return np.where(t >= 8.0, MAX_PUPIL_OFFSET * 0.6, x)  # Jump (face reacquired elsewhere)
+
+    times = np.arange(0.0, 10.0, 1.0 / fps)
+    rng = np.random.default_rng(seed)
+    return times, truth(times) + rng.normal(0.0, noise, len(times)), truth
+
+
+def clip_track(path, fps=30.0):
+    """
+    Run the face cascade over every frame of a clip.
+
+    Returns:
+        (capture times, measured targets, reference as a function of time)
+    """
+    cascade = load_cascade()
+    cap = open_capture(path)
+    times, targets = [], []
+    index = 0
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = cascade.detectMultiScale(gray, 1.3, 5)
+        if len(faces):
+            x, y, w, h = faces[0]
+            face_x = (x + w / 2) / gray.shape[1]
+            times.append(index / fps)
+            targets.append(-(face_x - 0.5) * 2 * MAX_PUPIL_OFFSET)
+        index += 1
+    cap.release()
+    times, targets = np.array(times), np.array(targets)
+    return times, targets, lambda t: np.interp(t, times, targets)
+
+
+def simulate(times, targets, rate, latency, make_filter):
+    """
+    Step a filter once per render loop iteration.
+
+    Args:
+        times, targets: Capture times and measured targets of the camera frames
+        rate: Render loop rate in Hz
+        latency: Seconds from capture until a frame's target reaches the loop
+        make_filter: Returns a function (target, capture time, now) -> pupil position
+    Returns:
+        (loop times, pupil positions)
+    """
+    step = make_filter()
+    loop_times = np.arange(times[0] + latency, times[-1] + latency, 1.0 / rate)
+    available = np.searchsorted(times + latency, loop_times, side='right') - 1  # Newest visible frame
+    positions = np.array([step(targets[i], times[i], now) for i, now in zip(available, loop_times)])
+    return loop_times, positions
+
+
+def lerp_filter():
+    position = [None]
+
+    def step(target, timestamp, now):
+        if position[0] is None:
+            position[0] = target
+        position[0] += (target - position[0]) * MOVEMENT_SPEED
+        return position[0]
+    return step
+
+
+def pupil_filter(latency=None, **kwargs):
+    """A PupilFilter, told the capture-to-display `latency` (seconds) if given"""
+    def make():
+        pupil = PupilFilter(**kwargs)
+        return lambda target, timestamp, now: pupil.update((target, 0.0), timestamp, now, latency)[0]
+    return make
+
+
+def metrics(loop_times, positions, reference, grid_rate=500.0):
+    """Return (lag ms, error px, jitter px) of a pupil track against a reference track"""
+    # What is on screen: each position is held until the next loop iteration
+    grid = np.arange(loop_times[0], loop_times[-1], 1.0 / grid_rate)
+    shown = positions[np.searchsorted(loop_times, grid, side='right') - 1]
+
+    delays = np.arange(0.0, 0.3, 0.002)
+    errors = [np.sqrt(np.mean((shown - reference(grid - delay)) ** 2)) for delay in delays]
+    lag = delays[int(np.argmin(errors))]
+
+    window = int(0.15 * grid_rate)
+    smooth = np.convolve(shown, np.ones(window) / window, mode='same')
+    inner = slice(window, -window)
+    jitter = np.sqrt(np.mean((shown - smooth)[inner] ** 2))
+    return 1000.0 * lag, errors[0], jitter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pupil filters on a replayed target track")
+    parser.add_argument('clip', nargs='?', help="Video file or image directory (synthetic face if omitted)")
+    parser.add_argument('--fps', type=float, default=30.0, help="Camera frame rate of the clip")
+    parser.add_argument('--latency', type=float, default=0.06, help="Capture-to-loop latency in seconds")
+    parser.add_argument('--rates', type=float, nargs='+', default=[30.0, 60.0, 144.0],
+                        help="Render loop rates to simulate")
+    args = parser.parse_args()
+
+    if args.clip:
+        times, targets, reference = clip_track(args.clip, args.fps)
+        if len(times) < 2:
+            print(f"No faces found in {args.clip}")
+            return
+        print(f"{args.clip}: {len(times)} frames with a face")
+    else:
+        times, targets, reference = synthetic_track(args.fps)
+        print(f"Synthetic face: {len(times)} frames")
+
+    filters = {
+        'lerp 0.3': lerp_filter,
+        'one euro': pupil_filter(max_lead=0.0),
+        'one euro + lead': pupil_filter(args.latency),
+        'steady': pupil_filter(args.latency, d_cutoff=0.3, max_lead=0.06),
+        'low lag': pupil_filter(args.latency, min_cutoff=1.5, beta=0.04, d_cutoff=1.0),
+    }
+    print(f"Latency {1000 * args.latency:.0f} ms")
+    print(f"{'filter':<18}{'loop Hz':>8}{'lag ms':>8}{'error px':>10}{'jitter px':>11}")
+    for name, make_filter in filters.items():
+        for rate in args.rates:
+            loop_times, positions = simulate(times, targets, rate, args.latency, make_filter)
+            lag, error, jitter = metrics(loop_times, positions, reference)
+            print(f"{name:<18}{rate:>8.0f}{lag:>8.0f}{error:>10.2f}{jitter:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
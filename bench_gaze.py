@@ -0,0 +1,175 @@
+"""
+Microbenchmark for the head pose / gaze math of gaze_imitation.py, run on
+synthetic landmarks (no camera or MediaPipe needed). The reference
+implementations and synthetic tracks here are also used by
+tests/test_head_pose.py, which checks that the results match.
+
+Usage:
+    python bench_gaze.py [--frames 2000]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from head_pose import HeadPoseSolver, MODEL_POINTS, EYE_BALL_CENTER_LEFT, EYE_BALL_CENTER_RIGHT, \
+    estimate_affine, gaze_directions
+
+FRAME_SHAPE = (480, 640, 3)
+
+
+def synthetic_pose_track(frames, seed=0):
+    """
+    Return a list of (rotation_vector, translation_vector) for a slowly moving
+    head, with some still stretches like a seated participant.
+    """
+    rng = np.random.default_rng(seed)
+    rotation = np.array([0.1, -0.2, 0.05])
+    translation = np.array([0.0, 0.0, 600.0])
+    poses = []
+    for i in range(frames):
+        if (i // 60) % 2 == 0:
+            # Moving stretch
+            rotation = rotation + rng.normal(0, 0.01, 3)
+            translation = translation + rng.normal(0, 1.0, 3)
+        poses.append((rotation.reshape(3, 1).copy(), translation.reshape(3, 1).copy()))
+    return poses
+
+
+def project(points, rotation_vector, translation_vector, shape=FRAME_SHAPE):
+    """Project 3D model points into the synthetic camera"""
+    camera_matrix, dist_coeffs = HeadPoseSolver().camera(shape)
+    projected, _ = cv2.projectPoints(points, rotation_vector, translation_vector, camera_matrix, dist_coeffs)
+    return projected.reshape(-1, 2)
+
+
+def reference_solve(image_points, shape=FRAME_SHAPE):
+    """Head pose exactly as gaze_imitation used to compute it: constants rebuilt, cold solve every frame"""
+    focal_length = shape[1]
+    center = (shape[1] / 2, shape[0] / 2)
+    camera_matrix = np.array(
+        [[focal_length, 0, center[0]],
+         [0, focal_length, center[1]],
+         [0, 0, 1]], dtype="double"
+    )
+    dist_coeffs = np.zeros((4, 1))
+    _, rotation_vector, translation_vector = cv2.solvePnP(MODEL_POINTS, image_points, camera_matrix,
+                                                          dist_coeffs, flags=cv2.SOLVEPNP_ITERATIVE)
+    return rotation_vector, translation_vector
+
+
+def time_pose(frames):
+    """Return (reference seconds, HeadPoseSolver seconds) for solving the pose of a synthetic head"""
+    image_points = [np.trunc(project(MODEL_POINTS, r, t)) for r, t in synthetic_pose_track(frames)]
+
+    start = time.perf_counter()
+    for points in image_points:
+        reference_solve(points)
+    reference_time = time.perf_counter() - start
+
+    solver = HeadPoseSolver()
+    start = time.perf_counter()
+    for points in image_points:
+        solver.solve(points, FRAME_SHAPE)
+    solver_time = time.perf_counter() - start
+    print(solver.stats())
+    return reference_time, solver_time
+
+
+def synthetic_gaze_track(frames, seed=1, face_deviation=0.0):
+    """
+    Return a list of (image_points, pupils) for synthetic frames: the pose
+    points of a moving head, and both pupils placed in front of their eyeball
+    centres with a slowly wandering gaze. With `face_deviation` (mm) the face
+    differs from the generic model by that much per landmark, as a real one does.
+    """
+    rng = np.random.default_rng(seed)
+    face = MODEL_POINTS + rng.normal(0, face_deviation, MODEL_POINTS.shape)
+    gaze = np.zeros(2)
+    track = []
+    for rotation_vector, translation_vector in synthetic_pose_track(frames):
+        gaze = np.clip(gaze + rng.normal(0, 0.5, 2), -6, 6)
+        pupils_3d = np.vstack([EYE_BALL_CENTER_LEFT.T, EYE_BALL_CENTER_RIGHT.T])
+        pupils_3d = pupils_3d + np.array([gaze[0], gaze[1], 12.0])
+        image_points = project(face, rotation_vector, translation_vector)
+        pupils = project(pupils_3d, rotation_vector, translation_vector)
+        track.append((image_points, pupils))
+    return track
+
+
+def reference_gaze_math(transformation, pupils, rotation_vector, translation_vector,
+                        camera_matrix, dist_coeffs, frame_width):
+    """
+    Gaze math exactly as gaze_imitation used to compute it: truncated pupils and
+    two single-point projections per eye on int-cast points.
+    """
+    result = []
+    for pupil, center in ((pupils[0], EYE_BALL_CENTER_LEFT), (pupils[1], EYE_BALL_CENTER_RIGHT)):
+        pupil = np.trunc(pupil)
+        pupil_world_cord = transformation @ np.array([[pupil[0], pupil[1], 0, 1]]).T
+        S = center + (pupil_world_cord - center) * 10
+        (eye_pupil2D, _) = cv2.projectPoints((int(S[0, 0]), int(S[1, 0]), int(S[2, 0])), rotation_vector,
+                                             translation_vector, camera_matrix, dist_coeffs)
+        (head_pose, _) = cv2.projectPoints((int(pupil_world_cord[0, 0]), int(pupil_world_cord[1, 0]), int(40)),
+                                           rotation_vector, translation_vector, camera_matrix, dist_coeffs)
+        gaze = pupil + (eye_pupil2D[0][0] - pupil) - (head_pose[0][0] - pupil)
+        result.append((gaze - pupil) / frame_width)
+    return np.array(result)
+
+
+def reference_gaze(image_points, pupils, shape=FRAME_SHAPE):
+    """The whole former get_gaze_direction: cold solvePnP, RANSAC affine fit, per-eye projections"""
+    image_points = np.trunc(image_points)
+    image_points1 = np.hstack([image_points, np.zeros((len(image_points), 1))])
+    rotation_vector, translation_vector = reference_solve(image_points, shape)
+    camera_matrix, dist_coeffs = HeadPoseSolver().camera(shape)
+    _, transformation, _ = cv2.estimateAffine3D(image_points1, MODEL_POINTS)
+    return reference_gaze_math(transformation, pupils, rotation_vector, translation_vector,
+                               camera_matrix, dist_coeffs, shape[1])
+
+
+def batched_gaze(solver, image_points, pupils, shape=FRAME_SHAPE, least_squares=False):
+    """The current get_gaze_direction: warm-started pose, affine fit, batched kernel"""
+    camera_matrix, dist_coeffs = solver.camera(shape)
+    rotation_vector, translation_vector = solver.solve(image_points, shape)
+    transformation = estimate_affine(image_points, least_squares)
+    return gaze_directions(transformation, pupils, rotation_vector, translation_vector,
+                           camera_matrix, dist_coeffs, shape[1])
+
+
+def time_gaze(frames, least_squares=False):
+    """Return (reference seconds, current seconds) for the whole gaze computation on synthetic frames"""
+    track = synthetic_gaze_track(frames)
+
+    start = time.perf_counter()
+    for image_points, pupils in track:
+        reference_gaze(image_points, pupils)
+    reference_time = time.perf_counter() - start
+
+    solver = HeadPoseSolver()
+    start = time.perf_counter()
+    for image_points, pupils in track:
+        batched_gaze(solver, image_points, pupils, least_squares=least_squares)
+    batched_time = time.perf_counter() - start
+    return reference_time, batched_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gaze math on synthetic landmarks")
+    parser.add_argument('--frames', type=int, default=2000)
+    args = parser.parse_args()
+
+    reference_time, solver_time = time_pose(args.frames)
+    print(f"Head pose: reference {reference_time / args.frames * 1e6:.1f} us/frame, "
+          f"HeadPoseSolver {solver_time / args.frames * 1e6:.1f} us/frame")
+
+    for least_squares in (False, True):
+        reference_time, batched_time = time_gaze(args.frames, least_squares)
+        print(f"Gaze: reference {reference_time / args.frames * 1e6:.1f} us/frame, "
+              f"current ({'least-squares' if least_squares else 'RANSAC'} affine fit) "
+              f"{batched_time / args.frames * 1e6:.1f} us/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from profiling import PROFILER
+
+# A single captured frame together with its sequence number, the monotonic
+# time at which cap.read() returned it, and the source's own time stamp of the
+# frame (CAP_PROP_POS_MSEC: media time for files, the driver's time stamp for
+# some cameras, 0.0 if the backend does not report one)
+CapturedFrame = namedtuple('CapturedFrame', ['seq', 'timestamp', 'frame', 'position_ms'], defaults=(0.0,))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Source name that opens a SyntheticFaceCapture instead of a camera or file
+SYNTHETIC_SOURCE = 'synthetic'
+
+# Longest a camera-driven loop waits in read_latest() for a new frame, so it
+# still handles input and moves the pupils when the camera stalls
+FRAME_WAIT = 0.05
+
+
+class ImageFolderCapture:
+    """
+    Minimal stand-in for cv2.VideoCapture that reads the images of a directory
+    in sorted file name order, so recorded frames can be replayed like a video.
+    """
+    def __init__(self, path, fps=30.0):
+        self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self.index = 0
+        self.opened = True
+
+    def read(self):
+        if self.index >= len(self.files):
+            return False, None
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        return frame is not None, frame
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.files)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+class SyntheticFaceCapture:
+    """
+    Stand-in for cv2.VideoCapture that renders a simple face (dark brows and
+    eyes on a light oval, which the Haar cascade detects) moving left and right
+    on a sine, so the tracking pipeline can run without a camera. The face's
+    centre in the most recent frame is kept in `face_center`.
+    """
+    def __init__(self, frames=300, fps=30.0, size=(640, 480), period=4.0):
+        self.frames = frames
+        self.fps = fps
+        self.period = period  # Seconds for one left-right-left sweep
+        self.index = 0
+        self.opened = True
+        self.face_center = None
+
+        width, height = size
+        self.background = np.full((height, width, 3), 90, dtype=np.uint8)
+        self.face = self._draw_face()
+
+    def _draw_face(self):
+        """Render the face once on a patch of background"""
+        face = np.full((200, 160, 3), 90, dtype=np.uint8)
+        cx, cy = 80, 100
+        cv2.ellipse(face, (cx, cy), (70, 95), 0, 0, 360, (150, 170, 200), -1)  # Skin
+        for dx in (-30, 30):
+            cv2.ellipse(face, (cx + dx, cy - 30), (20, 6), 0, 0, 360, (40, 40, 50), -1)  # Brow
+            cv2.ellipse(face, (cx + dx, cy - 12), (14, 8), 0, 0, 360, (60, 50, 50), -1)  # Eye
+        cv2.ellipse(face, (cx, cy + 20), (10, 18), 0, 0, 360, (120, 140, 170), -1)  # Nose
+        cv2.ellipse(face, (cx, cy + 52), (25, 8), 0, 0, 360, (70, 70, 120), -1)     # Mouth
+        return cv2.GaussianBlur(face, (0, 0), 2)
+
+    def read(self):
+        if self.index >= self.frames:
+            return False, None
+        height, width = self.background.shape[:2]
+        face_height, face_width = self.face.shape[:2]
+        t = self.index / self.fps
+        x = int((width - face_width) / 2 * (1 + 0.8 * math.sin(2 * math.pi * t / self.period)))
+        y = (height - face_height) // 2
+        frame = self.background.copy()
+        frame[y:y + face_height, x:x + face_width] = self.face
+        self.face_center = (x + face_width // 2, y + face_height // 2)
+        self.index += 1
+        return True, frame
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frames
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return max(self.index - 1, 0) * 1000.0 / self.fps
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+def open_capture(source):
+    """
+    Open a frame source.
+
+    Args:
+        source: Camera index, path to a video file, path to a directory of images,
+                or SYNTHETIC_SOURCE for a synthetic moving face
+    Returns:
+        A cv2.VideoCapture, ImageFolderCapture or SyntheticFaceCapture
+    """
+    if source == SYNTHETIC_SOURCE:
+        return SyntheticFaceCapture()
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageFolderCapture(source)
+    return cv2.VideoCapture(source)
+
+
+class FrameGrabber:
+    """
+    Runs cv2.VideoCapture on a background thread so the render loop never
+    waits on the camera.
+
+    Only the newest frame is kept ("latest frame wins"). If the capture thread
+    produces a new frame before the previous one was picked up, the old one is
+    dropped and counted, so consumers always work on the freshest image
+    instead of one that has been sitting in a buffer.
+
+    For replaying recordings, `lossless` makes the capture thread wait until
+    each frame has been read (every frame is processed, as fast as possible),
+    and `pace_fps` releases frames at the given rate like a live camera would.
+    """
+    def __init__(self, source=0, lossless=False, pace_fps=None):
+        self.cap = open_capture(source)
+        # Keep the driver-side queue as short as possible (not every backend supports this)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.live = isinstance(source, int)  # Live cameras are retried on failure, files end
+        self.lossless = lossless
+        self.pace_fps = pace_fps
+
+        self._lock = threading.Condition()
+        self._latest = None    # Most recent CapturedFrame
+        self._last_read = 0    # Sequence number handed out by the last read_latest()
+        self._seq = 0          # Sequence number of the most recent capture
+        self._running = False
+        self._thread = None
+        self.finished = False  # True once a recorded source has run out of frames
+
+        # Statistics
+        self.frames_captured = 0  # Frames successfully read from the camera
+        self.frames_dropped = 0   # Frames overwritten before anyone read them
+        self.read_failures = 0    # Failed cap.read() calls
+
+    def start(self):
+        """Start the background capture thread. Returns self for chaining."""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name='FrameGrabber', daemon=True)
+        self._thread.start()
+        return self
+
+    def _capture_loop(self):
+        """Read frames as fast as the camera delivers them and publish the newest one"""
+        start_time = time.monotonic()
+        while self._running:
+            if self.pace_fps:
+                # Release recorded frames at their original rate
+                due = start_time + self.frames_captured / self.pace_fps
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            start = PROFILER.start()
+            success, frame = self.cap.read()
+            PROFILER.stop('cap.read', start)
+            timestamp = time.monotonic()
+            position_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC) if success else 0.0
+            if not success:
+                self.read_failures += 1
+                if not self.live:
+                    # End of a recording; wake a reader waiting for the next frame
+                    with self._lock:
+                        self.finished = True
+                        self._lock.notify_all()
+                    break
+                time.sleep(0.005)  # Avoid spinning when the camera hiccups
+                continue
+
+            with self._lock:
+                if self.lossless:
+                    # Wait until the previous frame has been consumed
+                    while self._running and self._latest is not None and self._latest.seq > self._last_read:
+                        self._lock.wait(0.1)
+                    # The frame only becomes available now, so measure latency from here
+                    timestamp = time.monotonic()
+                self._seq += 1
+                if self._latest is not None and self._latest.seq > self._last_read:
+                    # Previous frame was never consumed
+                    self.frames_dropped += 1
+                self._latest = CapturedFrame(self._seq, timestamp, frame, position_ms)
+                self.frames_captured += 1
+                self._lock.notify_all()  # Wake a reader waiting in read_latest()
+
+    def read_latest(self, timeout=None):
+        """
+        Return the newest frame if it has not been returned before.
+
+        Without `timeout` this never blocks. With it, waits up to `timeout`
+        seconds for a new frame, so a loop driven by the camera sleeps instead
+        of spinning. Returns a CapturedFrame, or None when no new frame has
+        arrived since the previous call (or within the timeout).
+        """
+        with self._lock:
+            if timeout is not None:
+                self._lock.wait_for(lambda: self._has_new_frame() or self.finished or not self._running, timeout)
+            latest = self._latest
+            if latest is None or latest.seq == self._last_read:
+                return None
+            self._last_read = latest.seq
+            self._lock.notify()
+        return latest
+
+    def _has_new_frame(self):
+        return self._latest is not None and self._latest.seq > self._last_read
+
+    def read(self):
+        """
+        Drop-in replacement for cv2.VideoCapture.read() that does not block.
+        Returns (success, frame), where success is False if no new frame is available.
+        """
+        latest = self.read_latest()
+        if latest is None:
+            return False, None
+        return True, latest.frame
+
+    def isOpened(self):
+        """False once the source is closed, or a recording has ended and its last frame was read"""
+        if self.finished:
+            with self._lock:
+                return self._latest is not None and self._latest.seq > self._last_read
+        return self.cap.isOpened()
+
+    def release(self):
+        """Stop the capture thread and release the camera"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self.cap.release()
+
+    def stats(self):
+        """Return a one-line summary of capture statistics"""
+        return (f"Captured {self.frames_captured} frames, "
+                f"dropped {self.frames_dropped} stale frames, "
+                f"{self.read_failures} read failures")
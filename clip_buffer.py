@@ -0,0 +1,120 @@
+import csv
+import math
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class ClipBuffer:
+    """
+    Keeps the last few seconds of camera frames in RAM and writes short clips
+    around trigger events (e.g. the experimenter asking a question).
+
+    Frames are downscaled (INTER_AREA) straight into one ring of slots that is
+    allocated once as a single NumPy block, so memory stays the same however
+    long the session runs. trigger() marks an event; once `after` seconds of
+    frames have followed it, the frames from `before` seconds ahead of the
+    event to `after` seconds behind it are copied out of the ring and written
+    to a video file (plus a CSV of sequence numbers and capture timestamps) on
+    a background thread. At most `queue_size` clips wait for the writer; if it
+    falls further behind, clips are dropped and counted.
+    """
+    def __init__(self, out_dir='clips', fps=30.0, before=3.0, after=2.0, size=(320, 240),
+                 queue_size=4, fourcc='MJPG'):
+        self.out_dir = out_dir
+        self.fps = fps
+        self.before = before  # Seconds kept ahead of a trigger
+        self.after = after    # Seconds recorded behind a trigger
+        self.size = size      # Stored frame (width, height)
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+
+        # Room for the whole window plus a margin for cameras running faster than `fps`
+        self.capacity = int(math.ceil((before + after) * fps * 1.25)) + 1
+        width, height = size
+        self._frames = np.zeros((self.capacity, height, width, 3), dtype=np.uint8)
+        self._stamps = np.full(self.capacity, -np.inf)     # Capture timestamps, -inf for empty slots
+        self._seqs = np.zeros(self.capacity, dtype=np.int64)
+        self._count = 0                                    # Frames pushed so far
+
+        self._pending = []  # Triggers waiting for their `after` window: (label, trigger time)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_loop, name='ClipBuffer', daemon=True)
+        self._thread.start()
+
+        # Statistics
+        self.clips_written = 0
+        self.clips_dropped = 0
+
+    @property
+    def memory_bytes(self):
+        """Size of the frame ring in bytes"""
+        return self._frames.nbytes
+
+    def push(self, captured):
+        """Add a capture.CapturedFrame to the ring and cut any clips that are complete"""
+        slot = self._count % self.capacity
+        cv2.resize(captured.frame, self.size, dst=self._frames[slot], interpolation=cv2.INTER_AREA)
+        self._stamps[slot] = captured.timestamp
+        self._seqs[slot] = captured.seq
+        self._count += 1
+
+        while self._pending and captured.timestamp - self._pending[0][1] >= self.after:
+            self._cut(*self._pending.pop(0))
+
+    def trigger(self, label, timestamp=None):
+        """Mark an event; its clip is written once `after` seconds of frames have arrived"""
+        self._pending.append((label, time.monotonic() if timestamp is None else timestamp))
+
+    def _cut(self, label, trigger_time, block=False):
+        """
+        Copy the frames around a trigger out of the ring and queue them for writing.
+        With `block`, wait for room in the queue instead of dropping the clip.
+        """
+        in_window = np.flatnonzero((self._stamps >= trigger_time - self.before) &
+                                   (self._stamps <= trigger_time + self.after))
+        if len(in_window) == 0:
+            return
+        order = in_window[np.argsort(self._stamps[in_window])]
+        clip = (label, trigger_time, self._frames[order], self._seqs[order], self._stamps[order])
+        try:
+            self._queue.put(clip, block=block)
+        except queue.Full:
+            self.clips_dropped += 1
+
+    def _write_loop(self):
+        """Write queued clips to the output directory"""
+        while True:
+            clip = self._queue.get()
+            if clip is None:
+                break
+            label, trigger_time, frames, seqs, stamps = clip
+            os.makedirs(self.out_dir, exist_ok=True)
+            base = os.path.join(self.out_dir, f"{label}_{trigger_time:.3f}")
+            writer = cv2.VideoWriter(base + '.avi', self.fourcc, self.fps, self.size)
+            for frame in frames:
+                writer.write(frame)
+            writer.release()
+            with open(base + '.csv', 'w', newline='') as sidecar_file:
+                sidecar = csv.writer(sidecar_file)
+                sidecar.writerow(['frame', 'seq', 'capture_timestamp', 'seconds_from_trigger'])
+                for i, (seq, stamp) in enumerate(zip(seqs, stamps)):
+                    sidecar.writerow([i, seq, f"{stamp:.6f}", f"{stamp - trigger_time:.3f}"])
+            self.clips_written += 1
+
+    def close(self):
+        """Cut the clips of pending triggers with the frames available and finish writing"""
+        # The writer is still running, so waiting for room does not drop the last clips
+        for label, trigger_time in self._pending:
+            self._cut(label, trigger_time, block=True)
+        self._pending = []
+        self._queue.put(None)  # Blocking put, so the end marker is never dropped
+        self._thread.join()
+
+    def stats(self):
+        """Return a one-line summary of the clip buffer"""
+        return (f"Clips: {self.clips_written} written to {self.out_dir}, {self.clips_dropped} dropped, "
+                f"ring of {self.capacity} frames ({self.memory_bytes / 1e6:.1f} MB)")
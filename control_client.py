@@ -0,0 +1,126 @@
+"""
+Client for the local control channel (see control_server.py).
+
+Sends operator commands to a running experiment and records the round-trip
+time of each: from sending the command until the reply that the main loop
+has run it.
+
+Usage:
+    python control_client.py question 3
+    python control_client.py --address unix:/tmp/eyes.sock condition 2
+    python control_client.py --repeat 100 --interval 0.05 --csv rtt.csv gaze center
+"""
+import argparse
+import csv
+import json
+import socket
+import sys
+import time
+
+import numpy as np
+
+from control_server import DEFAULT_ADDRESS, parse_address
+
+
+class ControlClient:
+    """
+    Blocking client: one connection, one command at a time.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=2.0):
+        kind = parse_address(address)
+        if kind[0] == 'unix':
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(kind[1])
+        else:
+            self.sock = socket.create_connection(kind[1:], timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Do not hold back short commands
+        self._file = self.sock.makefile('rb')
+        self._next_id = 1
+
+        # Per command
+        self.commands = []     # (command, args)
+        self.replies = []      # Reply dictionaries
+        self.round_trips = []  # Seconds from sending to the reply
+
+    def send(self, command, *args):
+        """
+        Send a command and wait for its reply.
+
+        Returns:
+            The reply dictionary; 'ok' is False if the server rejected the command
+        """
+        request = {'id': self._next_id, 'command': command, 'args': list(args)}
+        self._next_id += 1
+        request['sent'] = time.monotonic()
+        self.sock.sendall((json.dumps(request) + '\n').encode())
+        line = self._file.readline()
+        rtt = time.monotonic() - request['sent']
+        if not line:
+            raise ConnectionError("Control server closed the connection")
+        reply = json.loads(line)
+        self.commands.append((command, args))
+        self.replies.append(reply)
+        self.round_trips.append(rtt)
+        return reply
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def stats(self):
+        """Return a one-line summary of the round-trip times"""
+        if not self.round_trips:
+            return "Control client: no commands sent"
+        rtt_ms = np.array(self.round_trips) * 1000.0
+        failed = sum(1 for reply in self.replies if not reply.get('ok'))
+        return (f"Control client: {len(rtt_ms)} commands, {failed} failed, round trip mean {rtt_ms.mean():.2f} ms, "
+                f"p50 {np.percentile(rtt_ms, 50):.2f} ms, p95 {np.percentile(rtt_ms, 95):.2f} ms, "
+                f"max {rtt_ms.max():.2f} ms")
+
+    def save(self, path):
+        """Write one CSV row per command"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'command', 'ok', 'handled', 'rtt_ms', 'queued_ms'])
+            for (command, args), reply, rtt in zip(self.commands, self.replies, self.round_trips):
+                queued = reply.get('dispatched', reply.get('received', 0.0)) - reply.get('received', 0.0)
+                writer.writerow([reply.get('id'), ' '.join([command] + [str(arg) for arg in args]),
+                                 int(bool(reply.get('ok'))), int(bool(reply.get('handled'))),
+                                 f"{rtt * 1000.0:.3f}", f"{queued * 1000.0:.3f}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a command to a running experiment")
+    parser.add_argument('command', choices=['question', 'condition', 'gaze', 'record', 'ping'])
+    parser.add_argument('args', nargs='*', help="Command argument, e.g. the question number")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS,
+                        help="'host:port' on the loopback interface or 'unix:/path/to/socket'")
+    parser.add_argument('--repeat', type=int, default=1, help="Send the command this many times")
+    parser.add_argument('--interval', type=float, default=0.0, help="Seconds between repeated commands")
+    parser.add_argument('--csv', help="Write the round-trip time of every command to this CSV file")
+    args = parser.parse_args()
+
+    client = ControlClient(args.address)
+    try:
+        for i in range(args.repeat):
+            reply = client.send(args.command, *args.args)
+            if not reply['ok']:
+                print(f"Error: {reply['error']}")
+                break
+            if args.repeat == 1:
+                print(f"OK, round trip {client.round_trips[-1] * 1000.0:.2f} ms")
+            if args.interval and i + 1 < args.repeat:
+                time.sleep(args.interval)
+    finally:
+        client.close()
+    print(client.stats())
+    if args.csv:
+        client.save(args.csv)
+        print(f"Round-trip times written to {args.csv}")
+    if any(not reply.get('ok') for reply in client.replies):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Local control channel for the experimenter: commands sent from another
+process (see control_client.py) are injected into the running program's
+pygame event queue as if a key had been pressed.
+
+The server runs an asyncio loop on a background thread and listens on a
+Unix socket or a loopback TCP port only. Each command is one JSON line:
+
+    {"id": 1, "command": "question", "args": [3], "sent": 12345.678}
+
+`sent` is the client's time.monotonic() (the same clock on one machine).
+The reply is sent once the main loop has run the action:
+
+    {"id": 1, "ok": true, "handled": true, "received": ..., "dispatched": ...}
+
+A command the running program has no action for (e.g. 'gaze' in
+experiment_1) is answered with "ok": false and an error, not ignored.
+
+Commands:
+    question N            Ask question N (as number key N)
+    condition 1|2         Switch condition (as 'o' / 't')
+    gaze left|right|center|face
+                          Manual gaze direction, or follow the face again (as the arrow keys)
+    record start|stop     Start or pause the session recording
+    ping                  Answered by the server thread without touching the event queue
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pygame
+
+from key_map import CONTROL_EVENT
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+# Only these hosts are accepted for TCP, so the channel cannot be reached from the network
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+CONDITION_KEYS = {1: pygame.K_o, 2: pygame.K_t}
+GAZE_KEYS = {
+    'left': pygame.K_LEFT,
+    'right': pygame.K_RIGHT,
+    'center': pygame.K_UP,
+    'face': pygame.K_DOWN,
+}
+RECORD_ACTIONS = {'start': 'record_start', 'stop': 'record_stop'}
+
+
+def parse_address(address):
+    """
+    Parse a control channel address.
+
+    Args:
+        address: 'unix:/path/to/socket', 'host:port' or 'port' (on 127.0.0.1)
+    Returns:
+        ('unix', path) or ('tcp', host, port)
+    """
+    if address.startswith('unix:'):
+        return ('unix', address[len('unix:'):])
+    host, _, port = address.rpartition(':')
+    host = host.strip('[]') or '127.0.0.1'
+    if host not in LOOPBACK_HOSTS:
+        raise ValueError(f"Control channel must listen on a loopback address, not '{host}'")
+    return ('tcp', host, int(port))
+
+
+def command_key(command, args):
+    """
+    Translate a command into the key code or action name it dispatches.
+
+    Returns:
+        The key for KeyMap.dispatch(), or None for 'ping'
+    Raises:
+        ValueError for unknown commands or arguments
+    """
+    if command == 'ping':
+        return None
+    if len(args) != 1:
+        raise ValueError(f"'{command}' takes one argument")
+    arg = args[0]
+    if command == 'question':
+        number = int(arg)
+        if not 1 <= number <= 9:
+            raise ValueError(f"Question must be 1-9, not {number}")
+        return pygame.K_0 + number
+    if command == 'condition' and int(arg) in CONDITION_KEYS:
+        return CONDITION_KEYS[int(arg)]
+    if command == 'gaze' and arg in GAZE_KEYS:
+        return GAZE_KEYS[arg]
+    if command == 'record' and arg in RECORD_ACTIONS:
+        return RECORD_ACTIONS[arg]
+    raise ValueError(f"Unknown command '{command} {arg}'")
+
+
+class ControlServer:
+    """
+    Accepts operator commands on a local socket and posts them as
+    key_map.CONTROL_EVENTs, so they are dispatched by the main loop's KeyMap
+    like key presses.
+
+    A command is stamped with time.monotonic() when it arrives; that time
+    stamp is passed to the action, so a slow render loop does not delay
+    sounds scheduled from it. The reply waits until the action ran (at most
+    `timeout` seconds) and carries the dispatch time, so the client's round
+    trip includes the time the command spent in the event queue.
+
+    If `wake` is set (e.g. to frame_clock.LoopGovernor.wake.set), it is
+    called after each command was posted, so the main loop can dispatch it
+    during its frame sleep instead of at the start of the next frame.
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=1.0):
+        self.address = parse_address(address)
+        self.timeout = timeout  # Seconds to wait for the main loop to run a command
+        self.wake = None        # Optional callable that wakes the main loop
+
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+        # Per dispatched command (time.monotonic() seconds)
+        self.sent_times = []       # Client's send time
+        self.received_times = []   # Line read by the server
+        self.dispatch_times = []   # Action run by the main loop
+
+        # Statistics
+        self.clients = 0   # Connections accepted
+        self.rejected = 0  # Malformed, unknown or unsupported commands
+        self.timeouts = 0  # Commands the main loop did not run in time
+
+    def start(self):
+        """Start listening on the server thread. Returns self for chaining."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._serve, name='ControlServer', daemon=True)
+            self._thread.start()
+            self._ready.wait()
+            if self._error is not None:
+                raise self._error
+        return self
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            if self.address[0] == 'unix':
+                if os.path.exists(self.address[1]):
+                    os.unlink(self.address[1])  # Left over from an earlier session
+                start = asyncio.start_unix_server(self._handle_client, path=self.address[1])
+            else:
+                start = asyncio.start_server(self._handle_client, host=self.address[1], port=self.address[2])
+            self._server = self._loop.run_until_complete(start)
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+
+        # Stopped by close(): drop the open connections
+        self._server.close()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    async def _handle_client(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self._execute(line, time.monotonic())
+                writer.write((json.dumps(reply) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _execute(self, line, received):
+        """Run one command line and return the reply"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            key = command_key(request['command'], request.get('args', []))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.rejected += 1
+            return {'id': request_id, 'ok': False, 'error': f"Bad command: {e}"}
+        if key is None:
+            return {'id': request_id, 'ok': True, 'received': received}
+
+        # Resolved from the main thread once the KeyMap ran the action
+        done = self._loop.create_future()
+        def ack(dispatched, handled):
+            try:
+                self._loop.call_soon_threadsafe(_resolve, done, (dispatched, handled))
+            except RuntimeError:
+                pass  # Server closed while the command was queued
+
+        if not pygame.event.post(pygame.event.Event(CONTROL_EVENT, key=key, timestamp=received, ack=ack)):
+            return {'id': request_id, 'ok': False, 'error': "Event queue is full"}
+        if self.wake is not None:
+            self.wake()
+        try:
+            dispatched, handled = await asyncio.wait_for(done, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return {'id': request_id, 'ok': False, 'error': f"Not run within {self.timeout:.1f} s"}
+        if not handled:
+            self.rejected += 1
+            command = ' '.join(str(part) for part in [request['command']] + list(request.get('args', [])))
+            return {'id': request_id, 'ok': False, 'handled': False,
+                    'error': f"'{command}' is not supported by this program"}
+
+        self.sent_times.append(float(request.get('sent', received)))
+        self.received_times.append(received)
+        self.dispatch_times.append(dispatched)
+        return {'id': request_id, 'ok': True, 'handled': handled, 'received': received, 'dispatched': dispatched}
+
+    def close(self):
+        """Stop listening and close all connections"""
+        if self._thread is None:
+            return
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=2.0)
+        self._thread = None
+        if self.address[0] == 'unix' and os.path.exists(self.address[1]):
+            os.unlink(self.address[1])
+
+    def stats(self):
+        """Return a one-line summary of the commands and their queueing delay"""
+        address = ':'.join(str(part) for part in self.address[1:])
+        if not self.dispatch_times:
+            return (f"Control server {address}: no commands run, {self.clients} clients, "
+                    f"{self.rejected} rejected, {self.timeouts} timed out")
+        queued_ms = (np.array(self.dispatch_times) - np.array(self.received_times)) * 1000.0
+        sent_ms = (np.array(self.dispatch_times) - np.array(self.sent_times)) * 1000.0
+        return (f"Control server {address}: {len(queued_ms)} commands from {self.clients} clients, "
+                f"{self.rejected} rejected, {self.timeouts} timed out; received to run mean {queued_ms.mean():.1f} ms, "
+                f"p95 {np.percentile(queued_ms, 95):.1f} ms; sent to run mean {sent_ms.mean():.1f} ms")
+
+
+def _resolve(future, result):
+    """Complete a command's future, unless it already timed out"""
+    if not future.done():
+        future.set_result(result)
@@ -0,0 +1,144 @@
+"""
+Append-only binary event log for experiment sessions.
+
+Every event is one fixed-size record of EVENT_DTYPE. The hot loop only
+appends a tuple to an in-memory queue (about a microsecond); a background
+thread converts the queued tuples to records and appends them to the file.
+read_log() memory-maps a log as a NumPy structured array.
+"""
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Event kinds
+EVENT_FRAME = 1      # Rendered frame: face direction and pupil positions
+EVENT_KEY = 2        # Key press (question key 1-9)
+EVENT_CONDITION = 3  # Switch to another condition
+EVENT_SOUND = 4      # Sound started playing
+
+EVENT_DTYPE = np.dtype([
+    ('time', '<f8'),       # time.monotonic() of the event
+    ('kind', 'u1'),        # One of the EVENT_* kinds
+    ('condition', 'u1'),   # Active condition
+    ('key', '<i2'),        # pygame key code for key and sound events, -1 otherwise
+    ('seq', '<i4'),        # Sequence number of the camera frame processed this frame, -1 if none
+    ('face_x', '<f4'),     # Face (or gaze) direction, NaN if no face
+    ('face_y', '<f4'),
+    ('left_x', '<f4'),     # Pupil positions on the display
+    ('left_y', '<f4'),
+    ('right_x', '<f4'),
+    ('right_y', '<f4'),
+])
+
+# File header: magic, format version, record size
+_MAGIC = b'EYELOG'
+_HEADER = struct.Struct('<6sHI')
+HEADER_SIZE = 16
+
+NAN = float('nan')
+
+
+class EventLog:
+    """
+    Writes session events to an append-only binary file on a background thread.
+
+    The logging methods only build a tuple and append it to a deque, so they
+    cost microseconds and never touch the disk; the writer thread flushes the
+    queued events every `flush_interval` seconds.
+
+    Each log file holds exactly one session (time stamps of different runs are
+    on unrelated monotonic clocks), so an existing file is never reused.
+    """
+    def __init__(self, path, flush_interval=0.25):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = deque()  # Event tuples not yet written (deque appends are thread-safe)
+        self._lock = threading.Lock()  # Counts events logged from the main loop and the audio scheduler thread
+        self._stop = threading.Event()
+
+        try:
+            self._file = open(path, 'xb')
+        except FileExistsError:
+            raise FileExistsError(f"Event log {path} already exists; use a new file for every session") from None
+        header = _HEADER.pack(_MAGIC, 1, EVENT_DTYPE.itemsize)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self._file.flush()
+
+        self._thread = threading.Thread(target=self._write_loop, name='EventLog', daemon=True)
+        self._thread.start()
+
+        # Statistics
+        self.events_logged = 0
+        self.events_written = 0
+
+    def frame(self, condition, seq, face_direction, left_pupil, right_pupil):
+        """Log a rendered frame"""
+        face_x, face_y = face_direction if face_direction is not None else (NAN, NAN)
+        self._append((time.monotonic(), EVENT_FRAME, condition, -1, seq, face_x, face_y,
+                      left_pupil[0], left_pupil[1], right_pupil[0], right_pupil[1]))
+
+    def event(self, kind, condition, key=-1, timestamp=None):
+        """Log a key press, condition switch or sound onset (at `timestamp` if given, otherwise now)"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self._append((timestamp, kind, condition, key, -1, NAN, NAN, NAN, NAN, NAN, NAN))
+
+    def _append(self, record):
+        """Queue one event tuple for the writer thread"""
+        with self._lock:
+            self._pending.append(record)
+            self.events_logged += 1
+
+    def _flush(self):
+        """Write all queued events to the file"""
+        count = len(self._pending)
+        if count == 0:
+            return
+        batch = [self._pending.popleft() for _ in range(count)]
+        np.array(batch, dtype=EVENT_DTYPE).tofile(self._file)
+        self._file.flush()
+        self.events_written += count
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def close(self):
+        """Write the remaining events and close the file"""
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+
+    def stats(self):
+        """Return a one-line summary of the log"""
+        return f"Event log {self.path}: {self.events_written} of {self.events_logged} events written"
+
+
+def read_log(path):
+    """
+    Memory-map an event log.
+
+    Returns:
+        A read-only structured array of EVENT_DTYPE records (a partial record
+        at the end of the file, e.g. after a crash, is ignored)
+    Raises:
+        ValueError: If the file is not an event log of this format
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{path} is not an event log (file too short)")
+    magic, version, record_size = _HEADER.unpack_from(header)
+    if magic != _MAGIC or record_size != EVENT_DTYPE.itemsize:
+        raise ValueError(f"{path} is not an event log of this format "
+                         f"(version {version}, {record_size} byte records)")
+
+    count = (os.path.getsize(path) - HEADER_SIZE) // EVENT_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
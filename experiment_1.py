@@ -1,7 +1,22 @@
+import argparse
 import cv2
 import pygame
 import time
 import math
+from capture import FrameGrabber
+from tracking import RoiFaceDetector, DetectionScheduler, MotionGate, load_cascade
+from renderer import EyeRenderer
+from frame_clock import LoopGovernor
+from pupil_filter import PupilFilter
+from audio_bank import AudioBank
+from audio_scheduler import AudioScheduler, init_mixer
+from key_map import KeyMap
+from control_server import ControlServer, DEFAULT_ADDRESS
+from session_recorder import SessionRecorder, DROP_POLICIES
+from clip_buffer import ClipBuffer
+from latency import LatencyLog
+from event_log import EventLog, EVENT_KEY, EVENT_CONDITION, EVENT_SOUND
+from profiling import PROFILER
 
 class EyeSystem:
     """
@@ -13,19 +28,41 @@ class EyeSystem:
     
     The system plays different audio questions depending on the active mode.
     """
-    def __init__(self, width=800, height=480):
+    def __init__(self, width=800, height=480, render_fps=60, detect_fps=30, cap=None, cascade='haar',
+                 session_recorder=None, clip_buffer=None, event_log=None, latency_log=None,
+                 control_server=None):
         # Initialize core systems
+        init_mixer()                    # Small mixer buffer for low sound latency; before pygame.init()
         pygame.init()
         pygame.mixer.init()             # Required for sound playback
-        self.cap = cv2.VideoCapture(0)  # Initialize webcam capture
+        # Webcam capture on a background thread (or a recording passed in for replay)
+        self.cap = (cap if cap is not None else FrameGrabber(0)).start()
+        # Optional SessionRecorder that writes the camera feed to a video file off the render loop
+        self.session_recorder = session_recorder.start() if session_recorder is not None else None
+        # Optional ClipBuffer that saves the footage around each question (keys 1-9)
+        self.clip_buffer = clip_buffer
+        # Optional EventLog for frames, key presses, condition switches and sound onsets
+        self.event_log = event_log
+        # Capture-to-photon latency of every camera frame, closed by the renderer's display updates
+        self.latency = latency_log if latency_log is not None else LatencyLog()
+        # Optional ControlServer whose commands are dispatched like key presses (see handle_input)
+        self.control_server = control_server
+        self.recording = True           # Frames go to the session recording (paused by 'record stop')
         
         # Screen setup - optimized for 800x480 display
         self.width = width
         self.height = height
         self.screen = pygame.display.set_mode((width, height))
         
+        # Pace the main loop; detection runs at its own, lower rate
+        self.loop = LoopGovernor(render_fps=render_fps, detect_fps=detect_fps)
+        
         # Load face detection classifier for tracking mode
-        self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+        # ('haar', 'lbp' for the LBP cascade, or a path to a cascade XML file)
+        self.face_cascade = load_cascade(cascade)
+        self.face_detector = RoiFaceDetector(self.face_cascade, scale_factor=1.3, min_neighbors=5)
+        self.scheduler = DetectionScheduler()  # Detect every few frames, optical flow in between
+        self.motion_gate = MotionGate()        # Keep the last face box while the participant sits still
         
         # Eye appearance parameters
         self.eye_radius = 140       # Size of the white part of the eye
@@ -38,9 +75,17 @@ class EyeSystem:
         self.left_pupil_pos = list(self.left_eye_pos)    # Current position of left pupil
         self.right_pupil_pos = list(self.right_eye_pos)  # Current position of right pupil
         
+        # Pre-render the background and scleras once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        self.renderer.latency = self.latency
+        
         # Mode settings
         self.current_condition = 1  # Start with condition 1 (preset positions)
-        self.movement_speed = 0.3   # Speed of pupil movement (0-1)
+        self.face_direction = None  # Last detected face direction (x, y), None if no face
+        self.face_timestamp = None  # Capture time of the frame the face direction was detected in
+        self.left_filter = PupilFilter()   # Time-based smoothing of the pupil targets (see pupil_filter.py)
+        self.right_filter = PupilFilter()
         
         # Define preset positions for condition 1
         # Each position is relative to the left eye center
@@ -56,40 +101,57 @@ class EyeSystem:
             pygame.K_9: (self.left_eye_pos[0] + 0, self.left_eye_pos[1] + 0),     # Center
         }
         
-        # Load sound files for both conditions
+        # Register sound files for both conditions; each set is only decoded when its condition is entered
+        self.audio = AudioBank()
+        
         # Condition 1: Preset position sounds
-        self.sounds_preset = {
-            pygame.K_1: pygame.mixer.Sound('sounds_preset/Best show watched.mp3'),
-            pygame.K_2: pygame.mixer.Sound('sounds_preset/Favorite fruit.mp3'),
-            pygame.K_3: pygame.mixer.Sound('sounds_preset/Coffee tea or neither.mp3'),
-            pygame.K_4: pygame.mixer.Sound('sounds_preset/Early bird or night owl.mp3'),
-            pygame.K_5: pygame.mixer.Sound('sounds_preset/Favorite emojis.mp3'),
-            pygame.K_6: pygame.mixer.Sound('sounds_preset/Breakfast question.mp3'),
-            pygame.K_7: pygame.mixer.Sound('sounds_preset/Weekend activity.mp3'),
-            pygame.K_8: pygame.mixer.Sound('sounds_preset/New skill.mp3'),
-            pygame.K_9: pygame.mixer.Sound('sounds_preset/Favorite way to relax.mp3'),
-        }
+        self.audio.register(1, {
+            pygame.K_1: 'sounds_preset/Best show watched.mp3',
+            pygame.K_2: 'sounds_preset/Favorite fruit.mp3',
+            pygame.K_3: 'sounds_preset/Coffee tea or neither.mp3',
+            pygame.K_4: 'sounds_preset/Early bird or night owl.mp3',
+            pygame.K_5: 'sounds_preset/Favorite emojis.mp3',
+            pygame.K_6: 'sounds_preset/Breakfast question.mp3',
+            pygame.K_7: 'sounds_preset/Weekend activity.mp3',
+            pygame.K_8: 'sounds_preset/New skill.mp3',
+            pygame.K_9: 'sounds_preset/Favorite way to relax.mp3',
+        })
         
         # Condition 2: Face tracking sounds
-        self.sounds_tracker = {
-            pygame.K_1: pygame.mixer.Sound('sounds_tracker/Book recommendation.mp3'),
-            pygame.K_2: pygame.mixer.Sound('sounds_tracker/Excited for christmas.mp3'),
-            pygame.K_3: pygame.mixer.Sound('sounds_tracker/Family person.mp3'),
-            pygame.K_4: pygame.mixer.Sound('sounds_tracker/Green or red apples.mp3'),
-            pygame.K_5: pygame.mixer.Sound('sounds_tracker/Marathon.mp3'),
-            pygame.K_6: pygame.mixer.Sound('sounds_tracker/Right or left handed.mp3'),
-            pygame.K_7: pygame.mixer.Sound('sounds_tracker/Theme parks.mp3'),
-            pygame.K_8: pygame.mixer.Sound('sounds_tracker/Wake up.mp3'),
-            pygame.K_9: pygame.mixer.Sound('sounds_tracker/Winter or summer.mp3'),
-        }
+        self.audio.register(2, {
+            pygame.K_1: 'sounds_tracker/Book recommendation.mp3',
+            pygame.K_2: 'sounds_tracker/Excited for christmas.mp3',
+            pygame.K_3: 'sounds_tracker/Family person.mp3',
+            pygame.K_4: 'sounds_tracker/Green or red apples.mp3',
+            pygame.K_5: 'sounds_tracker/Marathon.mp3',
+            pygame.K_6: 'sounds_tracker/Right or left handed.mp3',
+            pygame.K_7: 'sounds_tracker/Theme parks.mp3',
+            pygame.K_8: 'sounds_tracker/Wake up.mp3',
+            pygame.K_9: 'sounds_tracker/Winter or summer.mp3',
+        })
+        
+        self.audio.activate(self.current_condition)
         
         # Timing control variables
-        self.move_delay = 0.5                     # Delay before movement starts
         self.sound_delay = 1.5                    # Delay before sound plays after movement
-        self.last_move_time = 0                   # Timestamp of last movement
         self.last_interaction_time = time.time()  # Used for idle animation
-        self.ready_for_sound = False              # Flag indicating sound can be played
-        self.selected_key = None                  # Currently selected sound key
+        
+        # Plays each question sound_delay after its key press, on its own thread
+        self.sound_scheduler = AudioScheduler(on_onset=self.sound_started)
+        
+        # Keyboard actions, each run once per key press (see handle_input)
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        self.keys.bind(pygame.K_o, self.switch_condition, 1)           # 'O' for condition one
+        self.keys.bind(pygame.K_t, self.switch_condition, 2)           # 'T' for condition two
+        for k in range(pygame.K_1, pygame.K_9 + 1):
+            self.keys.bind(k, self.ask_question, k)
+        self.keys.bind('record_start', self.set_recording, True)        # Control channel only
+        self.keys.bind('record_stop', self.set_recording, False)
+        if self.control_server is not None:
+            self.control_server.wake = self.loop.wake.set  # Commands are dispatched during the frame sleep
+            self.control_server.start()
         
         # Idle animation settings (used in condition 1)
         self.IDLE_DELAY = 5.0    # Time before idle animation starts (seconds)
@@ -107,89 +169,116 @@ class EyeSystem:
         offset_y = self.IDLE_RADIUS * math.sin(angle)
         return offset_x, offset_y
 
-    def smooth_move(self, current_pos, target_pos):
-        """
-        Smoothly interpolate between current and target positions.
-        Creates more natural-looking eye movement.
-        
-        Args:
-            current_pos: Current position [x, y]
-            target_pos: Target position [x, y]
-        Returns:
-            New position [x, y] part way between current and target
-        """
-        return [current_pos[0] + (target_pos[0] - current_pos[0]) * self.movement_speed,
-                current_pos[1] + (target_pos[1] - current_pos[1]) * self.movement_speed]
-
     def handle_input(self):
         """
-        Process keyboard input for mode switching and sound triggers.
+        Process the queued keyboard and window events. Every key press runs its
+        action from self.keys exactly once:
         - 'O' switches to condition 1 (preset positions)
         - 'T' switches to condition 2 (face tracking)
         - Numbers 1-9 trigger sounds and movements
+        Returns False once the program should quit.
         """
-        current_time = time.time()
-        keys = pygame.key.get_pressed()
+        return self.keys.handle()
+
+    def switch_condition(self, condition, timestamp):
+        """Switch to another condition (pressing the key of the active one does nothing)"""
+        if condition == self.current_condition:
+            return
+        self.current_condition = condition
+        self.audio.activate(condition)
         
-        # Mode switching logic
-        if keys[pygame.K_o]:    # Switch to condition 1 (preset positions)
-            self.current_condition = 1
-            print("Switched to Condition 1: Preset Positions")
-        elif keys[pygame.K_t]:  # Switch to condition 2 (face tracking)
-            self.current_condition = 2
-            print("Switched to Condition 2: Face Tracking")
+        # Forget the face seen before the switch and restart the filters where the pupils are now,
+        # so the first face position afterwards is smoothed instead of jumped to
+        self.face_direction = None
+        self.left_filter.reset(self.left_pupil_pos)
+        self.right_filter.reset(self.right_pupil_pos)
+        if self.event_log is not None:
+            self.event_log.event(EVENT_CONDITION, condition, timestamp=timestamp)
+        print(f"Switched to Condition {condition}: {'Preset Positions' if condition == 1 else 'Face Tracking'}")
+
+    def ask_question(self, key, timestamp):
+        """
+        Number key: play the question's sound sound_delay after the key press,
+        save the camera footage around it, and in preset mode move the eyes.
+        """
+        sound = self.audio.get(self.current_condition, key)
+        if sound is not None:
+            self.sound_scheduler.schedule(sound, timestamp + self.sound_delay, key, self.current_condition)
+        if self.event_log is not None:
+            self.event_log.event(EVENT_KEY, self.current_condition, key, timestamp)
         
-        # Handle number key presses for sounds and movement
-        for k in range(pygame.K_1, pygame.K_9 + 1):
-            if keys[k] and current_time - self.last_move_time > self.move_delay:
-                self.last_move_time = current_time
-                self.ready_for_sound = True
-                self.selected_key = k
-                self.last_interaction_time = current_time
-                
-                # Update eye positions in preset mode
-                if self.current_condition == 1:
-                    new_pos = self.preset_positions[k]
-                    self.left_pupil_pos = list(new_pos)
-                    self.right_pupil_pos = [new_pos[0] + 375, new_pos[1]]  # Offset for right eye
-                break
+        # Save the camera footage around this question
+        if self.clip_buffer is not None:
+            self.clip_buffer.trigger(f"condition{self.current_condition}_question{key - pygame.K_0}", timestamp)
+        self.last_interaction_time = time.time()
         
-        # Handle sound playback after appropriate delay
-        if self.ready_for_sound and current_time - self.last_move_time > self.sound_delay:
-            sounds = self.sounds_preset if self.current_condition == 1 else self.sounds_tracker
-            if self.selected_key in sounds:
-                sounds[self.selected_key].play()
-            self.ready_for_sound = False
+        # Update eye positions in preset mode
+        if self.current_condition == 1:
+            new_pos = self.preset_positions[key]
+            self.left_pupil_pos = list(new_pos)
+            self.right_pupil_pos = [new_pos[0] + 375, new_pos[1]]  # Offset for right eye
+
+    def set_recording(self, recording, timestamp):
+        """Start or pause writing frames to the session recording"""
+        if recording == self.recording or self.session_recorder is None:
+            return
+        self.recording = recording
+        print("Session recording " + ("started" if recording else "paused"))
+
+    def sound_started(self, trigger):
+        """Log the onset of a question sound (called from the audio scheduler thread)"""
+        if self.event_log is not None:
+            self.event_log.event(EVENT_SOUND, trigger.condition, trigger.key, trigger.onset)
+
+    def detect_face(self, gray, hint=None):
+        """
+        Run the face detector on a grayscale frame, searching around `hint` when given.
+        Returns the first detected (x, y, w, h) face box, or None if no face was found.
+        """
+        faces = self.face_detector.detect(gray, hint)
+        return faces[0] if faces else None
 
-    def update_tracking(self):
+    def update_tracking(self, captured):
         """
         Update eye positions based on face tracking (Condition 2).
         Uses OpenCV to detect faces and calculate eye movement targets.
+        `captured` is the new camera frame, or None if there is none this
+        iteration; the pupils keep moving towards the last target either way.
+        Returns `captured` if it was used for tracking, None otherwise.
         """
         if self.current_condition != 2:
-            return
-            
-        # Get frame from camera
-        success, frame = self.cap.read()
-        if not success:
-            return
+            return None
             
-        # Process frame for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-        
-        if len(faces) > 0:
-            # Get coordinates of the first (largest) face
-            (x, y, w, h) = faces[0]
-            frame_height, frame_width = frame.shape[:2]
+        if captured is not None:
+            frame = captured.frame
             
-            # Convert face position to normalized coordinates (0-1)
-            face_x = (x + w/2) / frame_width
-            face_y = (y + h/2) / frame_height
+            # Process frame for face detection
+            start = PROFILER.start()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            PROFILER.stop('cvtColor', start)
+            if self.motion_gate.changed(gray):
+                face = self.scheduler.update(gray, lambda hint: self.detect_face(gray, hint))
+            else:
+                face = self.scheduler.box
             
-            # Calculate eye movement direction
-            x_direction = -(face_x - 0.5) * 2  # Invert x so eyes look at face
-            y_direction = (face_y - 0.5) * 2
+            if face is not None:
+                (x, y, w, h) = face
+                frame_height, frame_width = frame.shape[:2]
+                
+                # Convert face position to normalized coordinates (0-1)
+                face_x = (x + w/2) / frame_width
+                face_y = (y + h/2) / frame_height
+                
+                # Calculate eye movement direction
+                x_direction = -(face_x - 0.5) * 2  # Invert x so eyes look at face
+                y_direction = (face_y - 0.5) * 2
+                self.face_direction = (x_direction, y_direction)
+                self.face_timestamp = captured.timestamp
+            else:
+                self.face_direction = None
+        
+        if self.face_direction is not None:
+            x_direction, y_direction = self.face_direction
             
             # Calculate target positions for both pupils
             target_left = [
@@ -201,9 +290,12 @@ class EyeSystem:
                 self.right_eye_pos[1] + y_direction * self.max_pupil_offset
             ]
             
-            # Smooth movement to target positions
-            self.left_pupil_pos = self.smooth_move(self.left_pupil_pos, target_left)
-            self.right_pupil_pos = self.smooth_move(self.right_pupil_pos, target_right)
+            # Smooth movement to target positions, extrapolated from the capture time to when they are shown
+            latency = self.latency.recent()
+            self.left_pupil_pos = self.left_filter.update(target_left, self.face_timestamp, latency=latency)
+            self.right_pupil_pos = self.right_filter.update(target_right, self.face_timestamp, latency=latency)
+        
+        return captured
 
     def draw(self):
         """
@@ -211,7 +303,6 @@ class EyeSystem:
         Handles both regular drawing and idle animation.
         """
         current_time = time.time()
-        self.screen.fill((0, 0, 0))  # Clear screen
         
         # Calculate pupil positions with idle animation if applicable
         if self.current_condition == 1 and current_time - self.last_interaction_time > self.IDLE_DELAY:
@@ -226,41 +317,91 @@ class EyeSystem:
             left_x, left_y = self.left_pupil_pos
             right_x, right_y = self.right_pupil_pos
         
-        # Draw the white part of the eyes
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw the black pupils
-        pygame.draw.circle(self.screen, (0, 0, 0), (int(left_x), int(left_y)), self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), (int(right_x), int(right_y)), self.pupil_radius)
-        
-        pygame.display.update()
+        # Redraw only the pupil areas (skipped entirely if the pupils did not move)
+        start = PROFILER.start()
+        self.renderer.draw(((left_x, left_y), (right_x, right_y)))
+        PROFILER.stop('draw', start)
 
-    def run(self):
+    def run(self, recorder=None):
         """
         Main program loop.
+        Pass a replay.ReplayRecorder as `recorder` to record latency and pupil positions.
         Handles events, updates, and drawing until program is closed.
         """
         running = True
-        while running:
+        while running and self.cap.isOpened():
             # Process window and keyboard events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        running = False
+            running = self.handle_input()
             
-            # Update system state
-            self.handle_input()
-            self.update_tracking()
+            # Read the camera in every condition: every new frame goes to the recording and
+            # the clips, the face is only tracked in condition 2 and when detection is due
+            captured = self.cap.read_latest()
+            tracked = self.update_tracking(captured if self.loop.detection_due() else None)
+            if tracked is not None:
+                self.latency.frame(tracked)
             self.draw()
             
+            if recorder is not None and captured is not None:
+                recorder.record(captured, self.left_pupil_pos, self.right_pupil_pos)
+            
+            # Hand the frame to the session recording (queued, encoded on the recorder thread)
+            if self.session_recorder is not None and self.recording and captured is not None:
+                self.session_recorder.submit(captured, self.current_condition)
+            if self.clip_buffer is not None and captured is not None:
+                self.clip_buffer.push(captured)
+            if self.event_log is not None:
+                self.event_log.frame(self.current_condition, captured.seq if captured is not None else -1,
+                                     self.face_direction, self.left_pupil_pos, self.right_pupil_pos)
+            
+            # Sleep away the rest of the frame instead of spinning (handling control commands meanwhile)
+            self.loop.tick(on_wake=self.handle_input)
+            
         # Cleanup resources when done
+        PROFILER.dump()
+        print(self.loop.stats())
+        print(self.keys.stats())
+        if self.control_server is not None:
+            self.control_server.close()
+            print(self.control_server.stats())
+        print(self.audio.stats())
+        self.sound_scheduler.close()
+        print(self.sound_scheduler.stats())
+        print(self.cap.stats())
+        print(self.latency.stats())
+        print(self.face_detector.stats())
+        print(self.scheduler.stats())
+        print(self.motion_gate.stats())
         self.cap.release()
-        cv2.destroyAllWindows()
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+            print(self.session_recorder.stats())
+        if self.clip_buffer is not None:
+            self.clip_buffer.close()
+            print(self.clip_buffer.stats())
+        if self.event_log is not None:
+            self.event_log.close()
+            print(self.event_log.stats())
         pygame.quit()
 
 if __name__ == "__main__":
-    system = EyeSystem()
-    system.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cascade', default='haar', help="Face cascade: 'haar', 'lbp' or a path to an XML file")
+    parser.add_argument('--record', help="Record the camera feed to this video file (with a .csv sidecar)")
+    parser.add_argument('--drop-policy', default='oldest', choices=DROP_POLICIES,
+                        help="What to drop when the recorder falls behind")
+    parser.add_argument('--clips', help="Save the footage around each question (keys 1-9) to this directory")
+    parser.add_argument('--log', help="Write session events to this new binary log file (one file per session)")
+    parser.add_argument('--latency-csv', help="Write the capture-to-photon latency of every frame to this CSV file")
+    parser.add_argument('--control', nargs='?', const=DEFAULT_ADDRESS,
+                        help="Accept operator commands on this local address (default %(const)s, "
+                             "or 'unix:/path/to/socket'); see control_client.py")
+    args = parser.parse_args()
+    session_recorder = SessionRecorder(args.record, drop_policy=args.drop_policy) if args.record else None
+    clip_buffer = ClipBuffer(args.clips) if args.clips else None
+    event_log = EventLog(args.log) if args.log else None
+    control_server = ControlServer(args.control) if args.control else None
+    system = EyeSystem(cascade=args.cascade, session_recorder=session_recorder, clip_buffer=clip_buffer,
+                       event_log=event_log, control_server=control_server)
+    system.run()
+    if args.latency_csv:
+        system.latency.save(args.latency_csv)
\ No newline at end of file
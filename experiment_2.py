@@ -1,6 +1,20 @@
+import argparse
 import cv2
 import pygame
-import time
+from capture import FrameGrabber
+from tracking import RoiFaceDetector, DetectionScheduler, MotionGate, load_cascade
+from renderer import EyeRenderer
+from frame_clock import LoopGovernor
+from pupil_filter import PupilFilter
+from audio_bank import AudioBank
+from audio_scheduler import AudioScheduler, init_mixer
+from key_map import KeyMap
+from control_server import ControlServer, DEFAULT_ADDRESS
+from session_recorder import SessionRecorder, DROP_POLICIES
+from clip_buffer import ClipBuffer
+from latency import LatencyLog
+from event_log import EventLog, EVENT_KEY, EVENT_CONDITION, EVENT_SOUND
+from profiling import PROFILER
 
 class EyeSystem:
     """
@@ -19,21 +33,44 @@ class EyeSystem:
     - 't': Switch to Condition 2
     - Arrow keys: Manual eye control
     - Keys 1-8: Trigger sounds based on current condition
+    - The same commands, and pausing the recording, over a local socket (--control, see control_client.py)
     """
-    def __init__(self, width=800, height=480):
+    def __init__(self, width=800, height=480, render_fps=60, detect_fps=30, cap=None, cascade='haar',
+                 session_recorder=None, clip_buffer=None, event_log=None, latency_log=None,
+                 control_server=None):
         # Initialize pygame and webcam
+        init_mixer()                    # Small mixer buffer for low sound latency; before pygame.init()
         pygame.init()
         pygame.mixer.init()             # Required for sound playback
-        self.cap = cv2.VideoCapture(0)  # Initialize webcam
+        # Webcam capture on a background thread (or a recording passed in for replay)
+        self.cap = (cap if cap is not None else FrameGrabber(0)).start()
+        # Optional SessionRecorder that writes the camera feed to a video file off the render loop
+        self.session_recorder = session_recorder.start() if session_recorder is not None else None
+        # Optional ClipBuffer that saves the footage around each question (keys 1-9)
+        self.clip_buffer = clip_buffer
+        # Optional EventLog for frames, key presses, condition switches and sound onsets
+        self.event_log = event_log
+        # Capture-to-photon latency of every camera frame, closed by the renderer's display updates
+        self.latency = latency_log if latency_log is not None else LatencyLog()
+        # Optional ControlServer whose commands are dispatched like key presses (see handle_input)
+        self.control_server = control_server
+        self.recording = True           # Frames go to the session recording (paused by 'record stop')
         
         # Load face detection classifier for tracking
-        self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+        # ('haar', 'lbp' for the LBP cascade, or a path to a cascade XML file)
+        self.face_cascade = load_cascade(cascade)
+        self.face_detector = RoiFaceDetector(self.face_cascade, scale_factor=1.3, min_neighbors=5)
+        self.scheduler = DetectionScheduler()  # Detect every few frames, optical flow in between
+        self.motion_gate = MotionGate()        # Keep the last face box while the participant sits still
         
         # Screen setup - optimized for 800x480 display
         self.width = width
         self.height = height
         self.screen = pygame.display.set_mode((width, height))
         
+        # Pace the main loop; detection runs at its own, lower rate
+        self.loop = LoopGovernor(render_fps=render_fps, detect_fps=detect_fps)
+        
         # Eye appearance parameters
         self.eye_radius = 140       # Size of the white part of the eye
         self.pupil_radius = 40      # Size of the black pupil
@@ -45,121 +82,184 @@ class EyeSystem:
         self.left_pupil_pos = list(self.left_eye_pos)    # Current position of left pupil
         self.right_pupil_pos = list(self.right_eye_pos)  # Current position of right pupil
         
+        # Pre-render the background and scleras once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        self.renderer.latency = self.latency
+        
         # Control and movement settings
         self.current_condition = 1      # Start with condition 1
         self.manual_control = False     # Flag for manual control mode
         self.manual_direction = (0, 0)  # Direction vector for manual control
-        self.movement_speed = 0.3       # Speed of pupil movement (0-1)
+        self.face_direction = None      # Last detected face direction (x, y), None if no face
+        self.face_timestamp = None      # Capture time of the frame the face direction was detected in
+        self.left_filter = PupilFilter()   # Time-based smoothing of the pupil targets (see pupil_filter.py)
+        self.right_filter = PupilFilter()
+        
+        # Register sound sets for both conditions; each set is only decoded when its condition is entered
+        self.audio = AudioBank()
         
-        # Load sound sets for both conditions
         # Condition 1: Questions when looking back at robot
-        self.sounds_condition1 = {
-            pygame.K_1: pygame.mixer.Sound('sounds_picture1/Green apples.mp3'),
-            pygame.K_2: pygame.mixer.Sound('sounds_picture1/Basketballs.mp3'),
-            pygame.K_3: pygame.mixer.Sound('sounds_picture1/Sentence problem.mp3'),
-            pygame.K_4: pygame.mixer.Sound('sounds_picture1/Red apples.mp3'),
-            pygame.K_5: pygame.mixer.Sound('sounds_picture1/Cats.mp3'),
-            pygame.K_6: pygame.mixer.Sound('sounds_picture1/Math problem.mp3'),
-            pygame.K_7: pygame.mixer.Sound('sounds_picture1/Oranges.mp3'),
-            pygame.K_8: pygame.mixer.Sound('sounds_picture1/Dogs.mp3'),
-        }
+        self.audio.register(1, {
+            pygame.K_1: 'sounds_picture1/Green apples.mp3',
+            pygame.K_2: 'sounds_picture1/Basketballs.mp3',
+            pygame.K_3: 'sounds_picture1/Sentence problem.mp3',
+            pygame.K_4: 'sounds_picture1/Red apples.mp3',
+            pygame.K_5: 'sounds_picture1/Cats.mp3',
+            pygame.K_6: 'sounds_picture1/Math problem.mp3',
+            pygame.K_7: 'sounds_picture1/Oranges.mp3',
+            pygame.K_8: 'sounds_picture1/Dogs.mp3',
+        })
         
         # Condition 2: Questions while looking at screen
-        self.sounds_condition2 = {
-            pygame.K_1: pygame.mixer.Sound('sounds_picture2/Blue circles.mp3'),
-            pygame.K_2: pygame.mixer.Sound('sounds_picture2/Red squares.mp3'),
-            pygame.K_3: pygame.mixer.Sound('sounds_picture2/Math problem.mp3'),
-            pygame.K_4: pygame.mixer.Sound('sounds_picture2/Footballs.mp3'),
-            pygame.K_5: pygame.mixer.Sound('sounds_picture2/Blueberries.mp3'),
-            pygame.K_6: pygame.mixer.Sound('sounds_picture2/Red circles.mp3'),
-            pygame.K_7: pygame.mixer.Sound('sounds_picture2/Sentence problem.mp3'),
-            pygame.K_8: pygame.mixer.Sound('sounds_picture2/Strawberries.mp3'),
-        }
+        self.audio.register(2, {
+            pygame.K_1: 'sounds_picture2/Blue circles.mp3',
+            pygame.K_2: 'sounds_picture2/Red squares.mp3',
+            pygame.K_3: 'sounds_picture2/Math problem.mp3',
+            pygame.K_4: 'sounds_picture2/Footballs.mp3',
+            pygame.K_5: 'sounds_picture2/Blueberries.mp3',
+            pygame.K_6: 'sounds_picture2/Red circles.mp3',
+            pygame.K_7: 'sounds_picture2/Sentence problem.mp3',
+            pygame.K_8: 'sounds_picture2/Strawberries.mp3',
+        })
+        
+        self.audio.activate(self.current_condition)
         
         # Timing control variables
-        self.move_delay = 0.5         # Delay before movement starts
         self.sound_delay = 1.5        # Delay before sound plays after movement
-        self.last_move_time = 0       # Timestamp of last movement
-        self.ready_for_sound = False  # Flag indicating sound can be played
-        self.selected_key = None      # Currently selected sound key
+        
+        # Plays each question sound_delay after its key press, on its own thread
+        self.sound_scheduler = AudioScheduler(on_onset=self.sound_started)
+        
+        # Keyboard actions, each run once per key press (see handle_input)
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        self.keys.bind(pygame.K_o, self.switch_condition, 1)           # 'O' for condition one
+        self.keys.bind(pygame.K_t, self.switch_condition, 2)           # 'T' for condition two
+        self.keys.bind(pygame.K_LEFT, self.look, (-1, 0))              # Look left
+        self.keys.bind(pygame.K_RIGHT, self.look, (1, 0))              # Look right
+        self.keys.bind(pygame.K_UP, self.look, (0, 0))                 # Dead stare (center position)
+        self.keys.bind(pygame.K_DOWN, self.look, None)                 # Return to face tracking mode
+        for k in set(self.audio.keys(1)) | set(self.audio.keys(2)):
+            self.keys.bind(k, self.ask_question, k)
+        self.keys.bind('record_start', self.set_recording, True)        # Control channel only
+        self.keys.bind('record_stop', self.set_recording, False)
+        if self.control_server is not None:
+            self.control_server.wake = self.loop.wake.set  # Commands are dispatched during the frame sleep
+            self.control_server.start()
 
     def handle_input(self):
         """
-        Handle all keyboard input including:
+        Process the queued keyboard and window events. Every key press runs its
+        action from self.keys exactly once:
         - Condition switching with 'o' and 't'
         - Manual control with arrow keys
         - Sound triggering with number keys 1-8
+        Returns False once the program should quit.
         """
-        current_time = time.time()
-        keys = pygame.key.get_pressed()
-        
-        # Condition switching
-        if keys[pygame.K_o]:    # Switch to condition 1 (questions when looking back)
-            self.current_condition = 1
+        return self.keys.handle()
+
+    def switch_condition(self, condition, timestamp):
+        """Switch to another condition (pressing the key of the active one does nothing)"""
+        if condition == self.current_condition:
+            return
+        self.current_condition = condition
+        self.audio.activate(condition)
+        if self.event_log is not None:
+            self.event_log.event(EVENT_CONDITION, condition, timestamp=timestamp)
+        if condition == 1:
             print("Switched to Condition 1: Questions on looking back")
-        elif keys[pygame.K_t]:  # Switch to condition 2 (questions while looking)
-            self.current_condition = 2
+        else:
             print("Switched to Condition 2: Questions while looking at screen")
-            
-        # Manual eye control with arrow keys
-        if keys[pygame.K_LEFT]:
-            self.manual_control = True
-            self.manual_direction = (-1, 0)  # Look left
-        elif keys[pygame.K_RIGHT]:
-            self.manual_control = True
-            self.manual_direction = (1, 0)   # Look right
-        elif keys[pygame.K_UP]:
+
+    def look(self, direction, timestamp):
+        """Arrow keys: look in a fixed (x, y) direction, or follow the face again if direction is None"""
+        if direction is None:
+            self.manual_control = False
+        else:
             self.manual_control = True
-            self.manual_direction = (0, 0)   # Dead stare (center position) - if needed
-        elif keys[pygame.K_DOWN]:
-            self.manual_control = False      # Return to face tracking mode
-            
-        # Sound triggering based on current condition
-        sounds = self.sounds_condition1 if self.current_condition == 1 else self.sounds_condition2
-        for k in sounds.keys():
-            if keys[k] and current_time - self.last_move_time > self.move_delay:
-                self.last_move_time = current_time
-                self.ready_for_sound = True
-                self.selected_key = k
-                break
-        
-        # Play sound after specified delay
-        if self.ready_for_sound and current_time - self.last_move_time > self.sound_delay:
-            if self.selected_key and self.selected_key in sounds:
-                sounds[self.selected_key].play()
-            self.ready_for_sound = False
+            self.manual_direction = direction
 
-    def update_tracking(self):
+    def ask_question(self, key, timestamp):
+        """Number key: play the question's sound sound_delay after the key press and save the footage around it"""
+        sound = self.audio.get(self.current_condition, key)
+        if sound is None:
+            return  # No question on this key in the current condition
+        self.sound_scheduler.schedule(sound, timestamp + self.sound_delay, key, self.current_condition)
+        if self.event_log is not None:
+            self.event_log.event(EVENT_KEY, self.current_condition, key, timestamp)
+        
+        # Save the camera footage around this question
+        if self.clip_buffer is not None:
+            self.clip_buffer.trigger(f"condition{self.current_condition}_question{key - pygame.K_0}", timestamp)
+
+    def set_recording(self, recording, timestamp):
+        """Start or pause writing frames to the session recording"""
+        if recording == self.recording or self.session_recorder is None:
+            return
+        self.recording = recording
+        print("Session recording " + ("started" if recording else "paused"))
+
+    def sound_started(self, trigger):
+        """Log the onset of a question sound (called from the audio scheduler thread)"""
+        if self.event_log is not None:
+            self.event_log.event(EVENT_SOUND, trigger.condition, trigger.key, trigger.onset)
+
+    def detect_face(self, gray, hint=None):
+        """
+        Run the face detector on a grayscale frame, searching around `hint` when given.
+        Returns the first detected (x, y, w, h) face box, or None if no face was found.
+        """
+        faces = self.face_detector.detect(gray, hint)
+        return faces[0] if faces else None
+
+    def update_tracking(self, captured):
         """
         Update eye positions based on face tracking or manual control.
         Face tracking is active when manual_control is False.
-        Returns the processed frame (unused in this version).
+        `captured` is the camera frame to detect the face in, or None if
+        detection is not due; the pupils keep moving towards the last target
+        either way. Returns `captured`.
         """
-        success, frame = self.cap.read()
-        if not success:
-            return None
+        if captured is not None:
+            frame = captured.frame
             
-        # Process frame for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+            # Process frame for face detection
+            start = PROFILER.start()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            PROFILER.stop('cvtColor', start)
+            if self.motion_gate.changed(gray):
+                face = self.scheduler.update(gray, lambda hint: self.detect_face(gray, hint))
+            else:
+                face = self.scheduler.box
+            
+            if face is not None:
+                (x, y, w, h) = face
+                frame_height, frame_width = frame.shape[:2]
+                face_x = (x + w/2) / frame_width
+                face_y = (y + h/2) / frame_height
+                
+                # Convert face position to direction vectors
+                self.face_direction = (-(face_x - 0.5) * 2,  # Invert x so eyes look at face
+                                       (face_y - 0.5) * 2)
+                self.face_timestamp = captured.timestamp
+            else:
+                self.face_direction = None
         
         # Calculate direction for eye movement
-        if len(faces) > 0 and not self.manual_control:
+        if self.face_direction is not None and not self.manual_control:
             # Face detected and in tracking mode
-            (x, y, w, h) = faces[0]
-            frame_height, frame_width = frame.shape[:2]
-            face_x = (x + w/2) / frame_width
-            face_y = (y + h/2) / frame_height
-            
-            # Convert face position to direction vectors
-            x_direction = -(face_x - 0.5) * 2  # Invert x so eyes look at face
-            y_direction = (face_y - 0.5) * 2
+            x_direction, y_direction = self.face_direction
+            timestamp = self.face_timestamp
         elif self.manual_control:
             # Use manual direction if in manual control mode
             x_direction, y_direction = self.manual_direction
+            timestamp = None
         else:
             # No face detected and not in manual mode - look straight ahead
             x_direction, y_direction = 0, 0
+            timestamp = None
             
         # Calculate target positions for pupils
         target_left = [
@@ -171,63 +271,100 @@ class EyeSystem:
             self.right_eye_pos[1] + y_direction * self.max_pupil_offset
         ]
         
-        # Smooth movement towards target positions
-        self.left_pupil_pos = [
-            self.left_pupil_pos[0] + (target_left[0] - self.left_pupil_pos[0]) * self.movement_speed,
-            self.left_pupil_pos[1] + (target_left[1] - self.left_pupil_pos[1]) * self.movement_speed
-        ]
-        self.right_pupil_pos = [
-            self.right_pupil_pos[0] + (target_right[0] - self.right_pupil_pos[0]) * self.movement_speed,
-            self.right_pupil_pos[1] + (target_right[1] - self.right_pupil_pos[1]) * self.movement_speed
-        ]
+        # Smooth movement towards target positions (extrapolated from the capture time to when they are
+        # shown, by the measured latency, when following a face)
+        latency = self.latency.recent()
+        self.left_pupil_pos = self.left_filter.update(target_left, timestamp, latency=latency)
+        self.right_pupil_pos = self.right_filter.update(target_right, timestamp, latency=latency)
         
-        return frame
+        return captured
 
     def draw(self):
-        """Draw the eyes and pupils on the screen"""
-        # Clear screen with black background
-        self.screen.fill((0, 0, 0))
-        
-        # Draw the white part of the eyes
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw the black pupils
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.left_pupil_pos[0]), int(self.left_pupil_pos[1])), 
-                         self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.right_pupil_pos[0]), int(self.right_pupil_pos[1])), 
-                         self.pupil_radius)
-        
-        # Update the display
-        pygame.display.update()
+        """Draw the pupils, updating only the parts of the screen that changed"""
+        start = PROFILER.start()
+        self.renderer.draw((self.left_pupil_pos, self.right_pupil_pos))
+        PROFILER.stop('draw', start)
 
-    def run(self):
+    def run(self, recorder=None):
         """
         Main program loop.
+        Pass a replay.ReplayRecorder as `recorder` to record latency and pupil positions.
         Handles events, updates tracking, and draws eyes until program is closed.
         """
         running = True
-        while running:
+        while running and self.cap.isOpened():
             # Process window and keyboard events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        running = False
+            running = self.handle_input()
             
-            # Update system state
-            self.handle_input()
-            self.update_tracking()
+            # Every new camera frame goes to the recording and the clips; the face
+            # is only detected in those that arrive when detection is due
+            captured = self.cap.read_latest()
+            tracked = self.update_tracking(captured if self.loop.detection_due() else None)
+            if tracked is not None:
+                self.latency.frame(tracked)
             self.draw()
+            
+            if recorder is not None and captured is not None:
+                recorder.record(captured, self.left_pupil_pos, self.right_pupil_pos)
+            
+            # Hand the frame to the session recording (queued, encoded on the recorder thread)
+            if self.session_recorder is not None and self.recording and captured is not None:
+                self.session_recorder.submit(captured, self.current_condition)
+            if self.clip_buffer is not None and captured is not None:
+                self.clip_buffer.push(captured)
+            if self.event_log is not None:
+                self.event_log.frame(self.current_condition, captured.seq if captured is not None else -1,
+                                     self.face_direction, self.left_pupil_pos, self.right_pupil_pos)
+            
+            # Sleep away the rest of the frame instead of spinning (handling control commands meanwhile)
+            self.loop.tick(on_wake=self.handle_input)
         
         # Cleanup resources when done
+        PROFILER.dump()
+        print(self.loop.stats())
+        print(self.keys.stats())
+        if self.control_server is not None:
+            self.control_server.close()
+            print(self.control_server.stats())
+        print(self.audio.stats())
+        self.sound_scheduler.close()
+        print(self.sound_scheduler.stats())
+        print(self.cap.stats())
+        print(self.latency.stats())
+        print(self.face_detector.stats())
+        print(self.scheduler.stats())
+        print(self.motion_gate.stats())
         self.cap.release()
-        cv2.destroyAllWindows()
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+            print(self.session_recorder.stats())
+        if self.clip_buffer is not None:
+            self.clip_buffer.close()
+            print(self.clip_buffer.stats())
+        if self.event_log is not None:
+            self.event_log.close()
+            print(self.event_log.stats())
         pygame.quit()
 
 if __name__ == "__main__":
-    system = EyeSystem()
-    system.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cascade', default='haar', help="Face cascade: 'haar', 'lbp' or a path to an XML file")
+    parser.add_argument('--record', help="Record the camera feed to this video file (with a .csv sidecar)")
+    parser.add_argument('--drop-policy', default='oldest', choices=DROP_POLICIES,
+                        help="What to drop when the recorder falls behind")
+    parser.add_argument('--clips', help="Save the footage around each question (keys 1-9) to this directory")
+    parser.add_argument('--log', help="Write session events to this new binary log file (one file per session)")
+    parser.add_argument('--latency-csv', help="Write the capture-to-photon latency of every frame to this CSV file")
+    parser.add_argument('--control', nargs='?', const=DEFAULT_ADDRESS,
+                        help="Accept operator commands on this local address (default %(const)s, "
+                             "or 'unix:/path/to/socket'); see control_client.py")
+    args = parser.parse_args()
+    session_recorder = SessionRecorder(args.record, drop_policy=args.drop_policy) if args.record else None
+    clip_buffer = ClipBuffer(args.clips) if args.clips else None
+    event_log = EventLog(args.log) if args.log else None
+    control_server = ControlServer(args.control) if args.control else None
+    system = EyeSystem(cascade=args.cascade, session_recorder=session_recorder, clip_buffer=clip_buffer,
+                       event_log=event_log, control_server=control_server)
+    system.run()
+    if args.latency_csv:
+        system.latency.save(args.latency_csv)
\ No newline at end of file
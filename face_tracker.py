@@ -2,6 +2,15 @@ import mediapipe as mp
 import cv2
 import pygame
 import time
+from capture import FrameGrabber, FRAME_WAIT
+from tracking import DetectionScheduler, MotionGate
+from renderer import EyeRenderer
+from audio_scheduler import AudioScheduler, init_mixer
+from key_map import KeyMap
+from latency import LatencyLog
+from frame_clock import QualityGovernor
+from pupil_filter import PupilFilter
+from profiling import PROFILER
 
 class EyeTracker:
     def __init__(self):
@@ -12,9 +21,45 @@ class EyeTracker:
             min_detection_confidence=0.75,
             min_tracking_confidence=0.75
         )
+        
+        # Run FaceMesh only every few frames and follow the nose with optical flow in between
+        self.scheduler = DetectionScheduler()
+
+    def detect_nose(self, frame):
+        """
+        Run FaceMesh on a BGR frame and return a box (x, y, w, h) in pixels
+        centred on the nose tip (landmark 4), or None if no face was found.
+        The box is sized from the distance between the outer eye corners so
+        the optical flow has some texture to follow.
+        """
+        start = PROFILER.start()
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        PROFILER.stop('cvtColor', start)
+        rgb.flags.writeable = False
+        start = PROFILER.start()
+        results = self.face_mesh.process(rgb)
+        PROFILER.stop('face_mesh.process', start)
+        if not results.multi_face_landmarks:
+            return None
+        
+        landmarks = results.multi_face_landmarks[0].landmark
+        frame_height, frame_width = frame.shape[:2]
+        nose_x = landmarks[4].x * frame_width
+        nose_y = landmarks[4].y * frame_height
+        eye_span = abs(landmarks[263].x - landmarks[33].x) * frame_width
+        size = max(16, eye_span * 0.6)
+        return (nose_x - size / 2, nose_y - size / 2, size, size)
+
+    def track_nose(self, frame):
+        """Return the current nose box (detected or tracked with optical flow), or None"""
+        start = PROFILER.start()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        PROFILER.stop('cvtColor', start)
+        return self.scheduler.update(gray, lambda hint: self.detect_nose(frame))
 
 class EyeDisplay:
     def __init__(self, width=800, height=480):
+        init_mixer()  # Small mixer buffer for low sound latency; before pygame.init()
         pygame.init()
         pygame.mixer.init()
         self.width = width
@@ -32,10 +77,15 @@ class EyeDisplay:
         self.left_pupil_pos = list(self.left_eye_pos)
         self.right_pupil_pos = list(self.right_eye_pos)
         
+        # Pre-render the static eyes once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        
         # For smooth movement
         self.target_left_pos = list(self.left_eye_pos)
         self.target_right_pos = list(self.right_eye_pos)
-        self.movement_speed = 0.3
+        self.left_filter = PupilFilter()   # Time-based smoothing of the targets (see pupil_filter.py)
+        self.right_filter = PupilFilter()
 
         # Control mode
         self.manual_control = False
@@ -81,11 +131,19 @@ class EyeDisplay:
         """
         
         # Sound timing
-        self.move_delay = 0.5
         self.sound_delay = 1.5
-        self.last_move_time = 0
-        self.ready_for_sound = False
-        self.selected_key = None
+        self.sound_scheduler = AudioScheduler()  # Plays each sound sound_delay after its key press
+        
+        # Keyboard actions, each run once per key press
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        self.keys.bind(pygame.K_LEFT, self.look, (-1, 0))
+        self.keys.bind(pygame.K_RIGHT, self.look, (1, 0))
+        self.keys.bind(pygame.K_UP, self.look, (0, 0))
+        self.keys.bind(pygame.K_DOWN, self.look, None)
+        for k in self.sounds.keys():
+            self.keys.bind(k, self.play_sound, k)
 
     def calculate_look_direction(self, face_position):
         """Calculate where eyes should look based on face position in frame"""
@@ -102,45 +160,21 @@ class EyeDisplay:
         
         return (x_direction, y_direction), (x_direction, y_direction)
 
-    def smooth_move(self, current_pos, target_pos):
-        """Smoothly interpolate between current and target position"""
-        return [current_pos[0] + (target_pos[0] - current_pos[0]) * self.movement_speed,
-                current_pos[1] + (target_pos[1] - current_pos[1]) * self.movement_speed]
-
-    def handle_key_press(self):
-        """Handle key presses for sound playback and manual control"""
-        current_time = time.time()
-        keys = pygame.key.get_pressed()
-        
-        # Handle arrow key controls
-        if keys[pygame.K_LEFT]:
-            self.manual_control = True
-            self.manual_direction = (-1, 0)
-        elif keys[pygame.K_RIGHT]:
-            self.manual_control = True
-            self.manual_direction = (1, 0)
-        elif keys[pygame.K_DOWN]:
+    def look(self, direction, timestamp):
+        """Arrow keys: look in a fixed direction, or follow the face again if direction is None"""
+        if direction is None:
             self.manual_control = False
             self.manual_direction = (0, 0)
-        elif keys[pygame.K_UP]:
+        else:
             self.manual_control = True
-            self.manual_direction = (0, 0)
-        
-        # Check for sound trigger keys
-        for k in self.sounds.keys():
-            if keys[k] and current_time - self.last_move_time > self.move_delay:
-                self.last_move_time = current_time
-                self.ready_for_sound = True
-                self.selected_key = k
-                break
+            self.manual_direction = direction
 
-        # Play sound after delay
-        if self.ready_for_sound and current_time - self.last_move_time > self.sound_delay:
-            if self.selected_key and self.selected_key in self.sounds:
-                self.sounds[self.selected_key].play()
-            self.ready_for_sound = False
+    def play_sound(self, key, timestamp):
+        """Number keys: play the key's sound sound_delay after the key press"""
+        self.sound_scheduler.schedule(self.sounds[key], timestamp + self.sound_delay, key)
 
-    def update_pupils(self, face_position):
+    def update_pupils(self, face_position, timestamp=None):
+        """Move the pupils towards the face; `timestamp` is the capture time of the frame it was found in"""
         # Get eye directions based on face position or manual control
         left_dir, right_dir = self.calculate_look_direction(face_position)
         
@@ -154,80 +188,109 @@ class EyeDisplay:
             self.right_eye_pos[1] + right_dir[1] * self.max_pupil_offset
         ]
         
-        # Smoothly move towards target positions
-        self.left_pupil_pos = self.smooth_move(self.left_pupil_pos, self.target_left_pos)
-        self.right_pupil_pos = self.smooth_move(self.right_pupil_pos, self.target_right_pos)
+        # Smoothly move pupils towards target positions, making up for the measured capture-to-display latency
+        if face_position is None:
+            timestamp = None
+        latency = self.renderer.latency.recent() if self.renderer.latency is not None else None
+        self.left_pupil_pos = self.left_filter.update(self.target_left_pos, timestamp, latency=latency)
+        self.right_pupil_pos = self.right_filter.update(self.target_right_pos, timestamp, latency=latency)
 
     def draw(self):
-        self.screen.fill((0, 0, 0))
-        
-        # Draw eyes (white circles)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw pupils (black circles)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.left_pupil_pos[0]), int(self.left_pupil_pos[1])), 
-                         self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.right_pupil_pos[0]), int(self.right_pupil_pos[1])), 
-                         self.pupil_radius)
-        
-        pygame.display.update()
+        # Only the pupil areas are redrawn; nothing is drawn if the pupils did not move
+        start = PROFILER.start()
+        self.renderer.draw((self.left_pupil_pos, self.right_pupil_pos))
+        PROFILER.stop('draw', start)
 
-def main():
-    # Initialize camera
-    cap = cv2.VideoCapture(0)
+def main(cap=None, show_preview=True, recorder=None, latency=None):
+    # Capture camera frames on a background thread (a recording when replaying)
+    if cap is None:
+        cap = FrameGrabber(0)
+    cap.start()
     
     # Initialize our classes
     tracker = EyeTracker()
     display = EyeDisplay()
     
+    # Time every frame until the display update that shows its result
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+    
+    # Lower the detection quality when frames take longer than the camera's frame interval
+    quality = QualityGovernor(frame_budget=1.0 / 30)
+    
+    # Reuse the last nose box while the scene does not change
+    motion_gate = MotionGate()
+    
+    face_position = None  # Last known face position
+    face_time = None      # Capture time of the frame face_position was found in
     running = True
     while running and cap.isOpened():
-        # Process camera frame
-        success, frame = cap.read()
-        if not success:
-            print("Failed to get frame")
-            continue
+        # Wait for the next camera frame (None if none arrived within FRAME_WAIT)
+        captured = cap.read_latest(timeout=FRAME_WAIT)
+        if captured is not None:
+            latency.frame(captured)
+            frame_start = time.monotonic()
+            frame = captured.frame
             
-        # Convert frame for face mesh
-        frame.flags.writeable = False
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = tracker.face_mesh.process(frame)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        
-        # Get face position if face is detected and not in manual control
-        if results.multi_face_landmarks and not display.manual_control:
-            nose_landmark = results.multi_face_landmarks[0].landmark[4]
-            face_position = (nose_landmark.x, nose_landmark.y)
-            display.update_pupils(face_position)
-        else:
-            display.update_pupils(None)
+            # Only every few frames at reduced quality; otherwise keep the last face position
+            if quality.detection_due():
+                # Detect the nose with FaceMesh (on a downscaled copy if needed) or follow it with optical flow
+                start = PROFILER.start()
+                small = quality.resize(frame)
+                PROFILER.stop('resize', start)
+                nose_box = tracker.track_nose(small) if motion_gate.changed(small) else tracker.scheduler.box
+                
+                # Get face position (centre of the nose box, normalized 0-1) if a face is detected
+                if nose_box is not None:
+                    x, y, w, h = nose_box
+                    small_height, small_width = small.shape[:2]
+                    face_position = ((x + w/2) / small_width, (y + h/2) / small_height)
+                    face_time = captured.timestamp
+                else:
+                    face_position = None
+            
+            # Show the camera feed (optional, for debugging)
+            if show_preview:
+                cv2.imshow('Camera Feed', frame)
+        
+        # Follow the face unless in manual control
+        display.update_pupils(None if display.manual_control else face_position, face_time)
         
         # Handle key presses and sounds
-        display.handle_key_press()
+        running = display.keys.handle()
         
         # Draw the display
         display.draw()
         
-        # Show the camera feed (optional, for debugging)
-        cv2.imshow('Camera Feed', frame)
-        
-        # Check for quit events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                    
-        if cv2.waitKey(1) & 0xFF == 27:
+        # Record latency and pupil positions for replay runs
+        if recorder is not None and captured is not None:
+            recorder.record(captured, display.left_pupil_pos, display.right_pupil_pos)
+        
+        start = PROFILER.start()
+        if show_preview and cv2.waitKey(1) & 0xFF == 27:
             running = False
+        PROFILER.stop('waitKey', start)
+        
+        # Adjust the detection quality to the time this frame took
+        if captured is not None and quality.update(time.monotonic() - frame_start):
+            # The tracked nose box is in the old scale - start over at the new one
+            tracker.scheduler.reset()
+            motion_gate.reset()
     
     # Cleanup
+    PROFILER.dump()
+    print(display.keys.stats())
+    display.sound_scheduler.close()
+    print(display.sound_scheduler.stats())
+    print(cap.stats())
+    print(latency.stats())
+    print(tracker.scheduler.stats())
+    print(quality.stats())
+    print(motion_gate.stats())
     cap.release()
-    cv2.destroyAllWindows()
+    if show_preview:
+        cv2.destroyAllWindows()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+"""
+Shared-memory frame bus: one capture process publishes camera frames into a
+ring of slots in multiprocessing.shared_memory, and any number of other
+processes (display, debug preview, recorder, detectors) read them without
+copying, so the work is spread over all cores instead of one loop.
+
+Usage:
+    python frame_bus.py [--source 0] [--preview] [--cascade haar] [--record session.avi]
+"""
+import argparse
+import queue
+import time
+from collections import namedtuple
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+# A frame read from the bus: sequence number, capture time (time.monotonic) and the image
+BusFrame = namedtuple('BusFrame', ['seq', 'timestamp', 'slot', 'frame'])
+
+# Header fields (int64) at the start of the shared memory block
+_SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _LATEST = range(5)
+_HEADER_FIELDS = 8
+_ALIGN = 64
+
+
+class FrameBus:
+    """
+    Ring of frame slots in shared memory with one writer and many readers.
+
+    The block holds a small header (ring size, frame shape, newest sequence
+    number), a version and a timestamp per slot, and then the frames. Each
+    slot is guarded by a seqlock: while frame n is written its slot version is
+    2n - 1 (odd), afterwards 2n. A reader that sees the same even version
+    before and after using a slot knows the frame was not overwritten.
+
+    read_latest() returns a view into the slot (zero-copy). The writer only
+    comes back to a slot after `slots - 1` further frames, so a reader has that
+    many frame intervals to use the view; check it with valid() afterwards, or
+    pass copy=True for a checked private copy.
+
+    The versions and frames are plain stores to shared memory without memory
+    barriers. On x86 the stores become visible in order, but on weakly ordered
+    CPUs (the ARM cores of a Raspberry Pi) a reader can see the even version
+    before all of the frame, so the seqlock check is only best-effort there.
+    Pass a multiprocessing lock to create() and attach() to make copy=True
+    reads exact: publish() and copying reads then take it around the slot
+    access (its acquire and release are full barriers). Zero-copy reads stay
+    best-effort; use them where a torn frame is harmless (detection, preview).
+
+    Create the bus once with FrameBus.create() in the parent process and
+    attach to it by name with FrameBus.attach() in processes started from it
+    with multiprocessing (they share its resource tracker, which frees the
+    block if the parent dies).
+    """
+    def __init__(self, shm, owner, lock=None):
+        self.shm = shm
+        self.owner = owner  # Only the creating process unlinks the block
+        self.name = shm.name
+        self.lock = lock    # Optional multiprocessing lock shared by the writer and copying readers
+
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.slots = int(header[_SLOTS])
+        self.shape = (int(header[_HEIGHT]), int(header[_WIDTH]), int(header[_CHANNELS]))
+        self._header = header
+
+        offset = _HEADER_FIELDS * 8
+        self._versions = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.slots * 8
+        self._stamps = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.slots * 8
+        offset = (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+        # Statistics (per process)
+        self.published = 0  # Frames written by this process
+        self.torn = 0       # Reads that found their slot overwritten
+
+    @classmethod
+    def create(cls, shape=(480, 640, 3), slots=4, lock=None):
+        """Allocate a new bus for frames of `shape` with `slots` ring slots (see the class for `lock`)"""
+        frame_bytes = int(np.prod(shape))
+        header_bytes = _HEADER_FIELDS * 8 + slots * 16
+        size = (header_bytes + _ALIGN - 1) // _ALIGN * _ALIGN + slots * frame_bytes
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_SLOTS] = slots
+        header[_HEIGHT], header[_WIDTH], header[_CHANNELS] = shape
+        del header
+        bus = cls(shm, owner=True, lock=lock)
+        bus._versions[:] = 0
+        return bus
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        """Attach to an existing bus by its shared memory name, with the lock it was created with"""
+        return cls(shared_memory.SharedMemory(name=name), owner=False, lock=lock)
+
+    @property
+    def latest_seq(self):
+        """Sequence number of the newest published frame (0 before the first one)"""
+        return int(self._header[_LATEST])
+
+    def publish(self, frame, timestamp=None):
+        """
+        Write a frame into the next slot.
+
+        Frames of a different size are resized straight into the slot.
+        Returns the frame's sequence number.
+        """
+        if self.lock is None:
+            return self._publish(frame, timestamp)
+        with self.lock:
+            return self._publish(frame, timestamp)
+
+    def _publish(self, frame, timestamp):
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        self._versions[slot] = 2 * seq - 1  # Odd: slot is being written
+        target = self._frames[slot]
+        if frame.shape == target.shape:
+            np.copyto(target, frame)
+        else:
+            import cv2
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+        self._stamps[slot] = time.monotonic() if timestamp is None else timestamp
+        self._versions[slot] = 2 * seq      # Even: frame `seq` is complete
+        self._header[_LATEST] = seq
+        self.published += 1
+        return seq
+
+    def read_latest(self, after=0, copy=False):
+        """
+        Return the newest frame if its sequence number is greater than `after`.
+
+        Never blocks. Returns a BusFrame (whose frame is a view into shared
+        memory unless `copy` is True), or None if there is nothing newer or the
+        slot was overwritten while it was read.
+        """
+        if copy and self.lock is not None:
+            with self.lock:
+                return self._read_latest(after, copy)
+        return self._read_latest(after, copy)
+
+    def _read_latest(self, after, copy):
+        seq = self.latest_seq
+        if seq <= after:
+            return None
+        slot = seq % self.slots
+        if self._versions[slot] != 2 * seq:
+            self.torn += 1
+            return None
+        timestamp = float(self._stamps[slot])
+        frame = self._frames[slot].copy() if copy else self._frames[slot]
+        if copy and self._versions[slot] != 2 * seq:
+            self.torn += 1
+            return None
+        return BusFrame(seq, timestamp, slot, frame)
+
+    def wait_latest(self, after=0, timeout=1.0, poll=0.002, copy=False):
+        """Like read_latest(), but wait up to `timeout` seconds for a newer frame"""
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.read_latest(after, copy)
+            if frame is not None or time.monotonic() >= deadline:
+                return frame
+            time.sleep(poll)
+
+    def valid(self, bus_frame):
+        """True if the slot of a zero-copy BusFrame still holds that frame"""
+        if self._versions[bus_frame.slot] == 2 * bus_frame.seq:
+            return True
+        self.torn += 1
+        return False
+
+    def close(self):
+        """Detach from the shared memory (and free it, in the creating process)"""
+        # Views into the buffer must be gone before it can be closed
+        self._header = self._versions = self._stamps = self._frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def stats(self):
+        """Return a one-line summary of this process's use of the bus"""
+        return (f"Frame bus {self.name}: {self.slots} slots of {self.shape}, "
+                f"{self.published} frames published, {self.torn} torn reads")
+
+
+def capture_process(bus_name, source, stop, lock=None):
+    """Producer: read frames from `source` and publish them until `stop` is set or a recording ends"""
+    import cv2
+    from capture import open_capture
+    bus = FrameBus.attach(bus_name, lock)
+    cap = open_capture(source)
+    live = isinstance(source, int)
+    # Release recorded frames at their original rate, like a live camera would
+    frame_interval = 0.0 if live else 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    next_frame = time.monotonic()
+    while not stop.is_set():
+        if frame_interval:
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_frame += frame_interval
+        success, frame = cap.read()
+        if not success:
+            if not live:
+                break  # End of a recording
+            time.sleep(0.005)
+            continue
+        bus.publish(frame)
+    cap.release()
+    print(bus.stats())
+    bus.close()
+    stop.set()
+
+
+def detector_process(bus_name, results, stop, cascade='haar'):
+    """
+    Consumer: detect or track the face on every new frame and put
+    (seq, timestamp, face_position) on the `results` queue.
+    """
+    import cv2
+    from tracking import RoiFaceDetector, DetectionScheduler, load_cascade
+
+    def detect(gray, hint):
+        faces = face_detector.detect(gray, hint)
+        return faces[0] if faces else None
+
+    bus = FrameBus.attach(bus_name)
+    face_detector = RoiFaceDetector(load_cascade(cascade), scale_factor=1.3, min_neighbors=5)
+    scheduler = DetectionScheduler()
+    last_seq = 0
+    while not stop.is_set():
+        bus_frame = bus.wait_latest(last_seq, timeout=0.1)
+        if bus_frame is None:
+            continue
+        last_seq = bus_frame.seq
+
+        # cvtColor reads the slot directly and writes a private gray image
+        gray = cv2.cvtColor(bus_frame.frame, cv2.COLOR_BGR2GRAY)
+        if not bus.valid(bus_frame):
+            continue  # Overwritten while converting - take the next frame instead
+
+        face = scheduler.update(gray, lambda hint: detect(gray, hint))
+        face_position = None
+        if face is not None:
+            x, y, w, h = face
+            face_position = ((x + w / 2) / gray.shape[1], (y + h / 2) / gray.shape[0])
+        results.put((bus_frame.seq, bus_frame.timestamp, face_position))
+
+    print(face_detector.stats())
+    print(scheduler.stats())
+    print(bus.stats())
+    bus.close()
+
+
+def preview_process(bus_name, stop):
+    """Consumer: show the camera feed in an OpenCV window (Esc stops everything)"""
+    import cv2
+    bus = FrameBus.attach(bus_name)
+    last_seq = 0
+    while not stop.is_set():
+        bus_frame = bus.wait_latest(last_seq, timeout=0.1)
+        if bus_frame is not None:
+            last_seq = bus_frame.seq
+            cv2.imshow('Camera Feed', bus_frame.frame)
+        if cv2.waitKey(1) & 0xFF == 27:
+            stop.set()
+    cv2.destroyAllWindows()
+    bus.close()
+
+
+def recorder_process(bus_name, path, stop, fps=30.0, lock=None):
+    """
+    Consumer: write every frame it gets from the bus to a video file (with a
+    CSV sidecar of sequence numbers and capture times, see SessionRecorder).
+
+    Frames are copied out of the ring (under the bus lock, if the bus has
+    one, otherwise checked against the seqlock only) and encoded on the SessionRecorder's thread, so a slow encoder makes this
+    process skip frames instead of slowing down capture or display.
+    """
+    from capture import CapturedFrame
+    from session_recorder import SessionRecorder
+    bus = FrameBus.attach(bus_name, lock)
+    recorder = SessionRecorder(path, fps=fps).start()
+    last_seq = 0
+    missed = 0  # Frames published while this process was busy
+    while True:
+        stopping = stop.is_set()  # Checked first, so the frames published before the stop are still taken
+        bus_frame = bus.wait_latest(last_seq, timeout=0.1, copy=True)
+        if bus_frame is not None:
+            if last_seq:
+                missed += bus_frame.seq - last_seq - 1
+            last_seq = bus_frame.seq
+            recorder.submit(CapturedFrame(bus_frame.seq, bus_frame.timestamp, bus_frame.frame))
+        elif stopping:
+            break
+    recorder.close()
+    print(recorder.stats())
+    print(f"Recorder process: {missed} frames missed on the bus")
+    print(bus.stats())
+    bus.close()
+
+
+def main(source=0, shape=(480, 640, 3), slots=4, preview=False, cascade='haar', record=None,
+         recorder=None, latency=None):
+    """
+    Run capture, detection and (optionally) the preview and the recording in
+    their own processes and the eye display in this one.
+
+    Args:
+        source: Camera index, video file or image directory
+        shape: Frame shape on the bus; frames of another size are resized
+        slots: Number of ring slots
+        preview: Show the camera feed from a separate process
+        cascade: Face cascade for the detector process
+        record: Record the camera feed to this video file from a separate process
+        recorder: Optional replay.ReplayRecorder fed with the detector results
+        latency: Optional latency.LatencyLog for the capture-to-photon latency (a new one if None)
+    """
+    import pygame
+    from capture import CapturedFrame
+    from frame_clock import LoopGovernor
+    from haarcascade_face_tracker import EyeDisplay
+    from latency import LatencyLog
+
+    # spawn: every process imports only what it needs and starts without the parent's threads
+    context = get_context('spawn')
+    # The lock makes the recorder's copies exact on weakly ordered CPUs (see FrameBus)
+    lock = context.Lock()
+    bus = FrameBus.create(shape, slots, lock)
+    stop = context.Event()
+    results = context.Queue()
+
+    processes = [
+        context.Process(target=capture_process, args=(bus.name, source, stop, lock), name='capture'),
+        context.Process(target=detector_process, args=(bus.name, results, stop, cascade), name='detector'),
+    ]
+    if preview:
+        processes.append(context.Process(target=preview_process, args=(bus.name, stop), name='preview'))
+    if record:
+        processes.append(context.Process(target=recorder_process, args=(bus.name, record, stop, 30.0, lock), name='recorder'))
+    for process in processes:
+        process.start()
+
+    display = EyeDisplay()
+    # The capture process stamps frames with time.monotonic(), which is the same clock in every process
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+    loop = LoopGovernor(render_fps=60)
+    face_position = None
+    face_time = None
+    received = 0
+    try:
+        while not stop.is_set():
+            # Take the newest detector result, if any arrived
+            latest = None
+            try:
+                while True:
+                    latest = results.get_nowait()
+                    received += 1
+            except queue.Empty:
+                pass
+            if latest is not None:
+                seq, timestamp, face_position = latest
+                face_time = timestamp
+                latency.frame(CapturedFrame(seq, timestamp, None))
+
+            display.update_pupils(None if display.manual_control else face_position, face_time)
+            if not display.keys.handle():
+                stop.set()
+            display.draw()
+
+            if recorder is not None and latest is not None:
+                recorder.record(CapturedFrame(seq, timestamp, None), display.left_pupil_pos, display.right_pupil_pos)
+            loop.tick()
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        print(f"Display: {received} detector results")
+        print(loop.stats())
+        print(display.keys.stats())
+        display.sound_scheduler.close()
+        print(display.sound_scheduler.stats())
+        print(latency.stats())
+        bus.close()
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Eye display with capture and detection in separate processes")
+    parser.add_argument('--source', default='0', help="Camera index, video file or image directory")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--slots', type=int, default=4, help="Number of frames in the ring")
+    parser.add_argument('--preview', action='store_true', help="Show the camera feed")
+    parser.add_argument('--cascade', default='haar', help="Face cascade for the detector")
+    parser.add_argument('--record', help="Record the camera feed to this video file (with a .csv sidecar)")
+    args = parser.parse_args()
+    source = int(args.source) if args.source.isdigit() else args.source
+    main(source, shape=(args.height, args.width, 3), slots=args.slots,
+         preview=args.preview, cascade=args.cascade, record=args.record)
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+
+class LoopGovernor:
+    """
+    Paces a main loop at a fixed render rate and decides when detection should run.
+
+    Frame deadlines advance in fixed steps on time.monotonic(), so the loop
+    neither drifts nor spins: whatever time is left before the next deadline
+    is slept away. That leftover time (the slack) is recorded so the headroom
+    of the loop can be inspected. Detection has its own, independent rate.
+
+    Other threads can set `wake` to have tick() run its on_wake callback
+    right away instead of at the end of the sleep (e.g. to dispatch a command
+    from the control channel); the frame deadline is not moved.
+    """
+    def __init__(self, render_fps=60, detect_fps=30, slack_window=300):
+        self.frame_interval = 1.0 / render_fps   # Seconds per rendered frame
+        self.detect_interval = 1.0 / detect_fps  # Seconds between detections
+
+        now = time.monotonic()
+        self.next_frame = now + self.frame_interval  # Deadline of the current frame
+        self.next_detect = now                       # Detection is due immediately
+
+        self.last_slack = 0.0                        # Slack of the last frame in seconds (negative = overrun)
+        self.slack_history = deque(maxlen=slack_window)
+        self.frames = 0                              # Frames paced so far
+        self.overruns = 0                            # Frames that missed their deadline
+        self.wake = threading.Event()                # Set to run on_wake before the deadline
+        self.wakeups = 0                             # Times on_wake ran during the sleep
+
+    def detection_due(self):
+        """
+        Return True if detection should run this iteration.
+        Call once per loop iteration.
+        """
+        now = time.monotonic()
+        if now < self.next_detect:
+            return False
+        self.next_detect += self.detect_interval
+        if self.next_detect <= now:
+            # Fell behind by more than one interval - don't try to catch up with a burst
+            self.next_detect = now + self.detect_interval
+        return True
+
+    def tick(self, on_wake=None):
+        """
+        Sleep until the next frame deadline, calling on_wake() whenever `wake` is set meanwhile.
+        Call once at the end of every loop iteration. Returns the slack in seconds.
+        """
+        now = time.monotonic()
+        slack = self.next_frame - now
+        if slack > 0:
+            remaining = slack
+            while remaining > 0 and self.wake.wait(remaining):
+                self.wake.clear()
+                if on_wake is not None:
+                    on_wake()
+                    self.wakeups += 1
+                remaining = self.next_frame - time.monotonic()
+            self.next_frame += self.frame_interval
+        else:
+            # Overran the frame budget - restart the schedule from now instead of rushing
+            self.overruns += 1
+            self.next_frame = now + self.frame_interval
+
+        self.last_slack = slack
+        self.slack_history.append(slack)
+        self.frames += 1
+        return slack
+
+    def mean_slack(self):
+        """Mean slack over the recent frames, in seconds"""
+        if not self.slack_history:
+            return 0.0
+        return sum(self.slack_history) / len(self.slack_history)
+
+    def stats(self):
+        """Return a one-line summary of the loop timing"""
+        min_slack = min(self.slack_history) if self.slack_history else 0.0
+        return (f"Loop: {self.frames} frames at {1.0 / self.frame_interval:.0f} fps target, "
+                f"mean slack {self.mean_slack() * 1000:.1f} ms, min slack {min_slack * 1000:.1f} ms "
+                f"(of {self.frame_interval * 1000:.1f} ms), {self.overruns} overruns, {self.wakeups} wakeups")
+
+
+# One step of detection quality: input scale for the detector, run detection on
+# every Nth frame, and the detectMultiScale scaleFactor (coarser = fewer scales)
+QualityLevel = namedtuple('QualityLevel', ['scale', 'detect_every', 'scale_factor'])
+
+# From full quality (the trackers' original settings) down to the cheapest setting
+QUALITY_LEVELS = [
+    QualityLevel(1.0, 1, 1.3),
+    QualityLevel(0.75, 1, 1.3),
+    QualityLevel(0.5, 1, 1.3),
+    QualityLevel(0.5, 2, 1.3),
+    QualityLevel(0.5, 2, 1.4),
+    QualityLevel(0.5, 3, 1.5),
+]
+
+
+class QualityGovernor:
+    """
+    Trades detection quality for frame time.
+
+    The time of every processed frame is reported to update(). When the mean
+    over the last `window` frames exceeds the frame budget, quality drops one
+    level (smaller detector input, then fewer detections, then a coarser
+    scaleFactor); when it falls below `headroom` times the budget, one level is
+    restored. After each change the governor waits `hold` frames so the effect
+    can be measured before deciding again; a restore that immediately has to
+    be undone doubles the wait before the next restore. Every decision is
+    printed and kept in `decisions`.
+
+    The detector input is downscaled with INTER_AREA into a pair of buffers
+    allocated once per frame shape and scale.
+    """
+    def __init__(self, frame_budget=1.0 / 30, levels=QUALITY_LEVELS, window=30, headroom=0.6, hold=60):
+        self.frame_budget = frame_budget  # Target seconds per processed frame
+        self.levels = levels
+        self.window = window              # Frames averaged for a decision
+        self.headroom = headroom          # Restore quality below this fraction of the budget
+        self.hold = hold                  # Frames to wait after a change
+        self.restore_hold = hold          # Frames to wait before restoring, doubled after a failed restore
+
+        self.index = 0                    # Current level, 0 = full quality
+        self.frame_times = deque(maxlen=window)
+        self.frames_since_change = 0
+        self.frame_count = 0              # Frames seen, for the detection rate
+        self._buffers = {}                # (shape, scale) -> two preallocated resize outputs
+        self.decisions = []               # (frame, old level, new level, mean frame time)
+
+    @property
+    def level(self):
+        """The current QualityLevel"""
+        return self.levels[self.index]
+
+    def detection_due(self):
+        """
+        Return True if detection should run on this frame at the current level.
+        Call once per processed frame.
+        """
+        self.frame_count += 1
+        return self.frame_count % self.level.detect_every == 0
+
+    def resize(self, image):
+        """Downscale an image to the current detection scale (returns it unchanged at scale 1)"""
+        scale = self.level.scale
+        if scale == 1.0:
+            return image
+        key = (image.shape, scale)
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            height, width = image.shape[:2]
+            size = (max(1, int(height * scale)), max(1, int(width * scale)))
+            buffers = self._buffers[key] = [np.empty(size + image.shape[2:], dtype=image.dtype) for _ in range(2)]
+        # Alternate between two buffers so the previous downscaled frame (kept by optical flow) stays intact
+        buffers.reverse()
+        buffer = buffers[0]
+        cv2.resize(image, (buffer.shape[1], buffer.shape[0]), dst=buffer, interpolation=cv2.INTER_AREA)
+        return buffer
+
+    def update(self, frame_time):
+        """
+        Record the time of a processed frame and adjust the quality level.
+
+        Returns:
+            True if the level changed (detector state in scaled coordinates should be reset)
+        """
+        self.frame_times.append(frame_time)
+        self.frames_since_change += 1
+        if self.frames_since_change < self.hold or len(self.frame_times) < self.window:
+            return False
+
+        mean = sum(self.frame_times) / len(self.frame_times)
+        if mean > self.frame_budget and self.index < len(self.levels) - 1:
+            new_index = self.index + 1
+            if self.decisions and self.decisions[-1][2] < self.decisions[-1][1]:
+                # The last restore did not fit the budget - wait longer before trying again
+                self.restore_hold = min(self.restore_hold * 2, self.hold * 16)
+        elif (mean < self.frame_budget * self.headroom and self.index > 0
+              and self.frames_since_change >= self.restore_hold):
+            new_index = self.index - 1
+        else:
+            return False
+
+        self.decisions.append((self.frame_count, self.index, new_index, mean))
+        direction = "lowered" if new_index > self.index else "restored"
+        self.index = new_index
+        self.frames_since_change = 0
+        self.frame_times.clear()
+        level = self.level
+        print(f"Quality {direction} to level {new_index} (mean frame {mean * 1000:.1f} ms, "
+              f"budget {self.frame_budget * 1000:.1f} ms): detection scale {level.scale:.2f}, "
+              f"every {level.detect_every} frame(s), scaleFactor {level.scale_factor:.2f}")
+        return True
+
+    def stats(self):
+        """Return a one-line summary of the quality decisions"""
+        level = self.level
+        return (f"Quality: level {self.index} of {len(self.levels) - 1} (scale {level.scale:.2f}, "
+                f"every {level.detect_every} frame(s), scaleFactor {level.scale_factor:.2f}), "
+                f"{len(self.decisions)} changes")
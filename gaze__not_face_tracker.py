@@ -3,6 +3,16 @@ import cv2
 import pygame
 import numpy as np
 import time
+from capture import FrameGrabber, FRAME_WAIT
+from helpers import landmarks_to_array, LEFT_IRIS, RIGHT_IRIS, EYE_LIDS
+from renderer import EyeRenderer
+from key_map import KeyMap
+from latency import LatencyLog
+from pupil_filter import PupilFilter
+from profiling import PROFILER
+
+# The landmarks get_gaze_position converts: left iris, right iris, then the eye lids
+GAZE_LANDMARKS = np.concatenate([LEFT_IRIS, RIGHT_IRIS, EYE_LIDS]).tolist()
 
 class EyeTracker:
     def __init__(self):
@@ -16,29 +26,17 @@ class EyeTracker:
 
     def get_gaze_position(self, points, frame_shape):
         """Calculate the position where the gaze intersects the screen"""
-        # Get both irises
-        left_iris = np.array([[points.landmark[idx].x * frame_shape[1],
-                             points.landmark[idx].y * frame_shape[0]] 
-                             for idx in [469, 470, 471, 472]])
-        right_iris = np.array([[points.landmark[idx].x * frame_shape[1],
-                              points.landmark[idx].y * frame_shape[0]] 
-                              for idx in [474, 475, 476, 477]])
+        # Convert only the iris and lid landmarks to pixels
+        pixels = landmarks_to_array(points, frame_shape, GAZE_LANDMARKS)
 
         # Calculate centers of both irises
-        left_center = np.mean(left_iris, axis=0)
-        right_center = np.mean(right_iris, axis=0)
-
-        # Get eye corners for checking if eyes are open
-        left_eye_corners = np.array([[points.landmark[idx].x * frame_shape[1],
-                                    points.landmark[idx].y * frame_shape[0]]
-                                    for idx in [263, 362]])  # Left eye corners
-        right_eye_corners = np.array([[points.landmark[idx].x * frame_shape[1],
-                                     points.landmark[idx].y * frame_shape[0]]
-                                     for idx in [33, 133]])  # Right eye corners
+        left_center = pixels[0:4, :2].mean(axis=0)
+        right_center = pixels[4:8, :2].mean(axis=0)
 
-        # Check if eyes are sufficiently open by measuring vertical distance
-        left_eye_height = abs(points.landmark[386].y - points.landmark[374].y)
-        right_eye_height = abs(points.landmark[159].y - points.landmark[145].y)
+        # Check if eyes are sufficiently open by measuring vertical distance (normalized)
+        lids_y = pixels[8:12, 1] / frame_shape[0]
+        left_eye_height = abs(lids_y[0] - lids_y[1])
+        right_eye_height = abs(lids_y[2] - lids_y[3])
         
         # If eyes are too closed, return None
         if left_eye_height < 0.01 or right_eye_height < 0.01:
@@ -71,10 +69,20 @@ class EyeDisplay:
         self.left_pupil_pos = list(self.left_eye_pos)
         self.right_pupil_pos = list(self.right_eye_pos)
         
+        # Pre-render the static eyes once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        
+        # Keyboard actions, each run once per key press (and a full redraw when the window is exposed)
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        
         # For smooth movement
         self.target_left_pos = list(self.left_eye_pos)
         self.target_right_pos = list(self.right_eye_pos)
-        self.movement_speed = 0.2
+        self.left_filter = PupilFilter()   # Time-based smoothing of the targets (see pupil_filter.py)
+        self.right_filter = PupilFilter()
 
     def calculate_look_direction(self, gaze_position):
         """Calculate where eyes should look based on gaze position"""
@@ -91,12 +99,8 @@ class EyeDisplay:
         # Apply the same direction to both eyes
         return (x_direction, y_direction), (x_direction, y_direction)
 
-    def smooth_move(self, current_pos, target_pos):
-        """Smoothly interpolate between current and target position"""
-        return [current_pos[0] + (target_pos[0] - current_pos[0]) * self.movement_speed,
-                current_pos[1] + (target_pos[1] - current_pos[1]) * self.movement_speed]
-
-    def update_pupils(self, gaze_position):
+    def update_pupils(self, gaze_position, timestamp=None):
+        """Move the pupils towards the gaze; `timestamp` is the capture time of the frame it was found in"""
         # Get eye directions based on gaze position
         left_dir, right_dir = self.calculate_look_direction(gaze_position)
         
@@ -118,77 +122,94 @@ class EyeDisplay:
                 self.right_eye_pos[1] + right_y * self.max_pupil_offset
             ]
         
-        # Smoothly move towards target positions
-        self.left_pupil_pos = self.smooth_move(self.left_pupil_pos, self.target_left_pos)
-        self.right_pupil_pos = self.smooth_move(self.right_pupil_pos, self.target_right_pos)
+        # Smoothly move towards target positions, making up for the measured capture-to-display latency
+        if gaze_position is None:
+            timestamp = None
+        latency = self.renderer.latency.recent() if self.renderer.latency is not None else None
+        self.left_pupil_pos = self.left_filter.update(self.target_left_pos, timestamp, latency=latency)
+        self.right_pupil_pos = self.right_filter.update(self.target_right_pos, timestamp, latency=latency)
 
     def draw(self):
-        self.screen.fill((0, 0, 0))
-        
-        # Draw eyes (white circles)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw pupils (black circles)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.left_pupil_pos[0]), int(self.left_pupil_pos[1])), 
-                         self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.right_pupil_pos[0]), int(self.right_pupil_pos[1])), 
-                         self.pupil_radius)
-        
-        pygame.display.update()
+        # Only the pupil areas are redrawn; nothing is drawn if the pupils did not move
+        start = PROFILER.start()
+        self.renderer.draw((self.left_pupil_pos, self.right_pupil_pos))
+        PROFILER.stop('draw', start)
 
-def main():
-    # Initialize camera
-    cap = cv2.VideoCapture(0)
+def main(cap=None, show_preview=True, recorder=None, latency=None):
+    # Capture camera frames on a background thread (a recording when replaying)
+    if cap is None:
+        cap = FrameGrabber(0)
+    cap.start()
     
     # Initialize our classes
     tracker = EyeTracker()
     display = EyeDisplay()
     
+    # Time every frame until the display update that shows its result
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+    
+    gaze_position = None  # Last detected gaze position
+    gaze_time = None      # Capture time of the frame gaze_position was found in
     running = True
     while running and cap.isOpened():
-        # Process camera frame
-        success, frame = cap.read()
-        if not success:
-            print("Failed to get frame")
-            continue
+        # Wait for the next camera frame (None if none arrived within FRAME_WAIT)
+        captured = cap.read_latest(timeout=FRAME_WAIT)
+        if captured is not None:
+            latency.frame(captured)
+            frame = captured.frame
             
-        # Convert frame for face mesh
-        frame.flags.writeable = False
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = tracker.face_mesh.process(frame)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        
-        # Get gaze position if face is detected
-        if results.multi_face_landmarks:
-            gaze_position = tracker.get_gaze_position(results.multi_face_landmarks[0], frame.shape)
-            display.update_pupils(gaze_position)
-        else:
-            # Return to center if no face detected
-            display.update_pupils(None)
+            # Convert frame for face mesh
+            frame.flags.writeable = False
+            start = PROFILER.start()
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            PROFILER.stop('cvtColor', start)
+            start = PROFILER.start()
+            results = tracker.face_mesh.process(frame)
+            PROFILER.stop('face_mesh.process', start)
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            
+            # Get gaze position if face is detected
+            if results.multi_face_landmarks:
+                start = PROFILER.start()
+                gaze_position = tracker.get_gaze_position(results.multi_face_landmarks[0], frame.shape)
+                gaze_time = captured.timestamp
+                PROFILER.stop('gaze', start)
+            else:
+                # Return to center if no face detected
+                gaze_position = None
+            
+            # Show the camera feed (optional, for debugging)
+            if show_preview:
+                cv2.imshow('Camera Feed', frame)
+        
+        # Keep moving the pupils towards the last detection
+        display.update_pupils(gaze_position, gaze_time)
         
         # Draw the display
         display.draw()
         
-        # Show the camera feed (optional, for debugging)
-        cv2.imshow('Camera Feed', frame)
-        
-        # Check for quit events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                    
-        if cv2.waitKey(1) & 0xFF == 27:
+        # Record latency and pupil positions for replay runs
+        if recorder is not None and captured is not None:
+            recorder.record(captured, display.left_pupil_pos, display.right_pupil_pos)
+        
+        # Handle window and keyboard events
+        running = display.keys.handle()
+        
+        start = PROFILER.start()
+        if show_preview and cv2.waitKey(1) & 0xFF == 27:
             running = False
+        PROFILER.stop('waitKey', start)
     
     # Cleanup
+    PROFILER.dump()
+    print(display.keys.stats())
+    print(cap.stats())
+    print(latency.stats())
     cap.release()
-    cv2.destroyAllWindows()
+    if show_preview:
+        cv2.destroyAllWindows()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -2,10 +2,20 @@ import mediapipe as mp
 import cv2
 import pygame
 import numpy as np
-from helpers import relative, relativeT
+from helpers import landmarks_to_array, POSE_POINTS, LEFT_PUPIL, RIGHT_PUPIL
+from head_pose import HeadPoseSolver, estimate_affine, gaze_directions
+from capture import FrameGrabber, FRAME_WAIT
+from renderer import EyeRenderer
+from key_map import KeyMap
+from latency import LatencyLog
+from pupil_filter import PupilFilter
+from profiling import PROFILER
+
+# The landmarks get_gaze_direction converts: the pose points, then both pupils
+GAZE_LANDMARKS = np.concatenate([POSE_POINTS, [LEFT_PUPIL, RIGHT_PUPIL]]).tolist()
 
 class EyeTracker:
-    def __init__(self):
+    def __init__(self, least_squares_affine=False):
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             max_num_faces=1,
@@ -14,76 +24,39 @@ class EyeTracker:
             min_tracking_confidence=0.75
         )
         
+        # Head pose with cached camera constants, warm-started between frames
+        self.pose_solver = HeadPoseSolver()
+        
+        # RANSAC affine fit by default; the least-squares fit is faster but changes the gaze (see head_pose.estimate_affine)
+        self.least_squares_affine = least_squares_affine
+        
     def get_gaze_direction(self, frame, points):
         """Modified gaze function that returns normalized gaze directions instead of drawing"""
-        # [Previous gaze calculation code remains the same until the final drawing section]
-        image_points = np.array([
-            relative(points.landmark[4], frame.shape),
-            relative(points.landmark[152], frame.shape),
-            relative(points.landmark[263], frame.shape),
-            relative(points.landmark[33], frame.shape),
-            relative(points.landmark[287], frame.shape),
-            relative(points.landmark[57], frame.shape)
-        ], dtype="double")
-
-        image_points1 = np.array([
-            relativeT(points.landmark[4], frame.shape),
-            relativeT(points.landmark[152], frame.shape),
-            relativeT(points.landmark[263], frame.shape),
-            relativeT(points.landmark[33], frame.shape),
-            relativeT(points.landmark[287], frame.shape),
-            relativeT(points.landmark[57], frame.shape)
-        ], dtype="double")
-
-        model_points = np.array([
-            (0.0, 0.0, 0.0),
-            (0, -63.6, -12.5),
-            (-43.3, 32.7, -26),
-            (43.3, 32.7, -26),
-            (-28.9, -28.9, -24.1),
-            (28.9, -28.9, -24.1)
-        ])
-
-        Eye_ball_center_right = np.array([[-29.05], [32.7], [-39.5]])
-        Eye_ball_center_left = np.array([[29.05], [32.7], [-39.5]])
-
-        focal_length = frame.shape[1]
-        center = (frame.shape[1] / 2, frame.shape[0] / 2)
-        camera_matrix = np.array(
-            [[focal_length, 0, center[0]],
-             [0, focal_length, center[1]],
-             [0, 0, 1]], dtype="double"
-        )
-
-        dist_coeffs = np.zeros((4, 1))
-        (success, rotation_vector, translation_vector) = cv2.solvePnP(model_points, image_points, camera_matrix,
-                                                                    dist_coeffs, flags=cv2.SOLVEPNP_ITERATIVE)
-
-        left_pupil = relative(points.landmark[468], frame.shape)
-        right_pupil = relative(points.landmark[473], frame.shape)
-
-        _, transformation, _ = cv2.estimateAffine3D(image_points1, model_points)
+        # Convert only the pose points and pupils to pixels
+        pixels = landmarks_to_array(points, frame.shape, GAZE_LANDMARKS)
+        image_points = pixels[:len(POSE_POINTS), :2]
+        pupils = pixels[len(POSE_POINTS):, :2]
+
+        # Camera constants are cached per resolution; the pose is warm-started from the last frame
+        camera_matrix, dist_coeffs = self.pose_solver.camera(frame.shape)
+        start = PROFILER.start()
+        rotation_vector, translation_vector = self.pose_solver.solve(image_points, frame.shape)
+        PROFILER.stop('solvePnP', start)
+        if rotation_vector is None:
+            return None, None
+
+        # Image-to-model affine map
+        start = PROFILER.start()
+        transformation = estimate_affine(image_points, self.least_squares_affine)
+        PROFILER.stop('estimateAffine3D', start)
 
         if transformation is not None:
-            # Calculate gaze directions for both eyes
-            pupil_world_cord_left = transformation @ np.array([[left_pupil[0], left_pupil[1], 0, 1]]).T
-            S_left = Eye_ball_center_left + (pupil_world_cord_left - Eye_ball_center_left) * 10
-            (eye_pupil2D_left, _) = cv2.projectPoints((int(S_left[0]), int(S_left[1]), int(S_left[2])), rotation_vector,
-                                                     translation_vector, camera_matrix, dist_coeffs)
-            (head_pose_left, _) = cv2.projectPoints((int(pupil_world_cord_left[0]), int(pupil_world_cord_left[1]), int(40)),
-                                                   rotation_vector, translation_vector, camera_matrix, dist_coeffs)
-            gaze_left = left_pupil + (eye_pupil2D_left[0][0] - left_pupil) - (head_pose_left[0][0] - left_pupil)
-
-            pupil_world_cord_right = transformation @ np.array([[right_pupil[0], right_pupil[1], 0, 1]]).T
-            S_right = Eye_ball_center_right + (pupil_world_cord_right - Eye_ball_center_right) * 10
-            (eye_pupil2D_right, _) = cv2.projectPoints((int(S_right[0]), int(S_right[1]), int(S_right[2])), rotation_vector,
-                                                      translation_vector, camera_matrix, dist_coeffs)
-            (head_pose_right, _) = cv2.projectPoints((int(pupil_world_cord_right[0]), int(pupil_world_cord_right[1]), int(40)),
-                                                    rotation_vector, translation_vector, camera_matrix, dist_coeffs)
-            gaze_right = right_pupil + (eye_pupil2D_right[0][0] - right_pupil) - (head_pose_right[0][0] - right_pupil)
+            # Calculate gaze directions for both eyes in one batch
+            gaze = gaze_directions(transformation, pupils, rotation_vector, translation_vector,
+                                   camera_matrix, dist_coeffs, frame.shape[1])
 
             # Return normalized gaze directions
-            return (gaze_left - left_pupil) / frame.shape[1], (gaze_right - right_pupil) / frame.shape[1]
+            return gaze[0], gaze[1]
         return None, None
 
 class EyeDisplay:
@@ -104,10 +77,22 @@ class EyeDisplay:
         self.left_pupil_pos = list(self.left_eye_pos)
         self.right_pupil_pos = list(self.right_eye_pos)
         
+        # Pre-render the static eyes once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        
+        # Keyboard actions, each run once per key press (and a full redraw when the window is exposed)
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        
         # For smooth movement
         self.target_left_pos = list(self.left_eye_pos)
         self.target_right_pos = list(self.right_eye_pos)
-        self.movement_speed = 0.2  # Adjust this to control movement speed (0-1)
+        # Time-based smoothing of the targets (see pupil_filter.py); no extrapolation, since the
+        # targets are discrete directions and every step would overshoot
+        self.left_filter = PupilFilter(max_lead=0.0)
+        self.right_filter = PupilFilter(max_lead=0.0)
 
     def interpret_gaze(self, left_gaze, right_gaze):
         """Convert detected gaze into mirrored eye positions"""
@@ -135,11 +120,6 @@ class EyeDisplay:
             
         return (x_direction, y_direction), (x_direction, y_direction)
 
-    def smooth_move(self, current_pos, target_pos):
-        """Smoothly interpolate between current and target position"""
-        return [current_pos[0] + (target_pos[0] - current_pos[0]) * self.movement_speed,
-                current_pos[1] + (target_pos[1] - current_pos[1]) * self.movement_speed]
-
     def update_pupils(self, left_gaze, right_gaze):
         # Get mirrored eye positions
         left_dir, right_dir = self.interpret_gaze(left_gaze, right_gaze)
@@ -155,76 +135,90 @@ class EyeDisplay:
         ]
         
         # Smoothly move towards target positions
-        self.left_pupil_pos = self.smooth_move(self.left_pupil_pos, self.target_left_pos)
-        self.right_pupil_pos = self.smooth_move(self.right_pupil_pos, self.target_right_pos)
+        self.left_pupil_pos = self.left_filter.update(self.target_left_pos)
+        self.right_pupil_pos = self.right_filter.update(self.target_right_pos)
 
     def draw(self):
-        self.screen.fill((0, 0, 0))
-        
-        # Draw eyes (white circles)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw pupils (black circles)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.left_pupil_pos[0]), int(self.left_pupil_pos[1])), 
-                         self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.right_pupil_pos[0]), int(self.right_pupil_pos[1])), 
-                         self.pupil_radius)
-        
-        pygame.display.update()
-
-def main():
-    # Initialize camera
-    cap = cv2.VideoCapture(0)
+        # Only the pupil areas are redrawn; nothing is drawn if the pupils did not move
+        start = PROFILER.start()
+        self.renderer.draw((self.left_pupil_pos, self.right_pupil_pos))
+        PROFILER.stop('draw', start)
+
+def main(cap=None, show_preview=True, recorder=None, latency=None):
+    # Capture camera frames on a background thread (a recording when replaying)
+    if cap is None:
+        cap = FrameGrabber(0)
+    cap.start()
     
     # Initialize our classes
     tracker = EyeTracker()
     display = EyeDisplay()
     
+    # Time every frame until the display update that shows its result
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+    
+    left_gaze, right_gaze = None, None  # Last detected gaze directions
     running = True
     while running and cap.isOpened():
-        # Process camera frame
-        success, frame = cap.read()
-        if not success:
-            print("Failed to get frame")
-            continue
+        # Wait for the next camera frame (None if none arrived within FRAME_WAIT)
+        captured = cap.read_latest(timeout=FRAME_WAIT)
+        if captured is not None:
+            latency.frame(captured)
+            frame = captured.frame
+            
+            # Convert frame for face mesh
+            frame.flags.writeable = False
+            start = PROFILER.start()
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            PROFILER.stop('cvtColor', start)
+            start = PROFILER.start()
+            results = tracker.face_mesh.process(frame)
+            PROFILER.stop('face_mesh.process', start)
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            
+            # Get gaze directions if face is detected
+            if results.multi_face_landmarks:
+                start = PROFILER.start()
+                left_gaze, right_gaze = tracker.get_gaze_direction(frame, results.multi_face_landmarks[0])
+                PROFILER.stop('gaze', start)
+            else:
+                # Return to center if no face detected
+                left_gaze, right_gaze = None, None
+                tracker.pose_solver.reset()
             
-        # Convert frame for face mesh
-        frame.flags.writeable = False
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = tracker.face_mesh.process(frame)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        
-        # Get gaze directions if face is detected
-        if results.multi_face_landmarks:
-            left_gaze, right_gaze = tracker.get_gaze_direction(frame, results.multi_face_landmarks[0])
-            display.update_pupils(left_gaze, right_gaze)
-        else:
-            # Return to center if no face detected
-            display.update_pupils(None, None)
+            # Show the camera feed (optional, for debugging)
+            if show_preview:
+                cv2.imshow('Camera Feed', frame)
+        
+        # Keep moving the pupils towards the last detection
+        display.update_pupils(left_gaze, right_gaze)
         
         # Draw the display
         display.draw()
         
-        # Show the camera feed (optional, for debugging)
-        cv2.imshow('Camera Feed', frame)
-        
-        # Check for quit events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                    
-        if cv2.waitKey(1) & 0xFF == 27:
+        # Record latency and pupil positions for replay runs
+        if recorder is not None and captured is not None:
+            recorder.record(captured, display.left_pupil_pos, display.right_pupil_pos)
+        
+        # Handle window and keyboard events
+        running = display.keys.handle()
+        
+        start = PROFILER.start()
+        if show_preview and cv2.waitKey(1) & 0xFF == 27:
             running = False
+        PROFILER.stop('waitKey', start)
     
     # Cleanup
+    PROFILER.dump()
+    print(display.keys.stats())
+    print(cap.stats())
+    print(latency.stats())
+    print(tracker.pose_solver.stats())
     cap.release()
-    cv2.destroyAllWindows()
+    if show_preview:
+        cv2.destroyAllWindows()
     pygame.quit()
 
 if __name__ == "__main__":
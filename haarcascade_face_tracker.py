@@ -1,16 +1,53 @@
+import argparse
 import cv2
 import pygame
 import time
+from capture import FrameGrabber, FRAME_WAIT
+from tracking import RoiFaceDetector, DetectionScheduler, MotionGate, load_cascade
+from renderer import EyeRenderer
+from audio_scheduler import AudioScheduler, init_mixer
+from key_map import KeyMap
+from latency import LatencyLog
+from frame_clock import QualityGovernor
+from pupil_filter import PupilFilter
+from profiling import PROFILER
 
 class EyeTracker:
     """
     Class responsible for face detection using OpenCV's Haarcascade classifier.
     This is a simpler alternative to MediaPipe, better suited for Raspberry Pi.
+    
+    Args:
+        cascade: 'haar', 'lbp' (OpenCV's LBP cascade) or a path to a cascade XML file
     """
-    def __init__(self):
+    def __init__(self, cascade='haar'):
         # Load the pre-trained face detection classifier
-        # Make sure this XML file is in the same directory as your script
-        self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+        # Make sure the XML file is in the same directory as your script
+        self.face_cascade = load_cascade(cascade)
+        
+        # Search around the last known face and only rescan the full frame after repeated misses
+        self.face_detector = RoiFaceDetector(self.face_cascade, scale_factor=1.3, min_neighbors=5)
+        
+        # Run the detector only every few frames and follow the face with optical flow in between
+        self.scheduler = DetectionScheduler()
+
+    def detect_face(self, gray, hint=None):
+        """
+        Run the face detector on a grayscale frame.
+        
+        Args:
+            gray: Grayscale frame
+            hint: Optional (x, y, w, h) box where the face is expected to be
+        
+        Returns:
+            The first detected (x, y, w, h) face box, or None if no face was found
+        """
+        faces = self.face_detector.detect(gray, hint)
+        return faces[0] if faces else None
+
+    def track_face(self, gray):
+        """Return the current (x, y, w, h) face box (detected or tracked), or None"""
+        return self.scheduler.update(gray, lambda hint: self.detect_face(gray, hint))
 
 class EyeDisplay:
     """
@@ -18,7 +55,8 @@ class EyeDisplay:
     and handling sound playback based on key inputs.
     """
     def __init__(self, width=800, height=480):
-        # Initialize Pygame for graphics and sound
+        # Initialize Pygame for graphics and sound (with a small mixer buffer for low sound latency)
+        init_mixer()
         pygame.init()
         pygame.mixer.init()
         self.width = width
@@ -37,10 +75,15 @@ class EyeDisplay:
         self.left_pupil_pos = list(self.left_eye_pos)  # Current position of left pupil
         self.right_pupil_pos = list(self.right_eye_pos)  # Current position of right pupil
         
+        # Pre-render the background and scleras once; each frame only the pupils are redrawn
+        self.renderer = EyeRenderer(self.screen, (self.left_eye_pos, self.right_eye_pos),
+                                    self.eye_radius, self.pupil_radius)
+        
         # Variables for smooth pupil movement
         self.target_left_pos = list(self.left_eye_pos)  # Target position for left pupil
         self.target_right_pos = list(self.right_eye_pos)  # Target position for right pupil
-        self.movement_speed = 0.3  # Speed of pupil movement (0-1)
+        self.left_filter = PupilFilter()   # Time-based smoothing of the targets (see pupil_filter.py)
+        self.right_filter = PupilFilter()
 
         # Manual control settings
         self.manual_control = False  # Flag for manual control mode
@@ -88,11 +131,19 @@ class EyeDisplay:
         """
         
         # Sound timing control variables
-        self.move_delay = 0.5  # Delay before movement starts
         self.sound_delay = 1.5  # Delay before sound plays
-        self.last_move_time = 0  # Timestamp of last movement
-        self.ready_for_sound = False  # Flag indicating sound can be played
-        self.selected_key = None  # Currently selected sound key
+        self.sound_scheduler = AudioScheduler()  # Plays each sound sound_delay after its key press
+        
+        # Keyboard actions, each run once per key press
+        self.keys = KeyMap(self.renderer)
+        self.keys.bind(pygame.K_ESCAPE, self.keys.stop)
+        self.keys.bind(pygame.K_p, lambda timestamp: PROFILER.dump())  # Print stage timings
+        self.keys.bind(pygame.K_LEFT, self.look, (-1, 0))              # Look left
+        self.keys.bind(pygame.K_RIGHT, self.look, (1, 0))              # Look right
+        self.keys.bind(pygame.K_UP, self.look, (0, 0))                 # Look straight ahead
+        self.keys.bind(pygame.K_DOWN, self.look, None)                 # Return to face tracking
+        for k in self.sounds.keys():
+            self.keys.bind(k, self.play_sound, k)
 
     def calculate_look_direction(self, face_position):
         """
@@ -122,65 +173,41 @@ class EyeDisplay:
         
         return (x_direction, y_direction), (x_direction, y_direction)
 
-    def smooth_move(self, current_pos, target_pos):
+    def look(self, direction, timestamp):
         """
-        Smoothly interpolate between current and target positions.
-        Creates more natural-looking eye movement.
+        Arrow key action: look in a fixed direction (manual mode).
         
         Args:
-            current_pos: Current position [x, y]
-            target_pos: Target position [x, y]
-        
-        Returns:
-            New position [x, y] part way between current and target
-        """
-        return [current_pos[0] + (target_pos[0] - current_pos[0]) * self.movement_speed,
-                current_pos[1] + (target_pos[1] - current_pos[1]) * self.movement_speed]
-
-    def handle_key_press(self):
-        """
-        Handle keyboard input for manual control and sound playback.
-        Arrow keys control manual mode and movement direction.
-        Number keys trigger sound playback.
+            direction: (x, y) direction vector, or None to return to face tracking
+            timestamp: time.monotonic() time of the key press
         """
-        current_time = time.time()
-        keys = pygame.key.get_pressed()
-        
-        # Handle arrow key controls for manual mode
-        if keys[pygame.K_LEFT]:
-            self.manual_control = True
-            self.manual_direction = (-1, 0)  # Look left
-        elif keys[pygame.K_RIGHT]:
-            self.manual_control = True
-            self.manual_direction = (1, 0)  # Look right
-        elif keys[pygame.K_DOWN]:
-            self.manual_control = False  # Return to face tracking
+        if direction is None:
+            self.manual_control = False
             self.manual_direction = (0, 0)
-        elif keys[pygame.K_UP]:
+        else:
             self.manual_control = True
-            self.manual_direction = (0, 0)  # Look straight ahead
-        
-        # Check for sound trigger keys (1-9)
-        for k in self.sounds.keys():
-            if keys[k] and current_time - self.last_move_time > self.move_delay:
-                self.last_move_time = current_time
-                self.ready_for_sound = True
-                self.selected_key = k
-                break
+            self.manual_direction = direction
 
-        # Play sound after specified delay
-        if self.ready_for_sound and current_time - self.last_move_time > self.sound_delay:
-            if self.selected_key and self.selected_key in self.sounds:
-                self.sounds[self.selected_key].play()
-            self.ready_for_sound = False
+    def play_sound(self, key, timestamp):
+        """
+        Number key action: play the key's sound sound_delay after the key press.
+        
+        Args:
+            key: pygame key code of the pressed number key
+            timestamp: time.monotonic() time of the key press
+        """
+        # Played at the exact time on the scheduler thread, independent of the frame rate
+        self.sound_scheduler.schedule(self.sounds[key], timestamp + self.sound_delay, key)
 
-    def update_pupils(self, face_position):
+    def update_pupils(self, face_position, timestamp=None):
         """
         Update pupil positions based on face position or manual control.
         
         Args:
             face_position: Tuple of (x, y) coordinates of face in normalized space (0-1)
                          or None if no face detected
+            timestamp: Capture time of the frame face_position was detected in; the
+                       pupils are extrapolated from it to now (ignored without a face)
         """
         # Get eye directions based on face position or manual control
         left_dir, right_dir = self.calculate_look_direction(face_position)
@@ -195,101 +222,141 @@ class EyeDisplay:
             self.right_eye_pos[1] + right_dir[1] * self.max_pupil_offset
         ]
         
-        # Smoothly move pupils towards target positions
-        self.left_pupil_pos = self.smooth_move(self.left_pupil_pos, self.target_left_pos)
-        self.right_pupil_pos = self.smooth_move(self.right_pupil_pos, self.target_right_pos)
+        # Smoothly move pupils towards target positions, making up for the measured capture-to-display latency
+        if face_position is None:
+            timestamp = None
+        latency = self.renderer.latency.recent() if self.renderer.latency is not None else None
+        self.left_pupil_pos = self.left_filter.update(self.target_left_pos, timestamp, latency=latency)
+        self.right_pupil_pos = self.right_filter.update(self.target_right_pos, timestamp, latency=latency)
 
     def draw(self):
-        """Draw the eyes and pupils on the screen"""
-        # Clear screen with black background
-        self.screen.fill((0, 0, 0))
-        
-        # Draw the white part of the eyes
-        pygame.draw.circle(self.screen, (255, 255, 255), self.left_eye_pos, self.eye_radius)
-        pygame.draw.circle(self.screen, (255, 255, 255), self.right_eye_pos, self.eye_radius)
-        
-        # Draw the black pupils
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.left_pupil_pos[0]), int(self.left_pupil_pos[1])), 
-                         self.pupil_radius)
-        pygame.draw.circle(self.screen, (0, 0, 0), 
-                         (int(self.right_pupil_pos[0]), int(self.right_pupil_pos[1])), 
-                         self.pupil_radius)
-        
-        # Update the display
-        pygame.display.update()
+        """Draw the pupils, updating only the parts of the screen that changed"""
+        start = PROFILER.start()
+        self.renderer.draw((self.left_pupil_pos, self.right_pupil_pos))
+        PROFILER.stop('draw', start)
 
-def main():
-    """Main program loop"""
-    # Initialize video capture from default camera (0)
-    cap = cv2.VideoCapture(0)
+def main(cap=None, show_preview=True, recorder=None, latency=None, cascade='haar'):
+    """
+    Main program loop.
+    
+    Args:
+        cap: FrameGrabber to read frames from (defaults to the camera 0)
+        show_preview: Show the camera feed in an OpenCV window
+        recorder: Optional replay.ReplayRecorder that records every processed frame
+        latency: Optional latency.LatencyLog for the capture-to-photon latency (a new one if None)
+        cascade: Face cascade, 'haar', 'lbp' or a path to a cascade XML file
+    """
+    # Capture frames from the default camera (0) on a background thread
+    if cap is None:
+        cap = FrameGrabber(0)
+    cap.start()
     
     # Initialize face tracking and display components
-    tracker = EyeTracker()
+    tracker = EyeTracker(cascade)
     display = EyeDisplay()
     
+    # Time every frame until the display update that shows its result
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+    
+    # Lower the detection quality when frames take longer than the camera's frame interval
+    quality = QualityGovernor(frame_budget=1.0 / 30)
+    
+    # Reuse the last face box while the scene does not change
+    motion_gate = MotionGate()
+    
+    face_position = None  # Last known face position, kept until a new frame arrives
+    face_time = None      # Capture time of the frame face_position was detected in
     running = True
     while running and cap.isOpened():
-        # Get a frame from the camera
-        success, frame = cap.read()
-        if not success:
-            print("Failed to get frame")
-            continue
-            
-        # Convert frame to grayscale for face detection
-        # Haarcascade works better with grayscale images
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces in the frame
-        # Parameters: image, scale factor, min neighbors
-        faces = tracker.face_cascade.detectMultiScale(gray, 1.3, 5)
-        
-        # Process detected faces
-        if len(faces) > 0 and not display.manual_control:
-            # Get the first face detected (largest if multiple)
-            (x, y, w, h) = faces[0]
+        # Wait for the next camera frame (None if none arrived within FRAME_WAIT)
+        captured = cap.read_latest(timeout=FRAME_WAIT)
+        if captured is not None:
+            latency.frame(captured)
+            frame_start = time.monotonic()
+            frame = captured.frame
             
-            # Calculate relative position of face center in frame
-            # Convert to normalized coordinates (0-1)
-            frame_height, frame_width = frame.shape[:2]
-            face_x = (x + w/2) / frame_width
-            face_y = (y + h/2) / frame_height
-            face_position = (face_x, face_y)
-            
-            # Update pupil positions based on face position
-            display.update_pupils(face_position)
+            # Only every few frames at reduced quality; otherwise keep the last face position
+            if quality.detection_due():
+                # Convert frame to grayscale for face detection
+                # Haarcascade works better with grayscale images
+                start = PROFILER.start()
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                PROFILER.stop('cvtColor', start)
+                
+                # Detect on a downscaled copy when the quality governor asks for it
+                start = PROFILER.start()
+                small = quality.resize(gray)
+                PROFILER.stop('resize', start)
+                
+                # Detect or track the face in the frame (or keep the last box if nothing moved)
+                face = tracker.track_face(small) if motion_gate.changed(small) else tracker.scheduler.box
+                
+                # Process detected face
+                if face is not None:
+                    # Calculate relative position of face center in frame
+                    # Convert to normalized coordinates (0-1)
+                    x, y, w, h = face
+                    small_height, small_width = small.shape[:2]
+                    face_position = ((x + w/2) / small_width, (y + h/2) / small_height)
+                    face_time = captured.timestamp
+                    
+                    # Draw rectangle around detected face (useful for debugging)
+                    (x, y, w, h) = [int(v / quality.level.scale) for v in face]
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 255, 0), 2)
+                else:
+                    face_position = None
             
-            # Draw rectangle around detected face (useful for debugging)
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 255, 0), 2)
-        else:
-            # No face detected or in manual mode
-            display.update_pupils(None)
+            # Show the camera feed (useful for debugging)
+            if show_preview:
+                cv2.imshow('Camera Feed', frame)
+        
+        # Update pupil positions based on face position (or look ahead if none / manual mode)
+        display.update_pupils(None if display.manual_control else face_position, face_time)
         
         # Handle keyboard input and sounds
-        display.handle_key_press()
+        running = display.keys.handle()
         
         # Update the display
         display.draw()
         
-        # Show the camera feed (useful for debugging)
-        cv2.imshow('Camera Feed', frame)
+        # Record latency and pupil positions for replay runs
+        if recorder is not None and captured is not None:
+            recorder.record(captured, display.left_pupil_pos, display.right_pupil_pos)
         
-        # Check for quit events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    running = False
-                    
         # Check for escape key press
-        if cv2.waitKey(1) & 0xFF == 27:
+        start = PROFILER.start()
+        if show_preview and cv2.waitKey(1) & 0xFF == 27:
             running = False
+        PROFILER.stop('waitKey', start)
+        
+        # Adjust the detection quality to the time this frame took
+        if captured is not None and quality.update(time.monotonic() - frame_start):
+            # Boxes and tracked points are in the old scale - start over at the new one
+            tracker.face_detector.reset()
+            tracker.face_detector.scale_factor = quality.level.scale_factor
+            tracker.scheduler.reset()
+            motion_gate.reset()
     
     # Cleanup resources
+    PROFILER.dump()
+    print(display.keys.stats())
+    display.sound_scheduler.close()
+    print(display.sound_scheduler.stats())
+    print(cap.stats())
+    print(latency.stats())
+    print(tracker.face_detector.stats())
+    print(tracker.scheduler.stats())
+    print(quality.stats())
+    print(motion_gate.stats())
     cap.release()
-    cv2.destroyAllWindows()
+    if show_preview:
+        cv2.destroyAllWindows()
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Eye display that follows the face found by a cascade detector")
+    parser.add_argument('--cascade', default='haar', help="Face cascade: 'haar', 'lbp' or a path to an XML file")
+    args = parser.parse_args()
+    main(cascade=args.cascade)
\ No newline at end of file
@@ -1,2 +1,27 @@
-relative = lambda landmark, shape: (int(landmark.x * shape[1]), int(landmark.y * shape[0]))
-relativeT = lambda landmark, shape: (int(landmark.x * shape[1]), int(landmark.y * shape[0]), 0)
+import numpy as np
+
+# FaceMesh landmark indices (refine_landmarks=True adds the iris points 468-477)
+POSE_POINTS = np.array([4, 152, 263, 33, 287, 57])  # Nose tip, chin, eye outer corners, mouth corners
+LEFT_PUPIL = 468
+RIGHT_PUPIL = 473
+LEFT_IRIS = np.array([469, 470, 471, 472])
+RIGHT_IRIS = np.array([474, 475, 476, 477])
+EYE_LIDS = np.array([386, 374, 159, 145])  # Left upper/lower lid, right upper/lower lid
+
+def landmarks_to_array(face_landmarks, shape, indices=None):
+    """
+    Convert FaceMesh landmarks to one contiguous (N, 3) float array in pixels.
+    x and z are scaled by the frame width and y by the frame height, so every
+    consumer can use slices instead of per-landmark attribute lookups.
+
+    With `indices`, only those landmarks are converted (row i is landmark
+    indices[i]). The per-landmark attribute lookups are the whole cost, so
+    callers should pass the dozen or so they use instead of converting all 478.
+    """
+    landmark = face_landmarks.landmark
+    if indices is None:
+        points = np.array([(p.x, p.y, p.z) for p in landmark])
+    else:
+        points = np.array([(landmark[i].x, landmark[i].y, landmark[i].z) for i in indices])
+    points *= (shape[1], shape[0], shape[1])
+    return points
@@ -0,0 +1,90 @@
+import time
+
+import pygame
+
+from renderer import REDRAW_EVENTS
+
+# Commands injected from other threads (see control_server.py). Attributes:
+#   key:       key code or action name to dispatch, as with a key press
+#   timestamp: time.monotonic() when the command was received
+#   ack:       called as ack(dispatch_time, handled) on the main thread after the action ran
+CONTROL_EVENT = pygame.event.custom_type()
+
+
+class KeyMap:
+    """
+    Event-driven keyboard input: a table from key codes to actions, built
+    once, through which every KEYDOWN event is dispatched exactly once.
+
+    Keys are not polled with pygame.key.get_pressed(), so a held key fires
+    once and a short press between two frames is not missed. Events are
+    stamped with time.monotonic() when they are taken from the queue (pygame
+    does not expose SDL's event time), which is at most one loop iteration
+    after the key press. Every action is called with that time stamp as its
+    last argument, so delays scheduled from it do not depend on the loop rate.
+
+    CONTROL_EVENTs posted by other threads are dispatched the same way, but
+    keep the time stamp of when the command was received. Actions that have
+    no key are bound by name (e.g. 'record_start') and are only reachable
+    through these events.
+
+    If `renderer` is given, it is invalidated whenever the window was exposed
+    or resized, so the next frame redraws all of it instead of only the
+    pupils (the dirty rectangles would leave the uncovered parts stale).
+    """
+    def __init__(self, renderer=None):
+        self.actions = {}     # key -> (action, extra arguments)
+        self.running = True   # False once the window was closed or stop() was called
+        self.renderer = renderer
+
+        # Statistics
+        self.dispatched = 0   # Key presses that ran an action
+        self.ignored = 0      # Key presses without an action
+        self.commands = 0     # Of those, injected as CONTROL_EVENTs
+
+    def bind(self, key, action, *args):
+        """Run action(*args, timestamp) whenever `key` is pressed (replaces an earlier binding)"""
+        self.actions[key] = (action, args)
+
+    def stop(self, timestamp=None):
+        """Action that ends the main loop"""
+        self.running = False
+
+    def dispatch(self, key, timestamp):
+        """Run the action bound to a key. Returns False if the key has none."""
+        entry = self.actions.get(key)
+        if entry is None:
+            self.ignored += 1
+            return False
+        action, args = entry
+        action(*args, timestamp)
+        self.dispatched += 1
+        return True
+
+    def handle(self):
+        """
+        Dispatch all queued key presses and handle window close and expose events.
+
+        Returns:
+            False once the program should quit, True otherwise
+        """
+        events = pygame.event.get()
+        now = time.monotonic()
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                self.dispatch(event.key, now)
+            elif event.type in REDRAW_EVENTS:
+                if self.renderer is not None:
+                    self.renderer.invalidate()
+            elif event.type == CONTROL_EVENT:
+                self.commands += 1
+                handled = self.dispatch(event.key, event.timestamp)
+                event.ack(time.monotonic(), handled)
+        return self.running
+
+    def stats(self):
+        """Return a one-line summary of the key presses"""
+        return (f"Input: {self.dispatched} key presses handled, {self.ignored} without an action "
+                f"({self.commands} from the control channel)")
@@ -0,0 +1,175 @@
+"""
+Capture-to-photon latency: the time from cap.read() returning a camera frame
+to the pygame.display.update() that first shows the pupils moved by it.
+
+The tracking loop tells its LatencyLog which camera frame it has just
+processed (frame()); the EyeRenderer reports every display update
+(displayed()) and every frame in which the pupils did not move (unchanged()).
+
+When the capture backend reports CAP_PROP_POS_MSEC on the monotonic clock
+(e.g. V4L2 buffer time stamps), the latency from the driver's time stamp is
+recorded as well, which includes the time the frame spent in the driver.
+
+Self-test without camera or window (e.g. in CI): runs an entry point on a
+synthetic moving face at 30 fps and prints the latency distribution.
+
+Usage:
+    python latency.py [haarcascade_face_tracker] [--csv latency.csv] [--max-p95 100]
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+# Driver time stamps within this many seconds of the read time are taken to be on the monotonic clock
+DRIVER_CLOCK_TOLERANCE = 1.0
+
+
+class LatencyLog:
+    """
+    Records the capture-to-photon latency of every camera frame that moved the
+    pupils on screen.
+    """
+    def __init__(self):
+        self._pending = None  # CapturedFrame processed but not yet shown
+
+        # Per shown frame
+        self.seqs = []
+        self.capture_times = []  # time.monotonic() when cap.read() returned
+        self.position_ms = []    # CAP_PROP_POS_MSEC of the frame
+        self.display_times = []  # time.monotonic() after pygame.display.update()
+
+        # Statistics
+        self.frames_superseded = 0  # Replaced by a newer frame before the display was updated
+        self.frames_unchanged = 0   # Processed without moving the pupils
+
+    def frame(self, captured):
+        """Mark a capture.CapturedFrame as processed; its latency is recorded at the next display update"""
+        if self._pending is not None:
+            self.frames_superseded += 1
+        self._pending = captured
+
+    def unchanged(self):
+        """The pupils did not move this frame, so the pending frame will never show"""
+        if self._pending is not None:
+            self.frames_unchanged += 1
+            self._pending = None
+
+    def displayed(self, update_time):
+        """Record the latency of the pending frame, shown by a display update at `update_time`"""
+        captured = self._pending
+        if captured is None:
+            return
+        self._pending = None
+        self.seqs.append(captured.seq)
+        self.capture_times.append(captured.timestamp)
+        self.position_ms.append(captured.position_ms)
+        self.display_times.append(update_time)
+
+    def latencies(self):
+        """Capture-to-photon latencies in seconds"""
+        return np.array(self.display_times) - np.array(self.capture_times)
+
+    def recent(self, frames=30):
+        """Median latency in seconds of the last `frames` shown frames, None before the first one"""
+        if not self.display_times:
+            return None
+        return float(np.median(np.subtract(self.display_times[-frames:], self.capture_times[-frames:])))
+
+    def driver_latencies(self):
+        """Latencies from the driver's time stamp in seconds (empty if the backend has none on the monotonic clock)"""
+        driver_times = np.array(self.position_ms) / 1000.0
+        on_clock = np.abs(driver_times - np.array(self.capture_times)) < DRIVER_CLOCK_TOLERANCE
+        return np.array(self.display_times)[on_clock] - driver_times[on_clock]
+
+    def summary(self):
+        """Return a dictionary with the frame counts and latency percentiles in milliseconds"""
+        latencies_ms = self.latencies() * 1000.0
+        summary = {
+            'frames': len(latencies_ms),
+            'frames_superseded': self.frames_superseded,
+            'frames_unchanged': self.frames_unchanged,
+        }
+        if len(latencies_ms):
+            summary.update({
+                'latency_mean_ms': float(latencies_ms.mean()),
+                'latency_p50_ms': float(np.percentile(latencies_ms, 50)),
+                'latency_p95_ms': float(np.percentile(latencies_ms, 95)),
+                'latency_p99_ms': float(np.percentile(latencies_ms, 99)),
+                'latency_max_ms': float(latencies_ms.max()),
+            })
+        driver_ms = self.driver_latencies() * 1000.0
+        if len(driver_ms):
+            summary['driver_latency_mean_ms'] = float(driver_ms.mean())
+            summary['driver_latency_p95_ms'] = float(np.percentile(driver_ms, 95))
+        return summary
+
+    def stats(self):
+        """Return a one-line summary of the latency"""
+        summary = self.summary()
+        if not summary['frames']:
+            return "Capture-to-photon latency: no frames shown"
+        line = (f"Capture-to-photon latency over {summary['frames']} frames: mean {summary['latency_mean_ms']:.1f} ms, "
+                f"p50 {summary['latency_p50_ms']:.1f} ms, p95 {summary['latency_p95_ms']:.1f} ms, "
+                f"max {summary['latency_max_ms']:.1f} ms")
+        if 'driver_latency_mean_ms' in summary:
+            line += f" (from driver time stamp: mean {summary['driver_latency_mean_ms']:.1f} ms)"
+        return line
+
+    def save(self, path):
+        """Write one CSV row per shown frame"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['seq', 'capture_timestamp', 'position_ms', 'display_timestamp', 'latency_ms'])
+            for seq, capture_time, position_ms, display_time in zip(self.seqs, self.capture_times,
+                                                                    self.position_ms, self.display_times):
+                writer.writerow([seq, f"{capture_time:.6f}", f"{position_ms:.3f}", f"{display_time:.6f}",
+                                 f"{(display_time - capture_time) * 1000.0:.3f}"])
+
+
+def histogram(latencies_ms, bin_ms=5.0, width=40):
+    """Return text lines of a histogram of latencies"""
+    if len(latencies_ms) == 0:
+        return []
+    edges = np.arange(0.0, latencies_ms.max() + bin_ms, bin_ms)
+    counts, edges = np.histogram(latencies_ms, bins=edges)
+    scale = width / counts.max()
+    return [f"{low:6.0f}-{high:<4.0f} ms {count:5d} {'#' * int(round(count * scale))}"
+            for low, high, count in zip(edges[:-1], edges[1:], counts) if count]
+
+
+def main():
+    # Imported here: replay sets up pygame without a window or sound card before anything initializes it
+    from capture import SYNTHETIC_SOURCE
+    from replay import ENTRY_POINTS, run_replay
+
+    parser = argparse.ArgumentParser(description="Measure capture-to-photon latency on a synthetic moving face")
+    parser.add_argument('entry', nargs='?', default='haarcascade_face_tracker', choices=ENTRY_POINTS,
+                        help="Tracker entry point to run")
+    parser.add_argument('--csv', help="Write the per-frame latencies to this CSV file")
+    parser.add_argument('--max-p95', type=float, help="Exit with status 1 if the p95 latency exceeds this (ms)")
+    args = parser.parse_args()
+
+    latency = LatencyLog()
+    run_replay(args.entry, SYNTHETIC_SOURCE, realtime=True, latency=latency)
+    summary = latency.summary()
+    print(latency.stats())
+    print(f"{summary['frames_superseded']} frames superseded before display, "
+          f"{summary['frames_unchanged']} did not move the pupils")
+    for line in histogram(latency.latencies() * 1000.0):
+        print(line)
+    if args.csv:
+        latency.save(args.csv)
+        print(f"Per-frame latencies written to {args.csv}")
+
+    if not summary['frames']:
+        print("FAIL: no frame reached the display")
+        sys.exit(1)
+    if args.max_p95 is not None and summary['latency_p95_ms'] > args.max_p95:
+        print(f"FAIL: p95 latency {summary['latency_p95_ms']:.1f} ms exceeds {args.max_p95:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
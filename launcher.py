@@ -0,0 +1,108 @@
+"""
+Single entry point for the eye display with a selectable detector backend.
+
+Only the chosen backend's modules are imported, so the Haar and LBP
+configurations start without loading MediaPipe.
+
+Usage:
+    python launcher.py --backend haar
+    python launcher.py --backend gaze --no-preview
+"""
+import argparse
+import time
+
+from backends import BACKENDS, create_backend
+
+
+def main(backend='haar', cap=None, show_preview=True, recorder=None, latency=None):
+    """
+    Run the eye display driven by a detector backend.
+
+    Args:
+        backend: Backend name from backends.BACKENDS
+        cap: FrameGrabber to read frames from (defaults to the camera 0)
+        show_preview: Show the camera feed in an OpenCV window
+        recorder: Optional replay.ReplayRecorder that records every processed frame
+        latency: Optional latency.LatencyLog for the capture-to-photon latency (a new one if None)
+    """
+    start_time = time.perf_counter()
+    detector = create_backend(backend)
+
+    import cv2
+    import pygame
+    from capture import FrameGrabber, FRAME_WAIT
+    from haarcascade_face_tracker import EyeDisplay
+    from latency import LatencyLog
+    from profiling import PROFILER
+
+    # Capture frames from the default camera (0) on a background thread
+    if cap is None:
+        cap = FrameGrabber(0)
+    cap.start()
+
+    display = EyeDisplay()
+    print(f"Backend '{backend}' ready in {time.perf_counter() - start_time:.2f} s")
+
+    # Time every frame until the display update that shows its result
+    if latency is None:
+        latency = LatencyLog()
+    display.renderer.latency = latency
+
+    look_target = None  # Last look target, kept until a new frame arrives
+    target_time = None  # Capture time of the frame look_target was found in
+    running = True
+    while running and cap.isOpened():
+        # Wait for the next camera frame (None if none arrived within FRAME_WAIT)
+        captured = cap.read_latest(timeout=FRAME_WAIT)
+        if captured is not None:
+            latency.frame(captured)
+            start = PROFILER.start()
+            look_target = detector.locate(captured.frame)
+            target_time = captured.timestamp
+            PROFILER.stop('locate', start)
+
+            # Show the camera feed (useful for debugging)
+            if show_preview:
+                cv2.imshow('Camera Feed', captured.frame)
+
+        # Update pupil positions based on the look target (or look ahead if none / manual mode)
+        display.update_pupils(None if display.manual_control else look_target, target_time)
+
+        # Handle keyboard input and sounds
+        running = display.keys.handle()
+
+        # Update the display
+        display.draw()
+
+        # Record latency and pupil positions for replay runs
+        if recorder is not None and captured is not None:
+            recorder.record(captured, display.left_pupil_pos, display.right_pupil_pos)
+
+        # Check for escape key press
+        start = PROFILER.start()
+        if show_preview and cv2.waitKey(1) & 0xFF == 27:
+            running = False
+        PROFILER.stop('waitKey', start)
+
+    # Cleanup resources
+    PROFILER.dump()
+    print(display.keys.stats())
+    display.sound_scheduler.close()
+    print(display.sound_scheduler.stats())
+    print(cap.stats())
+    print(latency.stats())
+    for line in detector.stats():
+        print(line)
+    cap.release()
+    if show_preview:
+        cv2.destroyAllWindows()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Eye display with a selectable detector backend")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='haar',
+                        help="haar/lbp: OpenCV face cascade, nose/iris/gaze: MediaPipe FaceMesh")
+    parser.add_argument('--no-preview', action='store_true', help="Do not show the camera feed")
+    args = parser.parse_args()
+    main(backend=args.backend, show_preview=not args.no_preview)
@@ -1,7 +1,12 @@
 import pygame
 import time
 import math
+from renderer import EyeRenderer
+from frame_clock import LoopGovernor
+from key_map import KeyMap
+from audio_scheduler import AudioScheduler, init_mixer
 
+init_mixer()  # Small mixer buffer for low sound latency; before pygame.init()
 pygame.init()
 pygame.mixer.init()
 
@@ -10,9 +15,16 @@ SCREEN_HEIGHT = 480
 
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
+# Run the loop at a fixed rate instead of as fast as possible
+RENDER_FPS = 60
+governor = LoopGovernor(render_fps=RENDER_FPS)
+
 eyes = pygame.Rect(217,240,140,140) # (x,y,width,height)
 pupil = pygame.Rect(217,240,40,40)
 
+# Pre-render the background and the 2 white circles (eyes) once; only the pupils are redrawn each frame
+renderer = EyeRenderer(screen, ((eyes.x + 0, eyes.y + 0), (eyes.x + 375, eyes.y + 0)), 140, 40)
+
 """ 
 list of all the positions within the eye
 (eyes.x + 0, eyes.y + 0),     # Center
@@ -52,13 +64,12 @@ sounds = {
     pygame.K_9: pygame.mixer.Sound('sounds_preset/Favorite way to relax.mp3'),
 }
 
-# Initialize variables for delays and timing
-move_delay = 0.5         # Delay before moving eyes
-sound_delay = 1.5        # Additional delay after moving before sound plays
-last_move_time = time.time()
-last_interaction_time = time.time()
-ready_for_sound = False  # Tracks if sound is ready to play
-selected_key = None      # Track which key was last pressed
+# Initialize variables for delays and timing (time.monotonic() seconds)
+sound_delay = 1.5        # Delay after moving before sound plays
+last_interaction_time = time.monotonic()
+
+# Plays each sound sound_delay after its key press, on its own thread
+sound_scheduler = AudioScheduler()
 
 # Idle animation parameters
 IDLE_DELAY = 5.0         # Time in seconds before idle animation starts
@@ -72,10 +83,23 @@ def get_idle_offset(current_time):
     offset_y = IDLE_RADIUS * math.sin(angle)
     return offset_x, offset_y
 
+def move_to(key, timestamp):
+    """Number key: move the pupils to the key's position and play its sound sound_delay after the press"""
+    global last_interaction_time
+    pupil.x, pupil.y = pupil_positions[key]  # Update pupil position
+    last_interaction_time = timestamp        # Reset idle timer
+    if key in sounds:
+        sound_scheduler.schedule(sounds[key], timestamp + sound_delay, key)
+
+# Keyboard actions, each run once per key press (and a full redraw when the window is exposed)
+keys = KeyMap(renderer)
+keys.bind(pygame.K_ESCAPE, keys.stop)
+for k in pupil_positions:
+    keys.bind(k, move_to, k)
+
 running = True
 while running:
-    current_time = time.time()
-    screen.fill((0,0,0))
+    current_time = time.monotonic()
 
     # Handle idle animation when no interaction has occurred recently
     time_since_interaction = current_time - last_interaction_time
@@ -87,42 +111,17 @@ while running:
         current_x = pupil.x
         current_y = pupil.y
     
-    # Draw 2 white circles (eyes)
-    pygame.draw.circle(screen, (255,255,255), (eyes.x + 0, eyes.y + 0), 140) # (x,y) is the center of the circle
-    pygame.draw.circle(screen, (255,255,255), (eyes.x + 375, eyes.y + 0), 140)
-
-    # Draw 2 black circles (pupils) within the white circles
-    pygame.draw.circle(screen, (0,0,0), (current_x + 0, current_y + 0), 40)
-    pygame.draw.circle(screen, (0,0,0), (current_x + 375, current_y + 0), 40)
+    # Draw 2 black circles (pupils) within the white circles; only the changed areas are updated
+    renderer.draw(((current_x + 0, current_y + 0), (current_x + 375, current_y + 0)))
 
-    # Check for key presses and update pupil position
-    key = pygame.key.get_pressed()
-    
-    for k in pupil_positions:
-        if key[k]:  # If a specific key is pressed
-            new_x, new_y = pupil_positions[k]
-            if current_time - last_move_time > move_delay:
-                pupil.x, pupil.y = new_x, new_y  # Update pupil position
-                last_move_time = current_time  # Reset the last move time
-                last_interaction_time = current_time  # Reset idle timer
-                ready_for_sound = True  # Enable sound delay
-                selected_key = k  # Track which sound to play
-                break
-
-    # Play sound after the additional sound delay if movement occurred
-    if ready_for_sound and current_time - last_move_time > sound_delay:
-        if selected_key and selected_key in sounds:
-            sounds[selected_key].play()
-        ready_for_sound = False
-    
-    # Handle window events
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                running = False
+    # Handle window events and key presses
+    running = keys.handle()
 
-    pygame.display.update()
+    # Sleep until the next frame is due
+    governor.tick()
 
+print(governor.stats())
+print(keys.stats())
+sound_scheduler.close()
+print(sound_scheduler.stats())
 pygame.quit()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import os
+import time
+
+import numpy as np
+
+
+class StageProfiler:
+    """
+    Low-overhead timer for the stages of the tracking loop.
+
+    Each stage keeps its most recent durations in a fixed-size ring array, from
+    which p50/p95/p99 are computed on demand. Usage:
+
+        start = PROFILER.start()
+        faces = cascade.detectMultiScale(gray, 1.3, 5)
+        PROFILER.stop('detectMultiScale', start)
+
+    When disabled, start() and stop() return immediately without reading the
+    clock, so the instrumentation can stay in the hot loop.
+    """
+    def __init__(self, enabled=False, window=1024):
+        self.enabled = enabled
+        self.window = window  # Number of recent samples kept per stage
+        self._samples = {}    # stage -> ring array of durations in seconds
+        self._counts = {}     # stage -> total number of samples recorded
+
+    def start(self):
+        """Return a start timestamp (0.0 when disabled)"""
+        if not self.enabled:
+            return 0.0
+        return time.perf_counter()
+
+    def stop(self, stage, start):
+        """Record the time elapsed since `start` for a stage"""
+        if not self.enabled:
+            return
+        elapsed = time.perf_counter() - start
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = np.zeros(self.window)
+            self._counts[stage] = 0
+        count = self._counts[stage]
+        samples[count % self.window] = elapsed
+        self._counts[stage] = count + 1
+
+    def percentiles(self, stage):
+        """Return (p50, p95, p99) of the recent durations of a stage in milliseconds"""
+        count = min(self._counts.get(stage, 0), self.window)
+        if count == 0:
+            return 0.0, 0.0, 0.0
+        p50, p95, p99 = np.percentile(self._samples[stage][:count], [50, 95, 99]) * 1000.0
+        return p50, p95, p99
+
+    def report(self):
+        """Return a table of per-stage timings as a string"""
+        lines = [f"{'stage':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for stage in sorted(self._samples):
+            p50, p95, p99 = self.percentiles(stage)
+            lines.append(f"{stage:<20}{self._counts[stage]:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """Print the timing table (does nothing when disabled)"""
+        if self.enabled and self._samples:
+            print(self.report())
+
+
+# Shared profiler for all loops; enable with the environment variable EYE_PROFILE=1
+PROFILER = StageProfiler(enabled=os.environ.get('EYE_PROFILE') == '1')
@@ -0,0 +1,126 @@
+import math
+import time
+
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez, Roussel and Vogel, CHI 2012) for a 2D point.
+
+    A low-pass filter whose cutoff frequency rises with the filtered speed:
+    at rest the cutoff is `min_cutoff` (Hz), removing jitter, and for fast
+    movements it grows by `beta` per unit of speed, removing lag. All time
+    constants are in seconds, so the result does not depend on the call rate.
+    Gaps longer than `max_dt` (e.g. while no face was seen) count as `max_dt`,
+    so the first value after a gap is still smoothed instead of jumped to.
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.02, d_cutoff=0.5, max_dt=0.1):
+        self.min_cutoff = min_cutoff  # Cutoff at rest (Hz)
+        self.beta = beta              # Cutoff increase per unit/s of speed
+        self.d_cutoff = d_cutoff      # Cutoff for the speed estimate (Hz)
+        self.max_dt = max_dt          # Longest time step (s)
+        self.reset()
+
+    def reset(self, value=None, timestamp=None):
+        """Start over at `value` (taken at `timestamp`), or pass the next value through unfiltered if None"""
+        self.value = None if value is None else (float(value[0]), float(value[1]))  # Filtered (x, y)
+        self.velocity = (0.0, 0.0)  # Filtered speed (x, y) in units per second
+        self.timestamp = timestamp
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def filter(self, value, timestamp):
+        """Filter a new (x, y) measurement taken at `timestamp` (seconds) and return the filtered (x, y)"""
+        if self.value is None:
+            self.value = (float(value[0]), float(value[1]))
+            self.timestamp = timestamp
+            return self.value
+
+        dt = min(max(timestamp - self.timestamp, 1e-3), self.max_dt)
+        self.timestamp = max(timestamp, self.timestamp)
+
+        # Filter the speed first, then use it to choose the cutoff for the position
+        a_d = self._alpha(self.d_cutoff, dt)
+        vx = self.velocity[0] + a_d * ((value[0] - self.value[0]) / dt - self.velocity[0])
+        vy = self.velocity[1] + a_d * ((value[1] - self.value[1]) / dt - self.velocity[1])
+        self.velocity = (vx, vy)
+
+        a = self._alpha(self.min_cutoff + self.beta * math.hypot(vx, vy), dt)
+        self.value = (self.value[0] + a * (value[0] - self.value[0]),
+                      self.value[1] + a * (value[1] - self.value[1]))
+        return self.value
+
+
+class PupilFilter:
+    """
+    Time-based smoothing of the pupil targets, in place of a fixed lerp per loop iteration.
+
+    Each new target (in display pixels) is One Euro filtered at the time its
+    camera frame was captured. To make up for the capture-to-display latency,
+    the filtered position is extrapolated along the filtered velocity to when
+    it will be shown: the capture time plus the measured latency passed to
+    update() (e.g. LatencyLog.recent()), or the current time if that is later,
+    by at most `max_lead` seconds.
+
+    Call update() once per loop iteration with the current target and the
+    capture timestamp (time.monotonic) of the frame it came from; repeated
+    calls with the same timestamp only extrapolate. Targets without a frame
+    (manual control, looking ahead with no face) pass timestamp=None and are
+    smoothed at the loop's own times without extrapolation.
+
+    This trades jitter for lag: with 60 ms latency, bench_filters.py shows the
+    defaults at about half the old lerp's lag at 30 and 60 Hz (84 and 74 ms
+    against 178 and 126 ms) and 30% less at 144 Hz, with jitter of 1.8-1.9 px
+    against the lerp's 1.0-1.5 px. A lower `d_cutoff` or `max_lead` steadies
+    the pupils at the cost of lag.
+    """
+    def __init__(self, min_cutoff=1.0, beta=0.02, d_cutoff=0.5, max_lead=0.1):
+        self.max_lead = max_lead  # Longest extrapolation in seconds
+        self.one_euro = OneEuroFilter(min_cutoff, beta, d_cutoff)
+        self.last_measurement = None  # Timestamp of the last measurement that was filtered
+        self.extrapolate = False      # Whether the last measurement came from a camera frame
+
+    def reset(self, position=None, now=None):
+        """
+        Start over, at rest at `position` (e.g. the pupil's current position) if given,
+        otherwise at the next target.
+        """
+        now = time.monotonic() if now is None else now
+        self.one_euro.reset(position, now if position is not None else None)
+        self.last_measurement = now if position is not None else None
+        self.extrapolate = False
+
+    def update(self, target, timestamp=None, now=None, latency=None):
+        """
+        Feed the current target and return the pupil position to draw.
+
+        Args:
+            target: Target (x, y) in display pixels
+            timestamp: Capture time of the frame the target was computed from, None if not from a frame
+            now: Current time (defaults to time.monotonic())
+            latency: Measured capture-to-display latency in seconds (e.g. LatencyLog.recent()), None if unknown
+        Returns:
+            [x, y] position to draw
+        """
+        now = time.monotonic() if now is None else now
+        if timestamp is None:
+            timestamp = now
+            self.extrapolate = False
+        elif timestamp != self.last_measurement:
+            self.extrapolate = True
+
+        if timestamp != self.last_measurement:
+            self.one_euro.filter(target, timestamp)
+            self.last_measurement = timestamp
+
+        x, y = self.one_euro.value
+        if self.extrapolate:
+            # Aim at when this position will be on screen: the frame's capture time plus the
+            # measured latency, or later if the loop is still showing the same frame
+            lead = max(now - self.last_measurement, latency or 0.0)
+            lead = min(max(lead, 0.0), self.max_lead)
+            x += self.one_euro.velocity[0] * lead
+            y += self.one_euro.velocity[1] * lead
+        return [x, y]
@@ -0,0 +1,97 @@
+import time
+
+import pygame
+
+# Window events after which the whole window has to be redrawn (it was uncovered or resized)
+REDRAW_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED)
+
+
+class EyeRenderer:
+    """
+    Draws the eyes using dirty rectangles instead of redrawing the whole screen.
+
+    The black background and the white scleras are rendered once into a cached
+    surface. Each frame only the areas under the old and new pupil positions
+    are restored from that cache, the pre-rendered pupil is blitted on top,
+    and only those rectangles are passed to pygame.display.update(). If the
+    rounded pupil positions have not changed, nothing is drawn at all.
+
+    If `latency` is set to a latency.LatencyLog, it is told the time of every
+    display update, which closes the capture-to-photon measurement.
+    """
+    def __init__(self, screen, eye_positions, eye_radius, pupil_radius,
+                 background_color=(0, 0, 0), sclera_color=(255, 255, 255), pupil_color=(0, 0, 0)):
+        self.screen = screen
+        self.pupil_radius = pupil_radius
+
+        # Static layer: background and scleras
+        self.background = pygame.Surface(screen.get_size()).convert()
+        self.background.fill(background_color)
+        for eye_pos in eye_positions:
+            pygame.draw.circle(self.background, sclera_color, eye_pos, eye_radius)
+
+        # Pupil sprite; everything around the circle is transparent via the colorkey
+        transparent = (255, 0, 255)
+        size = 2 * pupil_radius + 2
+        self.pupil = pygame.Surface((size, size)).convert()
+        self.pupil.fill(transparent)
+        self.pupil.set_colorkey(transparent)
+        pygame.draw.circle(self.pupil, pupil_color, (pupil_radius + 1, pupil_radius + 1), pupil_radius)
+
+        self.last_positions = None  # Rounded pupil positions drawn last frame
+        self.frames_drawn = 0       # Frames that updated the screen
+        self.frames_skipped = 0     # Frames skipped because nothing moved
+        self.update_time = None     # time.monotonic() right after the last pygame.display.update()
+        self.latency = None         # Optional latency.LatencyLog
+
+    def invalidate(self):
+        """Force a full redraw on the next call to draw() (e.g. after the window was exposed)"""
+        self.last_positions = None
+
+    def _pupil_rect(self, position):
+        """Screen rectangle covered by the pupil sprite at the given centre"""
+        offset = self.pupil_radius + 1
+        return self.pupil.get_rect(topleft=(position[0] - offset, position[1] - offset))
+
+    def draw(self, pupil_positions):
+        """
+        Draw the pupils and update the changed parts of the display.
+
+        Args:
+            pupil_positions: Sequence of (x, y) pupil centres, one per eye
+        Returns:
+            True if the screen was updated, False if the frame was skipped
+        """
+        positions = tuple((int(round(x)), int(round(y))) for x, y in pupil_positions)
+        if positions == self.last_positions:
+            self.frames_skipped += 1
+            if self.latency is not None:
+                self.latency.unchanged()
+            return False
+
+        if self.last_positions is None:
+            # First frame (or invalidated) - draw everything
+            self.screen.blit(self.background, (0, 0))
+            for position in positions:
+                self.screen.blit(self.pupil, self._pupil_rect(position))
+            pygame.display.update()
+        else:
+            dirty_rects = []
+            for old_position, new_position in zip(self.last_positions, positions):
+                if old_position == new_position:
+                    continue
+                old_rect = self._pupil_rect(old_position)
+                new_rect = self._pupil_rect(new_position)
+
+                # Restore the static layer under the old pupil, then draw the new one
+                self.screen.blit(self.background, old_rect, old_rect)
+                self.screen.blit(self.pupil, new_rect)
+                dirty_rects.append(old_rect.union(new_rect))
+            pygame.display.update(dirty_rects)
+        self.update_time = time.monotonic()
+        if self.latency is not None:
+            self.latency.displayed(self.update_time)
+
+        self.last_positions = positions
+        self.frames_drawn += 1
+        return True
@@ -0,0 +1,141 @@
+"""
+Headless replay harness: runs a tracker entry point against a recorded video
+file or a directory of images instead of the live camera, and reports
+throughput, per-frame latency and the pupil trajectory.
+
+Usage:
+    python replay.py haarcascade_face_tracker recordings/session1.mp4
+    python replay.py experiment_2 recordings/frames/ --realtime --output run.json
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+
+# Run pygame without a window or sound card; must be set before pygame.init()
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import numpy as np
+
+from capture import FrameGrabber
+
+# Entry points that can be replayed
+ENTRY_POINTS = [
+    'face_tracker',
+    'gaze__not_face_tracker',
+    'gaze_imitation',
+    'haarcascade_face_tracker',
+    'experiment_1',
+    'experiment_2',
+]
+
+
+class ReplayRecorder:
+    """
+    Collects per-frame results while an entry point runs: the latency from
+    capture to the end of drawing, and both pupil positions.
+    """
+    def __init__(self):
+        self.start_time = None
+        self.end_time = None
+        self.seqs = []        # Frame sequence numbers
+        self.latencies = []   # Seconds from capture to drawn
+        self.trajectory = []  # (left_x, left_y, right_x, right_y) per frame
+
+    def record(self, captured, left_pupil_pos, right_pupil_pos):
+        """Record one processed frame (call after drawing)"""
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = captured.timestamp
+        self.end_time = now
+        self.seqs.append(captured.seq)
+        self.latencies.append(now - captured.timestamp)
+        self.trajectory.append((left_pupil_pos[0], left_pupil_pos[1], right_pupil_pos[0], right_pupil_pos[1]))
+
+    def summary(self):
+        """Return a dictionary with throughput and latency statistics"""
+        frames = len(self.latencies)
+        elapsed = (self.end_time - self.start_time) if frames else 0.0
+        latencies_ms = np.array(self.latencies) * 1000.0
+        summary = {
+            'frames': frames,
+            'elapsed_s': elapsed,
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+        }
+        if frames:
+            summary.update({
+                'latency_mean_ms': float(latencies_ms.mean()),
+                'latency_p50_ms': float(np.percentile(latencies_ms, 50)),
+                'latency_p95_ms': float(np.percentile(latencies_ms, 95)),
+                'latency_max_ms': float(latencies_ms.max()),
+            })
+        return summary
+
+    def save(self, path, **metadata):
+        """Write the summary, per-frame latencies and the pupil trajectory to a JSON file"""
+        result = dict(metadata)
+        result['summary'] = self.summary()
+        result['frames'] = [
+            {'seq': seq, 'latency_ms': latency * 1000.0, 'pupils': list(pupils)}
+            for seq, latency, pupils in zip(self.seqs, self.latencies, self.trajectory)
+        ]
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=1)
+
+
+def run_replay(entry, source, realtime=False, condition=2, latency=None):
+    """
+    Run an entry point against a recording.
+
+    Args:
+        entry: Module name from ENTRY_POINTS
+        source: Path to a video file or a directory of images, or capture.SYNTHETIC_SOURCE
+        realtime: Release frames at the recording's frame rate (dropping frames the
+                  tracker cannot keep up with) instead of processing every frame as fast as possible
+        condition: Condition to run the experiment_* entry points in
+        latency: Optional latency.LatencyLog for the capture-to-photon latency
+    Returns:
+        The ReplayRecorder with the collected results
+    """
+    module = importlib.import_module(entry)  # Imported lazily so only the chosen tracker's dependencies load
+    cap = FrameGrabber(source, lossless=not realtime)
+    if realtime:
+        import cv2
+        cap.pace_fps = cap.cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    recorder = ReplayRecorder()
+    if entry.startswith('experiment_'):
+        # Render and detect as often as frames arrive unless replaying in real time
+        rate = 60 if realtime else 10000
+        system = module.EyeSystem(render_fps=rate, detect_fps=rate, cap=cap, latency_log=latency)
+        system.switch_condition(condition, time.monotonic())
+        system.run(recorder=recorder)
+    else:
+        module.main(cap=cap, show_preview=False, recorder=recorder, latency=latency)
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recording through a tracker without camera or window")
+    parser.add_argument('entry', choices=ENTRY_POINTS, help="Tracker entry point to run")
+    parser.add_argument('source', help="Video file, directory of images, or 'synthetic' for a synthetic moving face")
+    parser.add_argument('--realtime', action='store_true', help="Replay at the recorded frame rate")
+    parser.add_argument('--condition', type=int, default=2, help="Condition for experiment_* entry points")
+    parser.add_argument('--output', help="Write results (summary, latencies, trajectory) to this JSON file")
+    args = parser.parse_args()
+
+    recorder = run_replay(args.entry, args.source, realtime=args.realtime, condition=args.condition)
+    summary = recorder.summary()
+    print(f"{args.entry}: {summary['frames']} frames in {summary['elapsed_s']:.2f} s ({summary['fps']:.1f} fps)")
+    if summary['frames']:
+        print(f"Latency: mean {summary['latency_mean_ms']:.1f} ms, p50 {summary['latency_p50_ms']:.1f} ms, "
+              f"p95 {summary['latency_p95_ms']:.1f} ms, max {summary['latency_max_ms']:.1f} ms")
+    if args.output:
+        recorder.save(args.output, entry=args.entry, source=args.source, realtime=args.realtime)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Per-condition metrics over many session event logs (see event_log.py).
+
+Each log is memory-mapped and reduced with NumPy operations over whole
+columns; Python only loops over sessions and conditions, never frames.
+
+Metrics per session and condition:
+    face_fraction        Fraction of rendered frames with a face
+    reacquire_mean_s     Mean time from losing the face to finding it again
+    reacquire_p95_s      95th percentile of the same
+    path_length_px       Distance travelled by the pupils (mean of both eyes)
+    path_px_per_s        The same per second of the condition
+    sound_latency_ms     Mean time from a question key press to its sound onset
+
+Usage:
+    python session_analytics.py logs/*.log [--csv metrics.csv]
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+
+from event_log import EVENT_FRAME, EVENT_KEY, EVENT_SOUND, read_log
+
+METRICS = ['frames', 'duration_s', 'face_fraction', 'reacquire_count', 'reacquire_mean_s', 'reacquire_p95_s',
+           'path_length_px', 'path_px_per_s', 'sound_count', 'sound_latency_ms']
+
+
+def reacquire_times(times, has_face):
+    """
+    Return (loss times, durations) of every stretch without a face that ended
+    with the face being found again.
+    """
+    change = np.diff(has_face.astype(np.int8))
+    lost = np.flatnonzero(change == -1) + 1   # First frame without a face
+    found = np.flatnonzero(change == 1) + 1   # First frame with the face back
+    if len(lost) == 0 or len(found) == 0:
+        return np.zeros(0), np.zeros(0)
+    # Pair each loss with the next reacquisition; losses that never recover are dropped
+    next_found = np.searchsorted(found, lost)
+    recovered = next_found < len(found)
+    lost = lost[recovered]
+    return times[lost], times[found[next_found[recovered]]] - times[lost]
+
+
+def sound_latencies(records):
+    """Return (conditions, latencies) from each sound onset back to the key press before it"""
+    keys = records[records['kind'] == EVENT_KEY]
+    sounds = records[records['kind'] == EVENT_SOUND]
+    if len(keys) == 0 or len(sounds) == 0:
+        return np.zeros(0), np.zeros(0)
+    previous = np.searchsorted(keys['time'], sounds['time'], side='right') - 1
+    valid = previous >= 0
+    return sounds['condition'][valid], sounds['time'][valid] - keys['time'][previous[valid]]
+
+
+def session_metrics(records):
+    """
+    Compute the metrics of one session.
+
+    Args:
+        records: Structured array of event_log.EVENT_DTYPE records
+    Returns:
+        Dictionary condition -> dictionary of METRICS
+    """
+    frames = records[records['kind'] == EVENT_FRAME]
+    if len(frames) < 2:
+        return {}
+    times = frames['time']
+    conditions = frames['condition']
+    has_face = ~np.isnan(frames['face_x'])
+
+    # Frame durations and pupil steps are attributed to the condition of the later frame
+    dt = np.diff(times)
+    step = (np.hypot(np.diff(frames['left_x']), np.diff(frames['left_y'])) +
+            np.hypot(np.diff(frames['right_x']), np.diff(frames['right_y']))) / 2
+    step_condition = conditions[1:]
+
+    loss_times, reacquire = reacquire_times(times, has_face)
+    loss_condition = conditions[np.searchsorted(times, loss_times)] if len(loss_times) else np.zeros(0)
+
+    onset_condition, latency = sound_latencies(records)
+
+    result = {}
+    for condition in np.unique(conditions):
+        in_condition = conditions == condition
+        duration = float(dt[step_condition == condition].sum())
+        path = float(step[step_condition == condition].sum())
+        condition_reacquire = reacquire[loss_condition == condition]
+        condition_latency = latency[onset_condition == condition]
+        result[int(condition)] = {
+            'frames': int(in_condition.sum()),
+            'duration_s': duration,
+            'face_fraction': float(has_face[in_condition].mean()),
+            'reacquire_count': len(condition_reacquire),
+            'reacquire_mean_s': float(condition_reacquire.mean()) if len(condition_reacquire) else np.nan,
+            'reacquire_p95_s': float(np.percentile(condition_reacquire, 95)) if len(condition_reacquire) else np.nan,
+            'path_length_px': path,
+            'path_px_per_s': path / duration if duration > 0 else np.nan,
+            'sound_count': len(condition_latency),
+            'sound_latency_ms': float(condition_latency.mean() * 1000) if len(condition_latency) else np.nan,
+        }
+    return result
+
+
+def expand_paths(paths):
+    """Expand directories (all *.log files in them) and glob patterns into a sorted list of files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, '*.log')))
+        else:
+            files.extend(glob.glob(path) or [path])
+    return sorted(set(files))
+
+
+def analyze(paths):
+    """
+    Compute the metrics of every session.
+
+    Returns:
+        List of rows (dictionaries with 'session', 'condition' and METRICS)
+    """
+    rows = []
+    for path in expand_paths(paths):
+        for condition, metrics in session_metrics(read_log(path)).items():
+            rows.append(dict(session=os.path.basename(path), condition=condition, **metrics))
+    return rows
+
+
+def _nanmean(values):
+    """Mean of the non-NaN values, NaN if there are none"""
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if len(values) else np.nan
+
+
+def summarize(rows):
+    """
+    Combine the per-session rows into one row per condition: frame-weighted
+    face fraction, reacquire-count-weighted reacquire time, and the mean over
+    sessions of the remaining metrics (ignoring sessions without data).
+    """
+    summary = []
+    if not rows:
+        return summary
+    conditions = np.array([row['condition'] for row in rows])
+    table = {metric: np.array([row[metric] for row in rows], dtype=float) for metric in METRICS}
+    for condition in np.unique(conditions):
+        selected = conditions == condition
+        frames = table['frames'][selected]
+        counts = table['reacquire_count'][selected]
+        reacquire = np.nansum(table['reacquire_mean_s'][selected] * counts) / counts.sum() if counts.sum() else np.nan
+        summary.append({
+            'condition': int(condition),
+            'sessions': int(selected.sum()),
+            'frames': int(frames.sum()),
+            'face_fraction': float((table['face_fraction'][selected] * frames).sum() / frames.sum()),
+            'reacquire_count': int(counts.sum()),
+            'reacquire_mean_s': float(reacquire),
+            'path_px_per_s': _nanmean(table['path_px_per_s'][selected]),
+            'sound_count': int(table['sound_count'][selected].sum()),
+            'sound_latency_ms': _nanmean(table['sound_latency_ms'][selected]),
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-condition metrics over session event logs")
+    parser.add_argument('logs', nargs='+', help="Log files, directories or glob patterns")
+    parser.add_argument('--csv', help="Write the per-session metrics to this CSV file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = analyze(args.logs)
+    elapsed = time.perf_counter() - start
+    sessions = len({row['session'] for row in rows})
+    print(f"Analyzed {sessions} sessions in {elapsed:.2f} s")
+
+    print(f"{'condition':>9}{'sessions':>10}{'frames':>10}{'face %':>8}{'reacq n':>9}{'reacq s':>9}"
+          f"{'path px/s':>11}{'sounds':>8}{'latency ms':>12}")
+    for row in summarize(rows):
+        print(f"{row['condition']:>9}{row['sessions']:>10}{row['frames']:>10}{100 * row['face_fraction']:>8.1f}"
+              f"{row['reacquire_count']:>9}{row['reacquire_mean_s']:>9.2f}{row['path_px_per_s']:>11.1f}"
+              f"{row['sound_count']:>8}{row['sound_latency_ms']:>12.1f}")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['session', 'condition'] + METRICS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Per-session metrics written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
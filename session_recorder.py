@@ -0,0 +1,118 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+# What submit() does when the queue is full
+DROP_POLICIES = ('oldest', 'newest', 'block')
+
+
+class SessionRecorder:
+    """
+    Records the camera feed of a session on a background thread.
+
+    The render loop only hands frames to submit(), which puts them on a
+    bounded queue and returns immediately; encoding (cv2.VideoWriter) and the
+    CSV sidecar with each frame's sequence number, capture timestamp and
+    experiment condition are written by the recorder thread.
+
+    When the encoder falls behind and the queue is full, `drop_policy`
+    decides what happens:
+        'oldest': drop the oldest queued frame (the recording stays current)
+        'newest': drop the frame being submitted (the recording stays contiguous up to the drop)
+        'block':  wait up to `block_timeout` seconds for room, then drop the new frame
+    Frames must not be modified after they were submitted.
+    """
+    def __init__(self, path, fps=30.0, queue_size=60, drop_policy='oldest', block_timeout=0.05, fourcc='MJPG'):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', choose one of: {', '.join(DROP_POLICIES)}")
+        self.path = path
+        self.sidecar_path = os.path.splitext(path)[0] + '.csv'
+        self.fps = fps
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._writer = None
+
+        # Statistics
+        self.frames_submitted = 0  # Frames passed to submit()
+        self.frames_written = 0    # Frames encoded to the video file
+        self.frames_dropped = 0    # Frames dropped under back-pressure
+        self.write_time = 0.0      # Seconds spent encoding
+
+    def start(self):
+        """Start the recorder thread. Returns self for chaining."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._record_loop, name='SessionRecorder', daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, captured, condition=None):
+        """
+        Queue a capture.CapturedFrame for recording; never blocks unless the
+        drop policy is 'block'. Returns False if a frame was dropped.
+        """
+        self.frames_submitted += 1
+        item = (captured, condition)
+        try:
+            if self.drop_policy == 'block':
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+
+        self.frames_dropped += 1
+        if self.drop_policy == 'oldest':
+            # Make room by discarding the oldest frame; only this thread adds frames, so the put succeeds
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+        return False
+
+    def _record_loop(self):
+        """Encode queued frames and write one sidecar row per written frame"""
+        with open(self.sidecar_path, 'w', newline='') as sidecar_file:
+            sidecar = csv.writer(sidecar_file)
+            sidecar.writerow(['frame', 'seq', 'capture_timestamp', 'condition'])
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                captured, condition = item
+
+                start = time.perf_counter()
+                if self._writer is None:
+                    height, width = captured.frame.shape[:2]
+                    self._writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, (width, height))
+                self._writer.write(captured.frame)
+                self.write_time += time.perf_counter() - start
+
+                sidecar.writerow([self.frames_written, captured.seq, f"{captured.timestamp:.6f}",
+                                  '' if condition is None else condition])
+                self.frames_written += 1
+        if self._writer is not None:
+            self._writer.release()
+
+    def close(self):
+        """Write out the remaining queued frames and close the files"""
+        if self._thread is None:
+            return
+        self._queue.put(None)  # Blocking put, so the end marker is never dropped
+        self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        """Return a one-line summary of the recording"""
+        per_frame = 1000.0 * self.write_time / self.frames_written if self.frames_written else 0.0
+        return (f"Session recording {self.path}: {self.frames_written} of {self.frames_submitted} frames written, "
+                f"{self.frames_dropped} dropped ({self.drop_policy} policy), {per_frame:.1f} ms/frame to encode")
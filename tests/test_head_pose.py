@@ -0,0 +1,70 @@
+"""
+Equivalence checks for the head pose / gaze math of gaze_imitation.py
+against the former implementation, on synthetic landmarks (bench_gaze.py).
+"""
+import cv2
+import numpy as np
+
+from bench_gaze import FRAME_SHAPE, batched_gaze, project, reference_gaze, reference_gaze_math, \
+    reference_solve, synthetic_gaze_track, synthetic_pose_track
+from head_pose import HeadPoseSolver, MODEL_POINTS, fit_affine, gaze_directions
+
+FRAMES = 300
+
+
+def discrete_direction(gaze, threshold=0.1):
+    """The (x, y) direction gaze_imitation.EyeDisplay.interpret_gaze turns a gaze into"""
+    average = np.array([-(gaze[0][0] + gaze[1][0]) / 2, (gaze[0][1] + gaze[1][1]) / 2])
+    return tuple(np.where(np.abs(average) > threshold, np.sign(average), 0))
+
+
+def affine_residual(transformation, image_points):
+    """RMS distance (mm) between the model points and the mapped image points"""
+    homogeneous = np.column_stack([image_points, np.zeros(len(image_points)), np.ones(len(image_points))])
+    return np.sqrt(((homogeneous @ transformation.T - MODEL_POINTS) ** 2).sum(axis=1).mean())
+
+
+def test_warm_started_pose_is_as_good_as_a_cold_solve():
+    # A cold iterative solve occasionally settles in a slightly different local minimum than the
+    # warm-started one, so the poses are compared by how well they explain the observed landmarks
+    solver = HeadPoseSolver()
+    for rotation_vector, translation_vector in synthetic_pose_track(FRAMES):
+        points = np.trunc(project(MODEL_POINTS, rotation_vector, translation_vector))
+        reference = reference_solve(points)
+        solved = solver.solve(points, FRAME_SHAPE)
+        reference_error = np.abs(project(MODEL_POINTS, *reference) - points).max()
+        solver_error = np.abs(project(MODEL_POINTS, *solved) - points).max()
+        assert solver_error <= reference_error + 0.5
+    assert solver.warm_solves > 0 and solver.reused > 0
+
+
+def test_batched_kernel_matches_per_eye_math():
+    # Same pose and affine map; the old int casts move a projected point by up to about a pixel
+    camera_matrix, dist_coeffs = HeadPoseSolver().camera(FRAME_SHAPE)
+    for image_points, pupils in synthetic_gaze_track(FRAMES):
+        rotation_vector, translation_vector = reference_solve(image_points)
+        image_points1 = np.column_stack([image_points, np.zeros(len(image_points))])
+        _, ransac, _ = cv2.estimateAffine3D(image_points1, MODEL_POINTS)
+        pose = (rotation_vector, translation_vector, camera_matrix, dist_coeffs, FRAME_SHAPE[1])
+        reference = reference_gaze_math(ransac, pupils, *pose)
+        batched = gaze_directions(ransac, np.trunc(pupils), *pose)
+        np.testing.assert_allclose(batched, reference, atol=0.005)
+
+
+def test_least_squares_affine_fit_explains_the_landmarks_at_least_as_well_as_ransac():
+    for image_points, _ in synthetic_gaze_track(FRAMES, face_deviation=2.0):
+        image_points1 = np.column_stack([image_points, np.zeros(len(image_points))])
+        _, ransac, _ = cv2.estimateAffine3D(image_points1, MODEL_POINTS)
+        least_squares = fit_affine(image_points)
+        assert least_squares is not None
+        assert affine_residual(least_squares, image_points) <= affine_residual(ransac, image_points) + 1e-9
+
+
+def test_gaze_matches_the_former_get_gaze_direction_end_to_end():
+    # Well below the 0.1 threshold of gaze_imitation's discrete directions
+    solver = HeadPoseSolver()
+    for image_points, pupils in synthetic_gaze_track(FRAMES, face_deviation=2.0):
+        reference = reference_gaze(image_points, pupils)
+        gaze = batched_gaze(solver, image_points, pupils)
+        np.testing.assert_allclose(gaze, reference, atol=0.02)
+        assert discrete_direction(gaze) == discrete_direction(reference)
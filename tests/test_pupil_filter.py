@@ -0,0 +1,51 @@
+"""
+Behaviour of the time-based pupil filter, on the synthetic target track of
+bench_filters.py.
+"""
+from bench_filters import lerp_filter, metrics, pupil_filter, simulate, synthetic_track
+from pupil_filter import OneEuroFilter, PupilFilter
+
+LATENCY = 0.06
+
+
+def test_lead_cuts_the_lag_of_the_old_lerp():
+    times, targets, truth = synthetic_track()
+    for rate in (30.0, 60.0, 144.0):
+        lerp_lag, _, _ = metrics(*simulate(times, targets, rate, LATENCY, lerp_filter), truth)
+        lead_lag, _, _ = metrics(*simulate(times, targets, rate, LATENCY, pupil_filter(LATENCY)), truth)
+        assert lead_lag < lerp_lag
+
+
+def test_result_does_not_depend_on_the_loop_rate():
+    times, targets, truth = synthetic_track()
+    lags = [metrics(*simulate(times, targets, rate, LATENCY, pupil_filter(max_lead=0.0)), truth)[0]
+            for rate in (60.0, 144.0)]
+    assert abs(lags[0] - lags[1]) <= 20.0
+
+
+def test_extrapolation_aims_at_the_measured_latency():
+    pupil = PupilFilter(max_lead=0.1)
+    for i in range(10):
+        pupil.update((10.0 * i, 0.0), timestamp=i / 30.0, now=i / 30.0)
+    value = pupil.one_euro.value[0]
+    at_capture = pupil.update((90.0, 0.0), timestamp=9 / 30.0, now=9 / 30.0)[0]
+    ahead = pupil.update((90.0, 0.0), timestamp=9 / 30.0, now=9 / 30.0, latency=0.06)[0]
+    assert at_capture == value
+    assert ahead > value
+
+
+def test_reset_seeds_the_position_and_stops_extrapolating():
+    pupil = PupilFilter()
+    pupil.update((0.0, 0.0), timestamp=0.0, now=0.0)
+    pupil.update((50.0, 0.0), timestamp=0.1, now=0.1)
+    pupil.reset((20.0, 5.0), now=1.0)
+    assert not pupil.extrapolate
+    assert pupil.update((20.0, 5.0), now=1.0) == [20.0, 5.0]
+
+
+def test_gaps_are_clamped():
+    # A jump after a long gap is still smoothed instead of taken over at once
+    one_euro = OneEuroFilter(max_dt=0.1)
+    one_euro.filter((0.0, 0.0), 0.0)
+    x, _ = one_euro.filter((100.0, 0.0), 10.0)
+    assert 0.0 < x < 100.0
@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+from tracking import CASCADES, load_cascade
+
+
+@pytest.mark.parametrize('name', sorted(CASCADES))
+def test_shipped_cascades_load_from_any_working_directory(name, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert not load_cascade(name).empty()
+
+
+def test_missing_cascade_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_cascade(os.path.join(tmp_path, 'missing.xml'))
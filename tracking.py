@@ -0,0 +1,402 @@
+import os
+
+import cv2
+import numpy as np
+from profiling import PROFILER
+
+# Frontal face cascades that can be selected by name, shipped next to this file.
+# The LBP cascade comes from OpenCV's data/lbpcascades (opencv-python does not
+# include it). Compare them on your own recordings with bench_cascades.py: on
+# the synthetic face (x86 desktop) LBP took 45 ms/frame against 21 ms for Haar
+# and found the face in only 23% of the frames.
+CASCADE_DIR = os.path.dirname(os.path.abspath(__file__))
+CASCADES = {
+    'haar': os.path.join(CASCADE_DIR, 'haarcascade_frontalface_default.xml'),
+    'lbp': os.path.join(CASCADE_DIR, 'lbpcascade_frontalface_improved.xml'),
+}
+
+
+def load_cascade(cascade='haar'):
+    """
+    Load a face cascade.
+
+    Args:
+        cascade: A name from CASCADES or a path to a cascade XML file
+    Returns:
+        The loaded cv2.CascadeClassifier
+    Raises:
+        FileNotFoundError: If the file is missing or is not a valid cascade
+    """
+    path = CASCADES.get(cascade, cascade)
+    classifier = cv2.CascadeClassifier(path) if os.path.isfile(path) else None
+    if classifier is None or classifier.empty():
+        raise FileNotFoundError(f"Could not load the '{cascade}' face cascade from {path}")
+    return classifier
+
+
+class RoiFaceDetector:
+    """
+    Wraps a cv2.CascadeClassifier with a cheap tracking mode.
+
+    Once a face has been found, the next frames are searched only in an
+    expanded window around the previous face box, and only for face sizes
+    close to the previous one. The full frame is scanned again only after
+    `max_misses` consecutive misses in the window.
+    """
+    def __init__(self, cascade, scale_factor=1.3, min_neighbors=5,
+                 roi_margin=0.5, size_tolerance=0.3, max_misses=5):
+        self.cascade = cascade
+        self.scale_factor = scale_factor      # detectMultiScale scale step
+        self.min_neighbors = min_neighbors    # detectMultiScale min neighbors
+        self.roi_margin = roi_margin          # Window expansion, as a fraction of the face size per side
+        self.size_tolerance = size_tolerance  # Allowed relative change of face size between frames
+        self.max_misses = max_misses          # Consecutive window misses before a full-frame scan
+
+        self.last_face = None  # Last detected face box (x, y, w, h) in frame coordinates
+        self.misses = 0        # Consecutive misses in tracking mode
+
+        # Statistics
+        self.roi_scans = 0   # Number of window scans
+        self.roi_hits = 0    # Window scans that found a face
+        self.full_scans = 0  # Number of full-frame scans
+        self.full_hits = 0   # Full-frame scans that found a face
+
+    def reset(self):
+        """Forget the last face so the next call scans the full frame"""
+        self.last_face = None
+        self.misses = 0
+
+    def detect(self, gray, hint=None):
+        """
+        Detect faces in a grayscale frame.
+
+        Args:
+            gray: Grayscale image
+            hint: Optional (x, y, w, h) box where the face is expected to be
+                  (e.g. propagated by optical flow); replaces the last detected box
+        Returns:
+            List of (x, y, w, h) face boxes in frame coordinates (empty if none found)
+        """
+        if hint is not None:
+            self.last_face = tuple(int(v) for v in hint)
+            self.misses = 0
+
+        if self.last_face is not None and self.misses < self.max_misses:
+            faces = self._detect_in_window(gray)
+            self.roi_scans += 1
+            if faces:
+                self.roi_hits += 1
+                self.misses = 0
+                self.last_face = faces[0]
+            else:
+                self.misses += 1
+            return faces
+
+        # No recent face - scan the whole frame
+        start = PROFILER.start()
+        faces = [tuple(face) for face in self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors)]
+        PROFILER.stop('detectMultiScale', start)
+        self.full_scans += 1
+        if faces:
+            self.full_hits += 1
+            self.misses = 0
+            self.last_face = faces[0]
+        else:
+            self.last_face = None
+        return faces
+
+    def _detect_in_window(self, gray):
+        """Search only the expanded window around the last face, for similar face sizes"""
+        x, y, w, h = self.last_face
+        frame_height, frame_width = gray.shape[:2]
+
+        # Expand the last face box by the margin on every side, clipped to the frame
+        margin_x = int(w * self.roi_margin)
+        margin_y = int(h * self.roi_margin)
+        x0 = max(0, x - margin_x)
+        y0 = max(0, y - margin_y)
+        x1 = min(frame_width, x + w + margin_x)
+        y1 = min(frame_height, y + h + margin_y)
+
+        # Limit the searched face sizes to those close to the last one
+        size = max(w, h)
+        min_size = max(1, int(size * (1 - self.size_tolerance)))
+        max_size = int(size * (1 + self.size_tolerance))
+        if x1 - x0 < min_size or y1 - y0 < min_size:
+            return []
+
+        start = PROFILER.start()
+        faces = self.cascade.detectMultiScale(gray[y0:y1, x0:x1], self.scale_factor, self.min_neighbors,
+                                              minSize=(min_size, min_size), maxSize=(max_size, max_size))
+        PROFILER.stop('detectMultiScale', start)
+
+        # Convert back to frame coordinates
+        return [(fx + x0, fy + y0, fw, fh) for (fx, fy, fw, fh) in faces]
+
+    def stats(self):
+        """Return a one-line summary of how often each kind of scan ran"""
+        total = self.roi_scans + self.full_scans
+        roi_share = 100.0 * self.roi_scans / total if total else 0.0
+        return (f"Face detection: {self.roi_scans} window scans ({self.roi_hits} hits), "
+                f"{self.full_scans} full-frame scans ({self.full_hits} hits), "
+                f"{roi_share:.1f}% of scans used the window")
+
+
+class FlowTracker:
+    """
+    Propagates a box from frame to frame with pyramidal Lucas-Kanade optical flow
+    on a handful of feature points inside it.
+
+    track() returns None when the points can no longer be trusted (too few
+    survivors, large forward-backward error or the box leaving the frame),
+    which tells the caller to run the detector again.
+    """
+    def __init__(self, max_points=20, min_points=5, max_fb_error=1.0):
+        self.max_points = max_points      # Feature points sampled inside the box
+        self.min_points = min_points      # Fewer surviving points than this counts as lost
+        self.max_fb_error = max_fb_error  # Max forward-backward error in pixels for a point to be kept
+        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+        self.box = None          # Current (x, y, w, h) box, float coordinates
+        self.points = None       # Current feature points, shape (N, 1, 2)
+        self.prev_gray = None    # Previous grayscale frame
+        self.last_motion = 0.0   # Median point displacement in the last track() call, in pixels
+
+    def start(self, gray, box):
+        """
+        (Re)initialise tracking from a detected box.
+        Returns True if enough feature points were found inside the box.
+        """
+        x, y, w, h = [int(v) for v in box]
+        mask = np.zeros(gray.shape[:2], dtype=np.uint8)
+        mask[max(0, y):y + h, max(0, x):x + w] = 255
+        points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, max(3, min(w, h) // 10), mask=mask)
+
+        self.prev_gray = gray
+        self.box = (float(x), float(y), float(w), float(h))
+        self.last_motion = 0.0
+        if points is None or len(points) < self.min_points:
+            self.points = None
+            return False
+        self.points = points
+        return True
+
+    def track(self, gray):
+        """
+        Move the box to the new frame.
+        Returns the new (x, y, w, h) box, or None if tracking was lost.
+        """
+        if self.points is None:
+            return None
+
+        # Forward and backward flow; points whose round trip does not come back are unreliable
+        start = PROFILER.start()
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **self.lk_params)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, new_points, None, **self.lk_params)
+        PROFILER.stop('opticalFlow', start)
+        fb_error = np.linalg.norm((self.points - back_points).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.max_fb_error)
+
+        if np.count_nonzero(good) < self.min_points:
+            self.points = None
+            return None
+
+        # Shift the box by the median displacement of the good points
+        displacement = (new_points - self.points).reshape(-1, 2)[good]
+        dx, dy = np.median(displacement, axis=0)
+        self.last_motion = float(np.hypot(dx, dy))
+
+        x, y, w, h = self.box
+        x, y = x + float(dx), y + float(dy)
+        frame_height, frame_width = gray.shape[:2]
+        if x < -w / 2 or y < -h / 2 or x + w / 2 > frame_width or y + h / 2 > frame_height:
+            # Face centre left the frame
+            self.points = None
+            return None
+
+        self.box = (x, y, w, h)
+        self.points = new_points[good].reshape(-1, 1, 2)
+        self.prev_gray = gray
+        return self.box
+
+
+class DetectionScheduler:
+    """
+    Runs the full detector only every N frames and propagates the face box with
+    optical flow in between.
+
+    N adapts to the amount of motion: it grows while the scene is quiet and
+    drops back quickly when the face moves fast or the tracked box drifts away
+    from what the detector finds.
+    """
+    def __init__(self, min_interval=1, max_interval=10, still_motion=0.5, fast_motion=4.0, max_drift=0.25):
+        self.min_interval = min_interval  # Smallest detection interval (frames)
+        self.max_interval = max_interval  # Largest detection interval (frames)
+        self.still_motion = still_motion  # Below this motion (px/frame) the interval grows
+        self.fast_motion = fast_motion    # Above this motion (px/frame) the interval halves
+        self.max_drift = max_drift        # Max tracked-vs-detected offset, as a fraction of the face width
+
+        self.flow = FlowTracker()
+        self.interval = min_interval      # Current detection interval
+        self.frames_since_detect = 0
+        self.box = None                   # Current face box, None if no face
+
+        # Statistics
+        self.detections = 0        # Frames on which the detector ran
+        self.tracked_frames = 0    # Frames handled by optical flow only
+        self.forced_redetects = 0  # Detections forced by lost tracking
+
+    def reset(self):
+        """Forget the face box and tracked points so the next update runs the detector"""
+        self.box = None
+        self.flow.points = None
+        self.interval = self.min_interval
+        self.frames_since_detect = 0
+
+    def update(self, gray, detect):
+        """
+        Update the face box for a new frame.
+
+        Args:
+            gray: Grayscale frame
+            detect: Callable taking a hint box (or None) and returning a detected
+                    (x, y, w, h) box or None
+        Returns:
+            Current (x, y, w, h) face box, or None if no face
+        """
+        self.frames_since_detect += 1
+        if self.box is not None and self.frames_since_detect < self.interval:
+            tracked = self.flow.track(gray)
+            if tracked is not None:
+                self.tracked_frames += 1
+                self.box = tracked
+                self._adapt_interval(self.flow.last_motion)
+                return self.box
+            # Lost the points - fall through to a detection
+            self.forced_redetects += 1
+            self.interval = self.min_interval
+
+        return self._detect(gray, detect)
+
+    def _detect(self, gray, detect):
+        """Run the detector and restart optical flow from its result"""
+        predicted = self.box
+        if predicted is not None and self.flow.points is not None:
+            # Use flow to move the box to this frame first, so the drift check compares like with like
+            predicted = self.flow.track(gray) or predicted
+        box = detect(predicted)
+
+        self.detections += 1
+        self.frames_since_detect = 0
+
+        if box is None:
+            self.box = None
+            self.flow.points = None
+            self.interval = self.min_interval
+            return None
+
+        if predicted is not None:
+            # Drift check - if flow wandered away from the detection, detect more often
+            px, py, pw, ph = predicted
+            x, y, w, h = box
+            drift = np.hypot((px + pw / 2) - (x + w / 2), (py + ph / 2) - (y + h / 2)) / max(w, 1)
+            if drift > self.max_drift:
+                self.interval = self.min_interval
+            else:
+                # Flow agreed with the detector, so it can be trusted for longer
+                self.interval = min(self.max_interval, self.interval + 1)
+
+        self.box = tuple(float(v) for v in box)
+        self.flow.start(gray, box)
+        return self.box
+
+    def _adapt_interval(self, motion):
+        """Grow the detection interval in quiet scenes and shrink it under fast motion"""
+        if motion > self.fast_motion:
+            self.interval = max(self.min_interval, self.interval // 2)
+        elif motion < self.still_motion:
+            self.interval = min(self.max_interval, self.interval + 1)
+
+    def stats(self):
+        """Return a one-line summary of how often the detector ran"""
+        total = self.detections + self.tracked_frames
+        detect_share = 100.0 * self.detections / total if total else 0.0
+        return (f"Scheduler: detector ran on {self.detections} of {total} frames ({detect_share:.1f}%), "
+                f"{self.forced_redetects} forced re-detections, current interval {self.interval}")
+
+
+class MotionGate:
+    """
+    Cheap scene-change test in front of the detector.
+
+    Each frame is shrunk (INTER_AREA) to a small grayscale thumbnail and
+    compared with the thumbnail of the last frame that was let through. If
+    fewer than `min_changed` of the thumbnail pixels changed by more than
+    `pixel_threshold` grey levels, the frame is skipped and the caller reuses
+    its previous detection. At most `max_skips` frames in a row are skipped,
+    so the result is refreshed regularly even in a completely still scene.
+    All thumbnails and the difference image are preallocated.
+    """
+    def __init__(self, size=(64, 48), pixel_threshold=12, min_changed=0.002, max_skips=30):
+        self.size = size                        # Thumbnail (width, height)
+        self.pixel_threshold = pixel_threshold  # Grey-level change that counts a pixel as changed
+        self.min_changed = min_changed          # Fraction of changed pixels that counts as motion
+        self.max_skips = max_skips              # Cap on consecutive skipped frames
+
+        width, height = size
+        self._color = np.empty((height, width, 3), dtype=np.uint8)   # Thumbnail of BGR frames
+        self._thumb = np.empty((height, width), dtype=np.uint8)      # Thumbnail of the current frame
+        self._reference = np.empty((height, width), dtype=np.uint8)  # Thumbnail of the last frame let through
+        self._diff = np.empty((height, width), dtype=np.uint8)       # Thresholded difference
+        self._min_pixels = max(1, int(min_changed * width * height))
+        self._has_reference = False
+        self.consecutive_skips = 0
+
+        # Statistics
+        self.frames = 0   # Frames checked
+        self.skipped = 0  # Frames skipped as unchanged
+
+    def reset(self):
+        """Let the next frame through (e.g. after the detector state was reset)"""
+        self._has_reference = False
+        self.consecutive_skips = 0
+
+    def changed(self, image):
+        """
+        Return True if the detector should run on this frame (grayscale or BGR),
+        False if the scene is unchanged and the previous result can be reused.
+        """
+        self.frames += 1
+        start = PROFILER.start()
+        if image.ndim == 3:
+            cv2.resize(image, self.size, dst=self._color, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._color, cv2.COLOR_BGR2GRAY, dst=self._thumb)
+        else:
+            cv2.resize(image, self.size, dst=self._thumb, interpolation=cv2.INTER_AREA)
+
+        if self._has_reference and self.consecutive_skips < self.max_skips:
+            cv2.absdiff(self._thumb, self._reference, dst=self._diff)
+            cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self._diff)
+            if cv2.countNonZero(self._diff) < self._min_pixels:
+                self.consecutive_skips += 1
+                self.skipped += 1
+                PROFILER.stop('motionGate', start)
+                return False
+
+        # Let the frame through and make it the new reference (swap instead of copying)
+        self._thumb, self._reference = self._reference, self._thumb
+        self._has_reference = True
+        self.consecutive_skips = 0
+        PROFILER.stop('motionGate', start)
+        return True
+
+    @property
+    def skip_ratio(self):
+        """Fraction of checked frames that were skipped"""
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self):
+        """Return a one-line summary of how many frames were skipped"""
+        return (f"Motion gate: skipped {self.skipped} of {self.frames} frames "
+                f"({100.0 * self.skip_ratio:.1f}%), max {self.max_skips} in a row")